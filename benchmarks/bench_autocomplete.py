@@ -0,0 +1,88 @@
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_search import make_catalog, make_queries
+from search_engine.autocomplete import AutocompleteIndex
+from search_engine.catalog_update import upsert_frame
+
+
+# prefixes of the benchmark queries as typed key by key, with a letter swap or drop in some of them
+def make_prefixes(queries: list[str], typo_rate: float, seed: int) -> list[str]:
+
+    rng = random.Random(seed)
+    res = []
+    for query in queries:
+        for end in range(1, len(query) + 1):
+            prefix = list(query[:end])
+            if len(prefix) > 4 and rng.random() < typo_rate:
+                i = rng.randrange(len(prefix) - 1)
+                if rng.random() < 0.5:
+                    prefix[i], prefix[i + 1] = prefix[i + 1], prefix[i]
+                else:
+                    del prefix[i]
+            res.append("".join(prefix))
+
+    return res
+
+
+def percentiles(seconds: list[float]) -> dict:
+
+    ms = np.array(seconds) * 1000
+    return {"p50_ms": float(np.percentile(ms, 50)), "p99_ms": float(np.percentile(ms, 99)), "max_ms": float(ms.max())}
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Autocomplete build, suggestion latency and incremental update time")
+    parser.add_argument("--size", type=int, default=100000, help="catalog size")
+    parser.add_argument("--queries", type=int, default=200, help="queries typed key by key")
+    parser.add_argument("--typo-rate", type=float, default=0.2, help="share of prefixes with a typo")
+    parser.add_argument("--update-rows", type=int, default=1000, help="rows changed by the incremental update")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_autocomplete.json")
+    args = parser.parse_args()
+
+    df = make_catalog(args.size, args.seed)
+    start = time.perf_counter()
+    index = AutocompleteIndex().build(df)
+    results = {"size": args.size, "terms": len(index.snapshot), "build_s": time.perf_counter() - start}
+
+    prefixes = make_prefixes(make_queries(args.queries, args.seed), args.typo_rate, args.seed)
+    for prefix in prefixes[:100]:
+        index.suggest(prefix)
+
+    seconds = []
+    for prefix in prefixes:
+        start = time.perf_counter()
+        index.suggest(prefix)
+        seconds.append(time.perf_counter() - start)
+    results["suggest"] = {"prefixes": len(prefixes), **percentiles(seconds)}
+
+    rows = df.sample(min(args.update_rows, len(df)), random_state=args.seed).copy()
+    rows["sales"] += 1
+    start = time.perf_counter()
+    index.upsert_rows(df, rows)
+    results["upsert_s"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    AutocompleteIndex().build(upsert_frame(df, rows))
+    results["rebuild_s"] = time.perf_counter() - start
+
+    suggest = results["suggest"]
+    print(
+        f"{results['terms']} terms  build {results['build_s'] * 1000:.1f}ms  suggest p50 {suggest['p50_ms']:.3f}ms"
+        f"  p99 {suggest['p99_ms']:.3f}ms  upsert {args.update_rows} rows {results['upsert_s'] * 1000:.1f}ms"
+        f"  full rebuild {results['rebuild_s'] * 1000:.1f}ms"
+    )
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
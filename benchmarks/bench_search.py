@@ -0,0 +1,280 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from search_engine.catalog_loader import CatalogLoader, memory_report
+from search_engine.search_engine import SmallSearchEngine
+import sales_data_app as app
+
+warnings.filterwarnings('ignore')
+
+BRANDS = [
+    "samsung", "lg", "sony", "whirlpool", "morphy richards", "philips", "bosch", "hp", "dell", "apple",
+    "voltas", "croma", "motorola", "hitachi", "panasonic", "godrej", "haier", "lenovo", "asus", "acer",
+]
+PRODUCT_LINES = [
+    "TV LCD", "Washing Machine", "Air Conditioner", "Mobile Phone & Smart Phone", "Earphone/Headphone",
+    "Cooling Appliance", "Heating Appliance", "Desktop", "Laptop", "Gaming Hardware & Software",
+    "Computer Bag", "Refrigerator", "Microwave Oven", "Kitchen Appliances", "Tablets",
+]
+SKU_WORDS = [
+    "black", "white", "silver", "blue", "128gb", "64gb", "256gb", "inverter", "split", "window", "front", "top",
+    "load", "smart", "4k", "ultra", "hd", "pro", "max", "mini", "wireless", "bluetooth", "1.5", "ton", "3", "5",
+    "star", "double", "door", "frost", "free", "convertible", "fully", "automatic", "led", "oled", "qled",
+]
+SCORING_METHODS = ["max_win_score", "average_score", "combine_score"]
+
+
+# synthetic catalog with the sales_data schema used by both SmallSearchEngine and ProductMatcher
+def make_catalog(n_rows: int, seed: int = 0) -> pd.DataFrame:
+
+    rng = np.random.default_rng(seed)
+    brands = rng.choice(len(BRANDS), n_rows)
+    lines = rng.choice(len(PRODUCT_LINES), n_rows)
+    words = np.array(SKU_WORDS)
+    skus = [
+        " ".join([BRANDS[b].title(), *rng.choice(words, rng.integers(2, 7), replace=False), PRODUCT_LINES[p].split(" ")[0]])
+        for b, p in zip(brands, lines)
+    ]
+
+    return pd.DataFrame(
+        {
+            "brand": [BRANDS[b].title() for b in brands],
+            "brand_lower": [BRANDS[b] for b in brands],
+            "product_line": [PRODUCT_LINES[p] for p in lines],
+            "product_line_clean": [PRODUCT_LINES[p].lower() for p in lines],
+            "sku": skus,
+            "sales": rng.integers(0, 500, n_rows),
+            "price": np.round(rng.uniform(5, 3000, n_rows), 2),
+        }
+    )
+
+
+# brand / product line / sku word combinations with some misspellings
+def make_queries(n_queries: int, seed: int = 0) -> list[str]:
+
+    rnd = random.Random(seed)
+    queries = []
+
+    for _ in range(n_queries):
+        parts = []
+        if rnd.random() < 0.8:
+            parts.append(rnd.choice(BRANDS))
+        if rnd.random() < 0.8:
+            parts.append(rnd.choice(PRODUCT_LINES).lower().split(" ")[0])
+        parts.extend(rnd.sample(SKU_WORDS, rnd.randint(0, 2)))
+        if not parts:
+            parts.append(rnd.choice(SKU_WORDS))
+
+        query = " ".join(parts)
+        if rnd.random() < 0.2:
+            i = rnd.randrange(len(query))
+            query = query[:i] + query[i + 1:]
+
+        queries.append(query)
+
+    return queries
+
+
+def summarize(latencies: list[float], peak_bytes: int | None) -> dict:
+
+    arr = np.array(latencies) * 1000
+    total = arr.sum() / 1000
+
+    return {
+        "runs": len(arr),
+        "p50_ms": float(np.percentile(arr, 50)),
+        "p95_ms": float(np.percentile(arr, 95)),
+        "p99_ms": float(np.percentile(arr, 99)),
+        "mean_ms": float(arr.mean()),
+        "throughput_qps": float(len(arr) / total) if total > 0 else None,
+        "peak_memory_bytes": peak_bytes,
+    }
+
+
+# times fn over every query, then replays up to memory_queries of them under tracemalloc for peak memory
+def measure(fn, queries: list[str], memory_queries: int) -> dict:
+
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        fn(query)
+        latencies.append(time.perf_counter() - start)
+
+    peak = None
+    if memory_queries > 0:
+        tracemalloc.start()
+        for query in queries[:memory_queries]:
+            fn(query)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return summarize(latencies, peak)
+
+
+def bench_engine(df: pd.DataFrame, queries: list[str], memory_queries: int) -> dict:
+
+    res = {}
+    start = time.perf_counter()
+    se = SmallSearchEngine()
+    se.load_token_cache(df, "sku")
+    se.build_index(df, "brand_lower", lemmatize=False)
+    se.build_index(df, "product_line_clean", abb=app.abbrevations)
+    res["setup_s"] = time.perf_counter() - start
+    app.se = se
+
+    brand_rows = {}
+
+    def exact(query):
+        brand_rows[query] = se.exact_match_rows(df, "brand_lower", query, method="max_win_score")
+
+    product_rows = {}
+
+    def partial(query):
+        product_rows[query] = se.partial_match_rows(
+            df, "product_line_clean", query, method="combine_score", rows=brand_rows[query], abb=app.abbrevations
+        )
+
+    def inverse(query):
+        se.inverse_partial_match_rows(df, "sku", query, rows=product_rows[query])
+
+    res["exact_match"] = measure(exact, queries, memory_queries)
+    res["partial_match"] = measure(partial, queries, memory_queries)
+    res["inverse_partial_match"] = measure(inverse, queries, memory_queries)
+
+    for method in SCORING_METHODS:
+        res[method] = measure(
+            lambda query: se.calculate_score(
+                df, "product_line_clean", se.text_to_list(query, abb=app.abbrevations), method, abb=app.abbrevations
+            ),
+            queries,
+            memory_queries,
+        )
+
+    # the result cache is cleared before every query so the full pipeline is measured
+    def end_to_end(query):
+        app.result_cache.clear()
+        app.retrieve_result(df, query)
+
+    res["retrieve_result"] = measure(end_to_end, queries, memory_queries)
+    return res
+
+
+def bench_matcher(df: pd.DataFrame, queries: list[str], memory_queries: int) -> dict:
+
+    try:
+        from other_variant.ProductMatcher import ProductMatcher
+    except ImportError as e:
+        return {"skipped": str(e)}
+
+    start = time.perf_counter()
+    pm = ProductMatcher(df)
+    res = {"setup_s": time.perf_counter() - start}
+    res["state_space_search"] = measure(lambda query: pm.state_space_search(query, 9), queries, memory_queries)
+
+    return res
+
+
+# load time, tracemalloc peak and resulting frame size of pd.read_parquet against the streaming CatalogLoader
+def bench_loader(df: pd.DataFrame) -> dict:
+
+    res = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "catalog.parquet")
+        df.to_parquet(path)
+
+        for name, load in [("read_parquet", pd.read_parquet), ("catalog_loader", CatalogLoader().read_parquet)]:
+            tracemalloc.start()
+            start = time.perf_counter()
+            loaded = load(path)
+            seconds = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+            res[name] = {"load_s": seconds, "peak_memory_bytes": peak, "frame_bytes": memory_report(loaded)["total"]}
+            del loaded
+
+    return res
+
+
+# ratio of current / baseline p50 and p95 for every stage present in both runs
+def compare(results: dict, baseline: dict) -> list[str]:
+
+    lines = []
+    for size, engines in results["runs"].items():
+        for engine, stages in engines.items():
+            for stage, stats in stages.items():
+                base = baseline.get("runs", {}).get(size, {}).get(engine, {}).get(stage)
+                if not isinstance(stats, dict) or not isinstance(base, dict) or "p50_ms" not in base:
+                    continue
+                lines.append(
+                    f"{size:>9} {engine:<8} {stage:<24} p50 x{stats['p50_ms'] / base['p50_ms']:.2f}"
+                    f"  p95 x{stats['p95_ms'] / base['p95_ms']:.2f}"
+                )
+
+    return lines
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Benchmark SmallSearchEngine and ProductMatcher on synthetic catalogs")
+    parser.add_argument("--sizes", default="1000,100000,1000000", help="comma separated catalog sizes")
+    parser.add_argument("--queries", type=int, default=50, help="number of queries replayed per catalog")
+    parser.add_argument("--memory-queries", type=int, default=5, help="queries replayed under tracemalloc")
+    parser.add_argument("--skip-matcher", action="store_true", help="do not benchmark ProductMatcher")
+    parser.add_argument("--skip-loader", action="store_true", help="do not compare the catalog loaders")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--baseline", help="previous results json to compare against")
+    args = parser.parse_args()
+
+    queries = make_queries(args.queries, args.seed)
+    results = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "queries": args.queries,
+        "seed": args.seed,
+        "runs": {},
+    }
+
+    for size in [int(val) for val in args.sizes.split(",")]:
+        df = make_catalog(size, args.seed)
+        results["runs"][str(size)] = {"engine": bench_engine(df, queries, args.memory_queries)}
+        if not args.skip_matcher:
+            results["runs"][str(size)]["matcher"] = bench_matcher(df, queries, args.memory_queries)
+        if not args.skip_loader:
+            results["runs"][str(size)]["loader"] = bench_loader(df)
+            for name, stats in results["runs"][str(size)]["loader"].items():
+                print(
+                    f"{size:>9} loader   {name:<24} {stats['load_s'] * 1000:9.2f}ms  peak {stats['peak_memory_bytes']:>12}B"
+                    f"  frame {stats['frame_bytes']:>12}B"
+                )
+
+        for engine, stages in results["runs"][str(size)].items():
+            for stage, stats in stages.items():
+                if isinstance(stats, dict) and "p50_ms" in stats:
+                    print(
+                        f"{size:>9} {engine:<8} {stage:<24} p50 {stats['p50_ms']:9.2f}ms  p95 {stats['p95_ms']:9.2f}ms"
+                        f"  p99 {stats['p99_ms']:9.2f}ms  {stats['throughput_qps']:8.1f} q/s"
+                    )
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print("\n".join(compare(results, baseline)))
@@ -0,0 +1,83 @@
+import argparse
+import json
+import os
+import sys
+import time
+import warnings
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_search import make_catalog, make_queries
+from search_engine.search_engine import SmallSearchEngine
+from search_engine.sharding import ShardedSearchEngine
+import sales_data_app as app
+
+warnings.filterwarnings('ignore')
+
+
+def latencies(search, queries: list[str]) -> tuple[list, dict]:
+
+    results, seconds = [], []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(search(query))
+        seconds.append(time.perf_counter() - start)
+
+    ms = np.array(seconds) * 1000
+    return results, {"p50_ms": float(np.percentile(ms, 50)), "p99_ms": float(np.percentile(ms, 99)), "total_s": float(ms.sum() / 1000)}
+
+
+# single process pipeline (the retrieve_result stages) against the sharded one, results must be equal
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Sharded scatter-gather search against the single process search")
+    parser.add_argument("--size", type=int, default=20000, help="catalog size")
+    parser.add_argument("--shards", default="2,4", help="comma separated shard counts")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--start-method", choices=["fork", "spawn", "forkserver"], help="multiprocessing start method")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_sharding.json")
+    args = parser.parse_args()
+
+    df = make_catalog(args.size, args.seed)
+    queries = make_queries(args.queries, args.seed)
+
+    se = SmallSearchEngine()
+    se.build_index(df, "brand_lower", lemmatize=False)
+    se.build_index(df, "product_line_clean", abb=app.abbrevations)
+    se.load_token_cache(df, "sku")
+
+    def single(query: str):
+
+        rows = se.exact_match_rows(df, "brand_lower", query)
+        rows = se.partial_match_rows(df, "product_line_clean", query, abb=app.abbrevations, rows=rows)
+        return df.iloc[se.inverse_partial_match_rows(df, "sku", query, rows=rows)]
+
+    expected, stats = latencies(single, queries)
+    results = {"size": args.size, "queries": len(queries), "single": stats}
+    print(f"single    p50 {stats['p50_ms']:8.2f}ms  p99 {stats['p99_ms']:8.2f}ms  total {stats['total_s']:.2f}s")
+
+    mismatches = 0
+    for shards in [int(n) for n in args.shards.split(",")]:
+        start = time.perf_counter()
+        with ShardedSearchEngine(df, shards, start_method=args.start_method, abb=app.abbrevations) as engine:
+            startup = time.perf_counter() - start
+            got, stats = latencies(engine.search, queries)
+
+        stats["startup_s"] = startup
+        stats["mismatches"] = sum(not exp.equals(res) for exp, res in zip(expected, got))
+        mismatches += stats["mismatches"]
+        results[f"shards_{shards}"] = stats
+        print(
+            f"{shards:>2} shards p50 {stats['p50_ms']:8.2f}ms  p99 {stats['p99_ms']:8.2f}ms  total {stats['total_s']:.2f}s"
+            f"  startup {startup:.2f}s  mismatches {stats['mismatches']}"
+        )
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if mismatches:
+        sys.exit(f"{mismatches} sharded results differ from the single process results")
@@ -0,0 +1,86 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_search import make_catalog, make_queries
+from search_engine.search_engine import SmallSearchEngine
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# runs in a fresh interpreter, so import time and the WordNet load are measured cold
+CHILD = """
+import json, sys, time, warnings
+warnings.filterwarnings('ignore')
+start = time.perf_counter()
+import sales_data_app as app
+imported = time.perf_counter()
+df = app.load_catalog(sys.argv[1], sys.argv[2] or None, sys.argv[3] == "1")
+loaded = time.perf_counter()
+app.retrieve_result(df, sys.argv[4])
+queried = time.perf_counter()
+print(json.dumps({
+    "import_s": imported - start,
+    "load_s": loaded - imported,
+    "first_query_s": queried - loaded,
+    "total_s": queried - start,
+    "wordnet_loaded": app.se.lemma.loaded,
+}))
+"""
+
+
+def run_child(catalog: str, lemma_table: str | None, download: bool, query: str) -> dict:
+
+    out = subprocess.run(
+        [sys.executable, "-c", CHILD, catalog, lemma_table or "", "1" if download else "0", query],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def medians(runs: list[dict]) -> dict:
+
+    res = {key: statistics.median(run[key] for run in runs) for key in runs[0] if key.endswith("_s")}
+    res["wordnet_loaded"] = any(run["wordnet_loaded"] for run in runs)
+    return res
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Cold start (import, catalog load, first query) with and without a lemma table")
+    parser.add_argument("--size", type=int, default=10000, help="catalog size")
+    parser.add_argument("--runs", type=int, default=5, help="fresh processes per configuration")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--offline", action="store_true", help="never download WordNet in the children")
+    parser.add_argument("--output", default="bench_startup.json")
+    args = parser.parse_args()
+
+    query = make_queries(1, args.seed)[0]
+    with tempfile.TemporaryDirectory() as tmp:
+        catalog = os.path.join(tmp, "catalog.parquet")
+        lemma_table = os.path.join(tmp, "lemmas.json")
+
+        df = make_catalog(args.size, args.seed)
+        df.to_parquet(catalog)
+        SmallSearchEngine(download_wordnet=not args.offline).save_lemma_table(
+            lemma_table, df, ["sku", "brand_lower", "product_line_clean"], [query]
+        )
+
+        results = {"size": args.size, "runs": args.runs, "query": query}
+        for name, table in (("wordnet", None), ("lemma_table", lemma_table)):
+            results[name] = medians([run_child(catalog, table, not args.offline, query) for _ in range(args.runs)])
+            stats = results[name]
+            print(
+                f"{name:<12} import {stats['import_s'] * 1000:8.1f}ms  load {stats['load_s'] * 1000:8.1f}ms"
+                f"  first query {stats['first_query_s'] * 1000:8.1f}ms  total {stats['total_s'] * 1000:8.1f}ms"
+                f"  wordnet loaded {stats['wordnet_loaded']}"
+            )
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
@@ -0,0 +1,73 @@
+import argparse
+import json
+import os
+import sys
+import time
+import warnings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_search import make_catalog, make_queries
+from other_variant.ProductMatcher import ProductMatcher
+
+warnings.filterwarnings('ignore')
+
+
+# top-3 brand_matcher / cat_matcher outputs of both backends on the same catalog and aliases, top-1
+# names, top-3 name sets and the scores of the names at the same rank are compared and the matcher timed,
+# the rapidfuzz backend reproduces fuzzywuzzy so every output is expected to agree
+def compare(df, queries: list[str]) -> dict:
+
+    reference = ProductMatcher(df, backend="fuzzywuzzy")
+    matcher = ProductMatcher(df, cat_alias=reference.cat_alias, backend="rapidfuzz")
+    brands = list(df["brand"].unique()[:3])
+
+    outputs = {}
+    for name, pm in (("fuzzywuzzy", reference), ("rapidfuzz", matcher)):
+        start = time.perf_counter()
+        outputs[name] = [
+            (pm.brand_matcher(query), [pm.cat_matcher(query, {brand}) for brand in brands]) for query in queries
+        ]
+        outputs[name + "_s"] = time.perf_counter() - start
+
+    res = {"top1": 0, "top3": 0, "score_diffs": [], "total": 0}
+    for (ref_brands, ref_cats), (new_brands, new_cats) in zip(outputs["fuzzywuzzy"], outputs["rapidfuzz"]):
+        for ref, new in ((ref_brands, new_brands), *zip(ref_cats, new_cats)):
+            res["total"] += 1
+            res["top1"] += bool(ref) and bool(new) and ref[0][0] == new[0][0]
+            res["top3"] += {name for name, _ in ref} == {name for name, _ in new}
+            # a name can be listed twice (exact match and fuzzy score), scores are compared by rank
+            res["score_diffs"].extend(
+                abs(new_score - score) for (name, score), (new_name, new_score) in zip(ref, new) if name == new_name
+            )
+
+    return {
+        "pairs": res["total"],
+        "top1_agreement": res["top1"] / res["total"],
+        "top3_agreement": res["top3"] / res["total"],
+        "max_score_diff": max(res["score_diffs"], default=0.0),
+        "fuzzywuzzy_s": outputs["fuzzywuzzy_s"],
+        "rapidfuzz_s": outputs["rapidfuzz_s"],
+    }
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Compare ProductMatcher top-3 outputs of the rapidfuzz and fuzzywuzzy backends")
+    parser.add_argument("--size", type=int, default=10000, help="catalog size")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--min-top1", type=float, default=1.0, help="exit with an error below this top-1 agreement")
+    parser.add_argument("--min-top3", type=float, default=1.0, help="exit with an error below this top-3 agreement")
+    parser.add_argument("--max-score-diff", type=float, default=0.0, help="exit with an error above this score difference")
+    args = parser.parse_args()
+
+    res = compare(make_catalog(args.size, args.seed), make_queries(args.queries, args.seed))
+    print(json.dumps(res, indent=2))
+
+    if res["top1_agreement"] < args.min_top1:
+        sys.exit(f"top-1 agreement {res['top1_agreement']:.3f} below {args.min_top1}")
+    if res["top3_agreement"] < args.min_top3:
+        sys.exit(f"top-3 agreement {res['top3_agreement']:.3f} below {args.min_top3}")
+    if res["max_score_diff"] > args.max_score_diff:
+        sys.exit(f"score difference {res['max_score_diff']} above {args.max_score_diff}")
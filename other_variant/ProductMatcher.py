@@ -1,9 +1,18 @@
-from fuzzywuzzy import fuzz
-from nltk.stem import WordNetLemmatizer
+import itertools
 import re
+from bisect import bisect_left
+import threading
 import pandas as pd
 import numpy as np
 
+from search_engine.instrumentation import Instrumentation, NULL_INSTRUMENTATION
+from search_engine.ranking import top_k_rows
+from search_engine.batch_output import ParquetSink
+from search_engine.catalog_update import upsert_frame, keep_mask, position_map, remap_positions
+from search_engine.fuzzy_scoring import create_scorer, group_max
+from search_engine.autocomplete import AutocompleteIndex
+from search_engine.sharding import ShardPool, partition_by_brand
+
 unexp_cat_alias = {
     r'air conditioner':['ac'],
     r'washing machine':['wm'],
@@ -29,9 +38,183 @@ unexp_brand_alias={
     r'wb':['ps4']
 }
 
+BRAND_CLEAN = re.compile(r'\-|\'')
+BRAND_NOSPACE = re.compile(r'\-|\'| ')
+BRAND_QUERY_CLEAN = re.compile(r'\-|\'|e-')
+CAT_QUERY_CLEAN = re.compile(r'\-|/|\&')
+SPACES = re.compile(r' +')
+VOWEL = re.compile(r'[aeiou]')
+
+BOUNDARY = re.compile(r'\b')
+METACHARS = set('.^$*+?{}[]\\|()')
+
+
+# PatternSet finds which keys have one of their word bounded literals in a text with a single finditer
+# over the alternation of all literals, a matched text maps back to every key owning that literal.
+# finditer only reports non overlapping matches, so a key whose literal can start inside the match of
+# another key's literal (at a word boundary), or that is not a plain literal, keeps its own patterns
+class PatternSet:
+
+    def __init__(self,entries:list[tuple])->None:
+        # entries are (key, literals, compiled patterns of the key)
+        self.owners: dict[str,set] = {}
+        suffixes: dict[str,list[tuple]] = {}
+        for key,literals,_ in entries:
+            for literal in literals:
+                self.owners.setdefault(literal,set()).add(key)
+                for i in {0,*(m.start() for m in BOUNDARY.finditer(literal))} - {len(literal)}:
+                    suffixes.setdefault(literal[i:],[]).append((key,i == 0))
+
+        ordered = sorted(suffixes)
+        self.fallback = {
+            key: patterns for key,literals,patterns in entries
+            if any(not self.plain(literal) or self.overlaps(literal,key,suffixes,ordered) for literal in literals)
+        }
+        self.pattern = re.compile('|'.join(
+            r'\b'+re.escape(literal)+r'\b' for literal in self.owners
+            if not self.owners[literal] <= self.fallback.keys()
+        ) or '(?!)')
+
+    @staticmethod
+    def plain(literal:str)->bool:
+        return literal != '' and not METACHARS.intersection(literal)
+
+    # literal shares its start with the suffix of another key's literal, one is a prefix of the other
+    @staticmethod
+    def overlaps(literal:str,key,suffixes:dict,ordered:list[str])->bool:
+
+        def other(suffix:str)->bool:
+            return any(owner != key and not (whole and suffix == literal) for owner,whole in suffixes[suffix])
+
+        if any(other(literal[:end]) for end in range(1,len(literal)+1) if literal[:end] in suffixes):
+            return True
+
+        lo = bisect_left(ordered,literal)
+        for suffix in ordered[lo:bisect_left(ordered,literal+'\U0010ffff',lo)]:
+            if other(suffix):
+                return True
+        return False
+
+    # keys found in text, the own patterns of the fallback keys are only searched for the given keys
+    def search(self,text:str,keys=None)->set:
+
+        res = set()
+        for m in self.pattern.finditer(text):
+            res |= self.owners[m.group()]
+
+        for key,patterns in self.fallback.items():
+            if key not in res and (keys is None or key in keys):
+                if any(pattern is not None and pattern.search(text) for pattern in patterns):
+                    res.add(key)
+        return res
+
+
+def clean_skus(skus:pd.Series)->pd.Series:
+
+    return skus.apply(
+        lambda x: SPACES.sub(
+            ' ',
+            CAT_QUERY_CLEAN.sub('',x.lower())
+        ).strip()
+    )
+
+
+# aliases of the given product lines, also written into a SharedCatalog (see sales_data_app.export_catalog)
+def create_cat_alias(unexp_cat_alias:dict[str,list[str]],cats)->dict[str,list[str]]:
+    
+    # imported here, nltk is only needed when the aliases are created (not for a shared catalog)
+    from nltk.stem import WordNetLemmatizer
+
+    cat_alias = {}
+    wl = WordNetLemmatizer()
+
+    for cat in cats:
+        temp = [val.strip() for val in re.split(r'&|/',cat)]
+
+        if len(temp[0].split(' '))>1:
+            prefix = temp[0].split(' ')[0]
+            for i in range(1,len(temp)):
+                temp[i] = prefix+' '+temp[i]
+
+        elif len(temp[-1].split(' '))>1:
+            suffix = temp[-1].split(' ')[-1]
+            for i in range(len(temp)-1):
+                temp[i] += ' '+suffix
+
+        cat_alias[cat] = []
+        if cat in unexp_cat_alias:
+            cat_alias[cat].extend(unexp_cat_alias[cat])
+
+        for alias in  temp:
+
+            root_form = ' '.join(wl.lemmatize(word.lower()) for word in alias.split(' '))
+            if re.search(r'\(.*\)',root_form):
+                cat_alias[cat].append(root_form)
+                root_form = re.sub(r'\(.*\)','',root_form).strip()
+
+            for key,values in unexp_cat_alias.items():
+                if re.search(key,root_form):
+                    for value in values:
+                        cat_alias[cat].append(re.sub(key,value,root_form).strip())
+
+            cat_alias[cat].append(root_form)
+            
+    return cat_alias
+
+
+# MatcherSnapshot is everything ProductMatcher derives from one catalog version: compiled exact brand /
+# category / alias patterns, row positions of every brand and (brand, product_line) pair and the
+# normalized sku strings. It is not modified once created, updates build a new one and swap it in a
+# single assignment so a running query keeps reading the snapshot it started with.
+# brand_set and cat_set find the brands / product lines matching exactly in one pass (see PatternSet).
+# brand_choices are the no space brands each followed by
+# its aliases (brand i owns brand_choices[brand_offsets[i]:brand_offsets[i+1]]), scored in a single call
+class MatcherSnapshot:
+
+    def __init__(
+        self,df:pd.DataFrame,cat_alias:dict[str,list[str]],brand_patterns:list[tuple],
+        cat_patterns:dict[str,tuple],brand_rows:dict,partitions:dict,clean_sku:pd.Series
+    )->None:
+        self.df = df
+        self.cat_alias = cat_alias
+        self.brand_patterns = brand_patterns
+        self.cat_patterns = cat_patterns
+        self.brand_rows = brand_rows
+        self.partitions = partitions
+        self.clean_sku = clean_sku
+        self.brand_set = PatternSet(
+            [(brand,literals,(exact,alias)) for brand,exact,alias,_,_,literals in brand_patterns]
+        )
+        self.cat_set = PatternSet(
+            [(cat,literals,(exact,alias)) for cat,(exact,alias,literals) in cat_patterns.items()]
+        )
+        self.brand_choices = [
+            choice for _,_,_,search_brand,aliases,_ in brand_patterns for choice in (search_brand,*aliases)
+        ]
+        self.brand_offsets = np.cumsum([0]+[1+len(aliases) for _,_,_,_,aliases,_ in brand_patterns])
+
+    # positions (in catalog order) of the rows of the given brands, or of the given pairs
+    def partition_rows(self,brand_filter:set[str],cat_filter:set[str]|None=None)->np.ndarray:
+
+        if cat_filter is None:
+            parts = [self.brand_rows.get(brand) for brand in brand_filter]
+        else:
+            parts = [self.partitions.get((brand,cat)) for brand in brand_filter for cat in cat_filter]
+
+        parts = [part for part in parts if part is not None]
+        if not parts:
+            return np.array([],dtype=np.intp)
+        if len(parts) == 1:
+            return parts[0]
+        return np.sort(np.concatenate(parts))
+
+
 class ProductMatcher:
     
     def __init__(self,df: pd.DataFrame,*args,**kwargs)->None:
+        self.snapshot: MatcherSnapshot = None
+        self.autocomplete: AutocompleteIndex = None
+        self.update_lock = threading.Lock()
         self.df = df
         self.brand_alias: dict[str,list[str]] = None
         self.cat_alias: dict[str,list[str]] = None
@@ -46,68 +229,260 @@ class ProductMatcher:
         else:
             self.cat_alias = self.create_cat_alias(unexp_cat_alias)
 
-    def brand_matcher(self,query:str)->list[tuple[str,int]]:
-        
-        brands = self.df['brand'].unique()
+        self.instrumentation = kwargs.get('instrumentation',NULL_INSTRUMENTATION)
+        # fuzzy scoring backend, 'rapidfuzz' (default, fuzzywuzzy's scores computed with rapidfuzz) or
+        # 'fuzzywuzzy' (the reference, see benchmarks/compare_matcher_backends.py)
+        self.scorer = kwargs.get('scorer') or create_scorer(kwargs.get('backend','rapidfuzz'))
+        # clean_sku are the normalized skus of df when they are already known (see from_shared)
+        self.snapshot = self.build_snapshot(kwargs.get('clean_sku'))
+
+    # attaches to a SharedCatalog written by sales_data_app.export_catalog, the product line aliases and
+    # normalized skus are read from the mapping instead of being created again (cat_alias and clean_sku
+    # given in kwargs take precedence)
+    @classmethod
+    def from_shared(cls,catalog,**kwargs)->'ProductMatcher':
+
+        df = catalog.to_pandas()
+        if catalog.cat_alias is not None:
+            kwargs.setdefault('cat_alias',catalog.cat_alias)
+        if 'clean_sku' not in kwargs:
+            kwargs['clean_sku'] = catalog.clean_sku(df)
+
+        return cls(df,**kwargs)
+
+    # assigning df, brand_alias or cat_alias marks the snapshot stale, it is rebuilt on the next
+    # query (call refresh after mutating one of them in place)
+    @property
+    def df(self)->pd.DataFrame:
+        return self._df
+
+    @df.setter
+    def df(self,df:pd.DataFrame)->None:
+        self._df = df
+        self.snapshot = None
+
+    @property
+    def brand_alias(self)->dict[str,list[str]]:
+        return self._brand_alias
+
+    @brand_alias.setter
+    def brand_alias(self,brand_alias:dict[str,list[str]])->None:
+        self._brand_alias = brand_alias
+        self.snapshot = None
+
+    @property
+    def cat_alias(self)->dict[str,list[str]]:
+        return self._cat_alias
+
+    @cat_alias.setter
+    def cat_alias(self,cat_alias:dict[str,list[str]])->None:
+        self._cat_alias = cat_alias
+        self.snapshot = None
+
+    def current(self)->MatcherSnapshot:
+
+        snapshot = self.snapshot
+        if snapshot is None:
+            snapshot = self.snapshot = self.build_snapshot()
+        return snapshot
+
+    def refresh(self)->None:
+
+        self.snapshot = self.build_snapshot()
+
+    def compile_brand(self,brand:str)->tuple:
+
         brand_alias = self.brand_alias
-        res = set()
-        #matching exact brand name
-        search_query = re.sub(r'\-|\'|e-','',query.lower())
-        for brand in brands:
+        search_brand = BRAND_CLEAN.sub('',brand.lower())
+        alias = None
+        if search_brand in brand_alias:
+            alias = '|'.join(r'\b'+sim+r'\b' for sim in brand_alias[search_brand])
+
+        nospace_brand = BRAND_NOSPACE.sub('',brand.lower())
+        return (
+            brand,
+            re.compile(r'\b'+search_brand+r'\b'),
+            re.compile(alias) if alias is not None else None,
+            nospace_brand,
+            brand_alias.get(nospace_brand,[]),
+            [search_brand,*brand_alias.get(search_brand,[])]
+        )
 
-            search_brand = re.sub(r'\-|\'','',brand.lower())
+    def compile_cat(self,cat:str,cat_alias:dict[str,list[str]])->tuple:
 
-            if re.search(r'\b'+search_brand+r'\b',search_query):
+        alias = None
+        if cat in cat_alias:
+            alias = re.compile('|'.join(r'\b'+alias+r'\b' for alias in cat_alias[cat]))
+        return (re.compile(r'\b'+cat.lower()+r'\b'),alias,[cat.lower(),*cat_alias.get(cat,[])])
 
-                res.add((brand,1))
-                continue
+    def build_snapshot(self,clean_sku:pd.Series|None=None)->MatcherSnapshot:
 
-            if search_brand in brand_alias and\
-            re.search('|'.join(r'\b'+sim+r'\b' for sim in brand_alias[search_brand]),search_query):
-                
-                res.add((brand,1))
+        df = self.df
+        cat_alias = self.cat_alias
+
+        return MatcherSnapshot(
+            df,
+            cat_alias,
+            [self.compile_brand(brand) for brand in df['brand'].unique()],
+            {cat: self.compile_cat(cat,cat_alias) for cat in df['product_line'].unique()},
+            df.groupby('brand',sort=False,observed=True).indices,
+            df.groupby(['brand','product_line'],sort=False,observed=True).indices,
+            clean_skus(df['sku']) if clean_sku is None else clean_sku
+        )
+
+    # inserts rows (new index labels) or replaces the rows with the same labels without rebuilding the
+    # matcher: aliases and patterns are only created for new brands / product lines, partitions only
+    # regrouped for the affected brands and only the new skus normalized, then the snapshot is swapped
+    def upsert_rows(self,rows:pd.DataFrame)->None:
+
+        with self.update_lock:
+            snapshot = self.current()
+            df = upsert_frame(snapshot.df,rows)
+
+            old_brands = snapshot.df.loc[snapshot.df.index.intersection(rows.index),'brand']
+            affected = set(rows['brand']) | set(old_brands)
+
+            cat_alias = snapshot.cat_alias
+            new_cats = [
+                cat for cat in pd.unique(rows['product_line'])
+                if cat not in snapshot.cat_patterns and cat not in cat_alias
+            ]
+            if new_cats:
+                cat_alias = {**cat_alias,**self.create_cat_alias(unexp_cat_alias,new_cats)}
 
-        #matching without spaces
-        search_query = re.sub(r'\-|\'|e-','',query.lower())
+            positions = np.flatnonzero(df['brand'].isin(affected).to_numpy())
+            subset = df.iloc[positions]
+            brand_rows = {brand: part for brand,part in snapshot.brand_rows.items() if brand not in affected}
+            # observed only, a categorical brand would also give empty groups of the unaffected brands
+            brand_groups = subset.groupby('brand',sort=False,observed=True).indices
+            brand_rows.update((brand,positions[ids]) for brand,ids in brand_groups.items())
+            partitions = {key: part for key,part in snapshot.partitions.items() if key[0] not in affected}
+            pair_groups = subset.groupby(['brand','product_line'],sort=False,observed=True).indices
+            partitions.update((key,positions[ids]) for key,ids in pair_groups.items())
 
-        for brand in brands:
+            exists = rows.index.isin(snapshot.df.index)
+            clean_sku = snapshot.clean_sku.copy()
+            clean_sku.loc[rows.index[exists]] = clean_skus(rows.loc[exists,'sku']).to_numpy()
+            clean_sku = pd.concat([clean_sku,clean_skus(rows.loc[~exists,'sku'])])
 
-            search_brand= re.sub(r'\-|\'| ','',brand.lower())
-            score = fuzz.partial_ratio(search_brand,search_query)/100
+            if self.autocomplete is not None:
+                self.autocomplete.upsert_rows(snapshot.df,rows,{cat: cat_alias[cat] for cat in new_cats})
+            self.swap(df,cat_alias,snapshot,brand_rows,partitions,clean_sku)
+
+    # deletes the rows with the given index labels, positions of the remaining rows are remapped
+    def delete_rows(self,labels)->None:
+
+        with self.update_lock:
+            snapshot = self.current()
+            keep = keep_mask(snapshot.df,labels)
+            mapping = position_map(keep)
+            if self.autocomplete is not None:
+                self.autocomplete.delete_rows(snapshot.df,labels)
+
+            brand_rows = {brand: remap_positions(part,mapping) for brand,part in snapshot.brand_rows.items()}
+            partitions = {key: remap_positions(part,mapping) for key,part in snapshot.partitions.items()}
+
+            self.swap(
+                snapshot.df[keep],
+                snapshot.cat_alias,
+                snapshot,
+                {brand: part for brand,part in brand_rows.items() if len(part)},
+                {key: part for key,part in partitions.items() if len(part)},
+                snapshot.clean_sku[keep]
+            )
 
-            if search_brand in brand_alias:
-                for alias in brand_alias[search_brand]:
-                    score = max(score,fuzz.partial_ratio(alias,search_query)/100)
+    # compiled patterns of unchanged brands and product lines are reused
+    def swap(self,df,cat_alias,snapshot,brand_rows,partitions,clean_sku)->None:
 
+        brand_patterns = {entry[0]: entry for entry in snapshot.brand_patterns}
+        cat_patterns = snapshot.cat_patterns
+
+        new_snapshot = MatcherSnapshot(
+            df,
+            cat_alias,
+            [brand_patterns.get(brand) or self.compile_brand(brand) for brand in df['brand'].unique()],
+            {cat: cat_patterns.get(cat) or self.compile_cat(cat,cat_alias) for cat in df['product_line'].unique()},
+            brand_rows,
+            partitions,
+            clean_sku
+        )
+        self._df = df
+        self._cat_alias = cat_alias
+        self.snapshot = new_snapshot
+
+    # prefix autocomplete over the brands, product lines with their aliases and sku words, ranked by
+    # sales (see AutocompleteIndex), it is kept up to date by upsert_rows and delete_rows
+    def autocomplete_index(self,**kwargs)->AutocompleteIndex:
+
+        with self.update_lock:
+            snapshot = self.current()
+            self.autocomplete = AutocompleteIndex(**kwargs).build(snapshot.df,snapshot.cat_alias)
+
+        return self.autocomplete
+
+    # enables per stage timing, candidate sizes and fuzz call counts (see Instrumentation)
+    def instrument(self,instrumentation:Instrumentation=None)->Instrumentation:
+
+        self.instrumentation = instrumentation if instrumentation is not None else Instrumentation()
+        return self.instrumentation
+
+    # snapshot defaults to the current one, state_space_search passes its own so every stage of a
+    # query reads the same catalog version
+    def brand_matcher(self,query:str,snapshot:MatcherSnapshot=None)->list[tuple[str,int]]:
+
+        with self.instrumentation.stage('brand_matcher'):
+            return self._brand_matcher(query,snapshot or self.current())
+
+    def _brand_matcher(self,query:str,snapshot:MatcherSnapshot)->list[tuple[str,int]]:
+        
+        res = set()
+        #matching exact brand name
+        search_query = BRAND_QUERY_CLEAN.sub('',query.lower())
+        for brand in snapshot.brand_set.search(search_query):
+
+            res.add((brand,1))
+
+        #matching without spaces, best of the brand and its aliases
+        scores = group_max(
+            self.scorer.partial_ratio(search_query,snapshot.brand_choices),snapshot.brand_offsets
+        )/100
+
+        for (brand,*_),score in zip(snapshot.brand_patterns,scores.tolist()):
             res.add((brand,score))
-  
+
+        self.instrumentation.count('partial_ratio',len(snapshot.brand_choices))
         return sorted(res,reverse=True,key=lambda x: x[1])[:3]
     
-    def cat_matcher(self,query,brand_filter:set[str])->list[tuple[str,int]]:
+    def cat_matcher(self,query,brand_filter:set[str],snapshot:MatcherSnapshot=None)->list[tuple[str,int]]:
+
+        with self.instrumentation.stage('cat_matcher'):
+            return self._cat_matcher(query,brand_filter,snapshot or self.current())
+
+    def _cat_matcher(self,query,brand_filter:set[str],snapshot:MatcherSnapshot)->list[tuple[str,int]]:
+        df = snapshot.df
         if brand_filter:
-            brand_df = self.df.loc[self.df['brand'].apply(lambda x: x in brand_filter)]
+            rows = snapshot.partition_rows(brand_filter)
+            cats = pd.unique(df['product_line'].values[rows])
         else:
-            brand_df = self.df
+            rows = np.arange(len(df))
+            cats = df['product_line'].unique()
+        self.instrumentation.record_sizes('cat_matcher',len(df),len(rows))
 
-        cat_alias = self.cat_alias
-        cats = brand_df['product_line'].unique()
+        cat_alias = snapshot.cat_alias
         res = set()
-        search_query = re.sub(r'\-|/|\&','',query.lower())
-        search_query = re.sub(r' +',' ',search_query).strip()
+        search_query = CAT_QUERY_CLEAN.sub('',query.lower())
+        search_query = SPACES.sub(' ',search_query).strip()
+        exact_cats = snapshot.cat_set.search(search_query,set(cats))
         #exact match
         for cat in cats:
 
-            if re.search(r'\b'+cat.lower()+r'\b',search_query):
+            if cat in exact_cats:
                 res.add((cat,1))
                 continue
 
-            if re.search('|'.join(r'\b'+alias+r'\b' for alias in cat_alias[cat]),search_query):
-                res.add((cat,1))
-                continue
-            
             for token in search_query.split(' '):
                     
-                if not(re.search(r'[aeiou]',token) and len(token)>1):
+                if not(VOWEL.search(token) and len(token)>1):
                     continue
          
                 if cat.lower().startswith(token):
@@ -115,115 +490,210 @@ class ProductMatcher:
                     break
                 
 
-        # partial matching using partial ratio
-        for cat in cats:
-            score = 0
-            for alias in cat_alias[cat]:
-                score = max(score,fuzz.partial_ratio(alias,search_query)/100)
-            
+        # partial matching using partial ratio, best alias of every category
+        choices = [alias for cat in cats for alias in cat_alias[cat]]
+        offsets = np.cumsum([0]+[len(cat_alias[cat]) for cat in cats])
+        scores = group_max(self.scorer.partial_ratio(search_query,choices),offsets)/100
+
+        for cat,score in zip(cats,scores.tolist()):
             res.add((cat,score))
-      
+
+        self.instrumentation.count('partial_ratio',len(choices))
         return sorted(res,reverse=True,key=lambda x:x[1])[:3]
     
-    def create_cat_alias(self,unexp_cat_alias:dict[str,list[str]]):
-        
-        cat_alias = {}
-        wl = WordNetLemmatizer()
-
-
-        for cat in self.df['product_line'].unique():
-            temp = [val.strip() for val in re.split(r'&|/',cat)]
+    # aliases of the given product lines (all product lines of df by default)
+    def create_cat_alias(self,unexp_cat_alias:dict[str,list[str]],cats=None):
 
-            if len(temp[0].split(' '))>1:
-                prefix = temp[0].split(' ')[0]
-                for i in range(1,len(temp)):
-                    temp[i] = prefix+' '+temp[i]
-
-            elif len(temp[-1].split(' '))>1:
-                suffix = temp[-1].split(' ')[-1]
-                for i in range(len(temp)-1):
-                    temp[i] += ' '+suffix
-
-            cat_alias[cat] = []
-            if cat in unexp_cat_alias:
-                cat_alias[cat].extend(unexp_cat_alias[cat])
+        return create_cat_alias(unexp_cat_alias,self.df['product_line'].unique() if cats is None else cats)
+    
+    # slices is an optional cache of the pair slices shared by the queries of a batch (see search_many)
+    def sku_search(
+        self,query:str,brand_filter:set[str],cat_filter:set[str],wo_score:int,snapshot:MatcherSnapshot=None,
+        slices:dict|None=None
+    )->pd.Index:
 
-            for alias in  temp:
+        with self.instrumentation.stage('sku_search'):
+            return self._sku_search(query,brand_filter,cat_filter,wo_score,snapshot or self.current(),slices)
 
-                root_form = ' '.join(wl.lemmatize(word.lower()) for word in alias.split(' '))
-                if re.search(r'\(.*\)',root_form):
-                    cat_alias[cat].append(root_form)
-                    root_form = re.sub(r'\(.*\)','',root_form).strip()
+    # candidate rows of the pairs with their normalized skus
+    def pair_slice(self,brand_filter:set[str],cat_filter:set[str],snapshot:MatcherSnapshot)->pd.DataFrame:
 
-                for key,values in unexp_cat_alias.items():
-                    if re.search(key,root_form):
-                        for value in values:
-                            cat_alias[cat].append(re.sub(key,value,root_form).strip())
+        rows = snapshot.partition_rows(brand_filter,cat_filter)
+        search_space = snapshot.df.iloc[rows].copy()
+        search_space['sku'] = snapshot.clean_sku.iloc[rows].set_axis(search_space.index)
+        return search_space
 
-                cat_alias[cat].append(root_form)
-                
-        return cat_alias
-    
-    def sku_search(self,query:str,brand_filter:set[str],cat_filter:set[str],wo_score:int)->pd.Index:
+    def _sku_search(
+        self,query:str,brand_filter:set[str],cat_filter:set[str],wo_score:int,snapshot:MatcherSnapshot,
+        slices:dict|None=None
+    )->pd.Index:
         
-        search_space = self.df.loc[
-            self.df.apply(
-                lambda x: x['brand'] in brand_filter and x['product_line'] in cat_filter,
-                axis=1
-            )
-        ]
-    
-        search_space['sku'] = search_space['sku'].apply(
-            lambda x: re.sub(
-                r' +',' ',
-                re.sub(r'\-|/|\&','',x.lower())
-            ).strip()
-        )
+        if slices is None:
+            search_space = self.pair_slice(brand_filter,cat_filter,snapshot)
+        else:
+            key = (frozenset(brand_filter),frozenset(cat_filter))
+            if key not in slices:
+                slices[key] = self.pair_slice(brand_filter,cat_filter,snapshot)
+            search_space = slices[key].copy()
         
-        query = re.sub(
-            r' +',' ',
-            re.sub(r'\-|/|\&','',query.lower())
+        query = SPACES.sub(
+            ' ',
+            CAT_QUERY_CLEAN.sub('',query.lower())
         ).strip()
         
         
         n = len(query.split(' '))
         threshold = (n-1)/n
         
-        total = 0
-        
-        def score(str1,str2):
-            #tokens = str1.split(' ')
-            #total = 0
-            #for token in tokens:
-            #    total += fuzz.partial_ratio(token,str1)
-            
-            #return total/len(tokens)
-            return fuzz.partial_token_sort_ratio(str1,str2)
-            
-        search_space['score'] = search_space['sku'].apply(
-            lambda sku: score(query,sku)*wo_score
-        )
+        search_space['score'] = self.scorer.partial_token_sort_ratio(query,search_space['sku'].tolist())*wo_score
+        self.instrumentation.record_sizes('sku_search',len(snapshot.df),len(search_space))
+        self.instrumentation.count('partial_token_sort_ratio',len(search_space))
         return search_space
         
         
         
     
     def state_space_search(self,query:str,mini_fetch:int)->pd.DataFrame:
+
+        with self.instrumentation.stage('state_space_search'):
+            return self._state_space_search(query,mini_fetch,self.current())
+
+    def _state_space_search(
+        self,query:str,mini_fetch:int,snapshot:MatcherSnapshot,slices:dict|None=None,brands:list|None=None
+    )->pd.DataFrame:
         
-        brands = self.brand_matcher(query)
+        if brands is None:
+            brands = self.brand_matcher(query,snapshot)
         brand_cat_q = []
             
         for brand,brand_score in brands:
-            cats = self.cat_matcher(query,{brand,})
+            cats = self.cat_matcher(query,{brand,},snapshot)
             for cat,cat_score in cats:
                 brand_cat_q.append((brand_score*cat_score,brand,cat))
         
-        res =  pd.DataFrame()
+        frames = []
     
         while(brand_cat_q):
             score,brand,cat = brand_cat_q.pop()
-            res = pd.concat([res,self.sku_search(query,{brand,},{cat,},score)])
+            frames.append(self.sku_search(query,{brand,},{cat,},score,snapshot,slices))
+
+        res = pd.concat(frames) if frames else pd.DataFrame()
          
-        return res.sort_values('score',ascending=False).head(mini_fetch)
-            
-            
\ No newline at end of file
+        with self.instrumentation.stage('sort'):
+            return top_k_rows(res,'score',mini_fetch,ascending=False)
+
+    # state_space_search for many queries, yields (query, result) in input order, or with output writes
+    # the results (query and rank columns added) to a parquet file and returns the number of queries.
+    # Queries are processed in chunks of batch_size on one snapshot: identical queries (case aside)
+    # are searched once, the queries of a chunk are grouped by their best brand and the candidate
+    # slice of every (brand, product_line) pair is built once per chunk (at most one catalog copy)
+    def search_many(self,queries,mini_fetch:int=9,output:str|None=None,batch_size:int=10000):
+
+        results = self.iter_search_many(queries,mini_fetch,batch_size)
+        if output is None:
+            return results
+
+        count = 0
+        with ParquetSink(output) as sink:
+            for query,res in results:
+                frame = res.reset_index()
+                frame.insert(0,'query',query)
+                frame.insert(1,'rank',np.arange(len(frame)))
+                frame['score'] = frame['score'].astype(float)
+                sink.write(frame)
+                count += 1
+
+        return count
+
+    def iter_search_many(self,queries,mini_fetch:int,batch_size:int):
+
+        queries = iter(queries)
+
+        while True:
+            chunk = list(itertools.islice(queries,batch_size))
+            if not chunk:
+                break
+
+            with self.instrumentation.stage('search_many'):
+                snapshot = self.current()
+                texts = {}
+                for query in chunk:
+                    texts.setdefault(query.lower(),query)
+
+                groups = {}
+                for key,query in texts.items():
+                    brands = self.brand_matcher(query,snapshot)
+                    groups.setdefault(brands[0][0] if brands else None,[]).append((key,brands))
+
+                results = {}
+                slices = {}
+                for group in groups.values():
+                    for key,brands in group:
+                        results[key] = self._state_space_search(texts[key],mini_fetch,snapshot,slices,brands)
+                self.instrumentation.record_sizes('search_many',len(chunk),len(texts))
+
+            for query in chunk:
+                yield query,results[query.lower()]
+
+
+# MatcherShard is the ProductMatcher of the rows of some brands in a shard process
+class MatcherShard:
+
+    def __init__(self,df:pd.DataFrame,positions:np.ndarray,**kwargs)->None:
+        self.pm = ProductMatcher(df,**kwargs)
+
+    # candidate rows of the (brand, product_line) pairs of every entry (number, brand, brand score) in
+    # state_space_search order, every pair reduced to its mini_fetch best rows (ties keep their order)
+    def pair_frames(self,query:str,entries:list[tuple],mini_fetch:int)->dict[int,list[pd.DataFrame]]:
+
+        snapshot = self.pm.current()
+        res = {}
+        for i,brand,brand_score in entries:
+            cats = self.pm.cat_matcher(query,{brand,},snapshot)
+            res[i] = [
+                top_k_rows(self.pm.sku_search(query,{brand,},{cat,},brand_score*cat_score,snapshot),'score',mini_fetch,ascending=False)
+                for cat,cat_score in reversed(cats)
+            ]
+
+        return res
+
+
+# ShardedProductMatcher runs state_space_search on a catalog split by brand into shard processes (see
+# ShardPool). The brands of a query are matched here, on one row per brand, and every brand is sent to
+# its shard only. The shards return the best mini_fetch rows of every pair, the best rows of all pairs
+# are the same as the best rows of the single process search (pairs are merged in the same order)
+class ShardedProductMatcher:
+
+    def __init__(self,df:pd.DataFrame,shards:int,start_method:str|None=None,**kwargs)->None:
+        parts,self.owner = partition_by_brand(df,'brand',shards)
+        # brand_matcher only reads the brands and their aliases, product line aliases are not needed
+        self.matcher = ProductMatcher(df.drop_duplicates('brand'),**{**kwargs,'cat_alias':{}})
+        self.pool = ShardPool(MatcherShard,[(df.iloc[rows],rows) for rows in parts],start_method,**kwargs)
+
+    def __enter__(self)->'ShardedProductMatcher':
+        return self
+
+    def __exit__(self,*exc)->None:
+        self.close()
+
+    def close(self)->None:
+        self.pool.close()
+
+    def state_space_search(self,query:str,mini_fetch:int)->pd.DataFrame:
+
+        brands = self.matcher.brand_matcher(query)
+        requests = {}
+        for i,(brand,brand_score) in enumerate(brands):
+            requests.setdefault(self.owner[brand],[]).append((i,brand,brand_score))
+
+        frames = {}
+        for res in self.pool.scatter(
+            {shard: ('pair_frames',(query,entries,mini_fetch)) for shard,entries in requests.items()}
+        ).values():
+            frames.update(res)
+
+        # pairs are popped from the last brand and its last product line, as in state_space_search
+        frames = [frame for i in reversed(range(len(brands))) for frame in frames[i]]
+        res = pd.concat(frames) if frames else pd.DataFrame()
+
+        return top_k_rows(res,'score',mini_fetch,ascending=False)
@@ -1,26 +1,44 @@
-import pandas as pd
-from ProductMatcher import ProductMatcher
 import warnings
+import sys
+import os
+
+# ProductMatcher uses the search_engine package of the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ProductMatcher import ProductMatcher
+from search_engine.ranking import top_k_rows
+from search_engine.catalog_loader import CatalogLoader
+from search_engine.shared_catalog import SharedCatalog
 warnings.filterwarnings('ignore')
 
 def top_three_selling(df):
 
-    return df.sort_values(by="sales", ascending=False).iloc[:3]
+    return top_k_rows(df, "sales", 3, ascending=False)
 
 
 def top_three_low_price(df):
 
-    return df.sort_values(by="price").iloc[:3]
+    return top_k_rows(df, "price", 3)
 
 
 def top_three_high_price(df):
 
-    return df.sort_values(by="price", ascending=False).iloc[:3]
+    return top_k_rows(df, "price", 3, ascending=False)
+
+
+# a .arrow path is a shared catalog written by sales_data_app.export_catalog, every process attaches to
+# the same mapping and reads the aliases and normalized skus stored with it instead of building them
+def load_matcher(path:str)->ProductMatcher:
+
+    if path.endswith('.arrow'):
+        return ProductMatcher.from_shared(SharedCatalog.open(path))
+
+    # streamed with categorical brand / product_line, "\r" is removed from the strings while reading
+    return ProductMatcher(CatalogLoader().read_csv(path,index_col=0))
+
 
 if __name__ == '__main__':
-    df = pd.read_csv("sales_data.csv",index_col=0)
-    df['brand'] = df["brand"].str.replace('\r','')
-    se = ProductMatcher(df)
+    se = load_matcher(sys.argv[1] if len(sys.argv) > 1 else "sales_data.csv")
     
     while True:
 
@@ -0,0 +1,203 @@
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qs
+import multiprocessing
+import argparse
+import asyncio
+import json
+
+import pandas as pd
+
+import sales_data_app as app
+
+# catalog of the current process, loaded once in the parent and inherited (copy-on-write) by forked workers
+df: pd.DataFrame | None = None
+
+STATUS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 500: "Internal Server Error", 503: "Service Unavailable"}
+
+
+def load_catalog(path: str, lemma_table: str | None = None, download_wordnet: bool = True, warm_up: bool = True) -> None:
+    global df
+
+    df = app.load_catalog(path, lemma_table, download_wordnet, warm_up)
+
+
+# runs in a worker process (a thread of the coordinator with --shards), same sections as the sales_data_app REPL as json records
+def run_query(text: str) -> dict:
+
+    result = app.retrieve_sharded(text) if app.sharded is not None else app.retrieve_result(df, text)
+    sections = app.result_sections(result)
+
+    return {
+        "query": text,
+        "top_selling": sections["top_selling"][["sku", "sales"]].to_dict("records"),
+        "lowest_price": sections["lowest_price"][["sku", "price"]].to_dict("records"),
+        "highest_price": sections["highest_price"][["sku", "price"]].to_dict("records"),
+        "others": sections["others"]["sku"].tolist(),
+    }
+
+
+# plan of a query with estimated and actual stage costs (see QueryPlanner)
+def run_explain(text: str) -> dict:
+
+    return {"query": text, "plan": app.explain(df, text).split("\n")}
+
+
+class Overloaded(Exception):
+    pass
+
+
+# QueryService serves GET /api/query?query=... (and /api/explain, /api/suggest) from an asyncio loop,
+# retrieve_result runs on a bounded process pool, concurrent identical queries share one computation and
+# excess load is rejected with 503
+class QueryService:
+    def __init__(self, executor: Executor, max_pending: int = 64) -> None:
+
+        self.executor = executor
+        self.max_pending = max_pending
+        self.inflight: dict[tuple, asyncio.Future] = {}
+
+    async def query(self, text: str) -> dict:
+
+        return await self.submit(run_query, text)
+
+    async def explain(self, text: str) -> dict:
+
+        return await self.submit(run_explain, text)
+
+    # runs fn(text) on the executor, one computation per (fn, query key) and at most max_pending of them
+    async def submit(self, fn, text: str) -> dict:
+
+        key = (fn.__name__, *app.se.query_key(text, abb=app.abbrevations))
+        future = self.inflight.get(key)
+
+        if future is None:
+            if len(self.inflight) >= self.max_pending:
+                raise Overloaded()
+
+            future = asyncio.get_running_loop().run_in_executor(self.executor, fn, text)
+            self.inflight[key] = future
+            future.add_done_callback(lambda _: self.inflight.pop(key, None))
+
+        # shield, a client disconnecting must not cancel the computation other clients wait for
+        return await asyncio.shield(future)
+
+    async def respond(self, method: str, target: str) -> tuple[int, dict]:
+
+        url = urlsplit(target)
+
+        if method != "GET":
+            return 405, {"error": "only GET is supported"}
+
+        if url.path == "/health":
+            return 200, {"status": "ok", "pending": len(self.inflight)}
+
+        if url.path not in ("/api/query", "/api/explain", "/api/suggest"):
+            return 404, {"error": f"unknown path {url.path}"}
+
+        params = parse_qs(url.query)
+        query = params.get("query", [""])[0]
+        if not query.strip():
+            return 400, {"error": "missing query parameter"}
+
+        # suggestions take well under a millisecond, they are answered on the loop by the parent's index
+        if url.path == "/api/suggest":
+            limit = params.get("limit", ["5"])[0]
+            if not limit.isdigit() or int(limit) == 0:
+                return 400, {"error": "limit must be a positive integer"}
+            return 200, {"query": query, "suggestions": app.suggest(query, min(int(limit), 50))}
+
+        if url.path == "/api/explain" and app.sharded is not None:
+            return 400, {"error": "explain is not available on a sharded catalog"}
+
+        try:
+            return 200, await (self.explain(query) if url.path == "/api/explain" else self.query(query))
+        except Overloaded:
+            return 503, {"error": "too many pending queries, retry later"}
+        except Exception as e:
+            return 500, {"error": str(e)}
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+
+        try:
+            request_line = (await reader.readline()).decode("latin-1").split()
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+
+            if len(request_line) < 2:
+                status, body = 400, {"error": "malformed request"}
+            else:
+                status, body = await self.respond(request_line[0], request_line[1])
+
+            payload = json.dumps(body).encode()
+            headers = [
+                f"HTTP/1.1 {status} {STATUS[status]}",
+                "Content-Type: application/json",
+                f"Content-Length: {len(payload)}",
+                "Connection: close",
+            ]
+            if status == 503:
+                headers.append("Retry-After: 1")
+
+            writer.write("\r\n".join(headers).encode() + b"\r\n\r\n" + payload)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host: str, port: int) -> None:
+
+        server = await asyncio.start_server(self.handle, host, port)
+        async with server:
+            await server.serve_forever()
+
+
+# workers are forked after the catalog is loaded so they share its pages, where fork is not
+# available every worker loads the catalog itself
+def create_executor(
+    path: str, workers: int, lemma_table: str | None = None, download_wordnet: bool = True, warm_up: bool = True
+) -> ProcessPoolExecutor:
+
+    if "fork" in multiprocessing.get_all_start_methods():
+        return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("fork"))
+
+    return ProcessPoolExecutor(
+        max_workers=workers, initializer=load_catalog, initargs=(path, lemma_table, download_wordnet, warm_up)
+    )
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="HTTP query service for the sales data search engine")
+    parser.add_argument("--data", default="sales_data.parquet")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=multiprocessing.cpu_count())
+    parser.add_argument("--max-pending", type=int, default=64)
+    parser.add_argument("--export-shared", help="write --data as a shared .arrow catalog to this path and exit")
+    parser.add_argument("--lemma-table", help="lemma table json, written with --export-shared and read otherwise")
+    parser.add_argument("--offline", action="store_true", help="never download WordNet (it must be installed)")
+    parser.add_argument("--no-warm-up", action="store_true", help="skip pre-warming the lemma and tokenization caches")
+    parser.add_argument("--shards", type=int, default=0, help="split the catalog by brand into this many shard processes")
+    args = parser.parse_args()
+
+    if args.export_shared:
+        app.export_catalog(args.data, args.export_shared, args.lemma_table)
+        print(f"Shared catalog written to {args.export_shared}, serve it with --data {args.export_shared}")
+        raise SystemExit(0)
+
+    # with shards the queries run on threads of this process, the shard processes do the scoring
+    if args.shards:
+        app.load_sharded_catalog(args.data, args.shards, args.lemma_table, not args.offline, not args.no_warm_up)
+        executor = ThreadPoolExecutor(max_workers=args.workers)
+    else:
+        load_catalog(args.data, args.lemma_table, not args.offline, not args.no_warm_up)
+        executor = create_executor(args.data, args.workers, args.lemma_table, not args.offline, not args.no_warm_up)
+
+    with executor:
+        service = QueryService(executor, args.max_pending)
+        print(f"Serving on http://{args.host}:{args.port}/api/query?query=<YOUR QUERY>")
+        try:
+            asyncio.run(service.serve(args.host, args.port))
+        except KeyboardInterrupt:
+            print("Exiting the program")
@@ -1,44 +1,201 @@
 from search_engine.search_engine import SmallSearchEngine
+from search_engine.catalog_loader import CatalogLoader
+from search_engine.shared_catalog import SharedCatalog
+from search_engine.result_cache import ResultCache
+from search_engine.instrumentation import NULL_INSTRUMENTATION
+from search_engine.query_planner import QueryPlanner
+from search_engine.autocomplete import AutocompleteIndex
+from search_engine.sharding import ShardedSearchEngine
+from search_engine.ranking import top_k_rows, top_k_views
 import pandas as pd
 
+abbrevations = {
+    "cooler":"cooling appliance",
+    "heater":"heating appliance",
+    "headset":"headphone",
+}
+
+result_cache = ResultCache(max_entries=1024, max_bytes=64 * 1024 * 1024, ttl=300)
+se: SmallSearchEngine | None = None
+autocomplete: AutocompleteIndex | None = None
+sharded: ShardedSearchEngine | None = None
+planner = QueryPlanner("brand_lower", "product_line_clean", "sku", "max_win_score", "combine_score", abb=abbrevations)
+
 
 def retrieve_result(df: pd.DataFrame, text: str) -> pd.DataFrame:
-    abbrevations = {
-        "cooler":"cooling appliance",
-        "heater":"heating appliance",
-        "headset":"headphone",
-    }
-    df_brand = se.exact_match(df, "brand_lower", text, method="max_win_score")
-    df_product = se.partial_match(
-        df_brand, "product_line_clean", text, method="combine_score", abb=abbrevations
-    )
-    df_res = se.inverse_partial_match(df_product, "sku", text)
-    return df_res
+    key = se.query_key(text, abb=abbrevations)
+    rows = result_cache.get(df, key)
+    if rows is not None:
+        return df.iloc[rows]
+
+    # every stage narrows positional rows of df, only the final result is materialized, stages that
+    # cannot narrow their rows are skipped by the planner
+    rows = planner.bind(se, df).rows(text)
+    result_cache.put(df, key, rows)
+    return df.iloc[rows]
+
+
+# chosen plan of a query with the estimated and actual cost of every stage
+def explain(df: pd.DataFrame, text: str) -> str:
+
+    return planner.bind(se, df).explain(text).explain()
+
+
+# retrieve_result on the shards of a catalog loaded with load_sharded_catalog
+def retrieve_sharded(text: str) -> pd.DataFrame:
+
+    return sharded.search(text)
+
+
+# ranked completions of a partly typed query (brands, product lines, their abbreviations and sku words)
+def suggest(text: str, limit: int = 5) -> list[dict]:
+
+    return autocomplete.suggest(text, limit)
+
+
+# catalog updates of the app (see SmallSearchEngine.upsert_rows), the suggestions are updated with the
+# same rows, the returned frame replaces df
+def upsert_rows(df: pd.DataFrame, rows: pd.DataFrame) -> pd.DataFrame:
+
+    new_df = se.upsert_rows(df, rows)
+    autocomplete.upsert_rows(df, rows)
+    return new_df
+
+
+def delete_rows(df: pd.DataFrame, labels) -> pd.DataFrame:
+
+    new_df = se.delete_rows(df, labels)
+    autocomplete.delete_rows(df, labels)
+    return new_df
+
+
+# retrieve_result for many queries (see SmallSearchEngine.search_many), yields (query, result) pairs,
+# with output the results are written to that parquet file instead
+def retrieve_many(df: pd.DataFrame, queries, output: str | None = None):
+    results = se.search_many(df, queries, output=output, abb=abbrevations)
+    if output is not None:
+        return results
+
+    return ((query, df.iloc[rows]) for query, rows in results)
 
 
 def top_three_selling(df):
 
-    return df.sort_values(by="sales", ascending=False).iloc[:3]
+    return top_k_rows(df, "sales", 3, ascending=False)
 
 
 def top_three_low_price(df):
 
-    return df.sort_values(by="price").iloc[:3]
+    return top_k_rows(df, "price", 3)
 
 
 def top_three_high_price(df):
 
-    return df.sort_values(by="price", ascending=False).iloc[:3]
+    return top_k_rows(df, "price", 3, ascending=False)
 
 
 def other_sku(df, ids):
     return df.loc[~df.index.isin(ids)]
 
 
+# top selling, lowest/highest price and remaining products of a result
+def result_sections(result_df: pd.DataFrame) -> dict[str, pd.DataFrame]:
+    inst = se.instrumentation if se is not None else NULL_INSTRUMENTATION
+
+    with inst.stage("ranking"):
+        sections = top_k_views(
+            result_df,
+            {
+                "top_selling": ("sales", 3, False),
+                "highest_price": ("price", 3, False),
+                "lowest_price": ("price", 3, True),
+            },
+        )
+
+    others = [*sections["top_selling"].index, *sections["highest_price"].index, *sections["lowest_price"].index]
+
+    return {
+        "top_selling": sections["top_selling"],
+        "lowest_price": sections["lowest_price"],
+        "highest_price": sections["highest_price"],
+        "others": other_sku(result_df, others),
+    }
+
+
+# creates the module level engine used by retrieve_result and loads the catalog with its indexes,
+# a .arrow path is a shared catalog (see export_catalog) that is memory mapped instead of loaded,
+# lemma_table is a table saved by export_catalog, WordNet is then only loaded for words missing from it
+def load_catalog(
+    path: str = "sales_data.parquet", lemma_table: str | None = None, download_wordnet: bool = True, warm_up: bool = True
+) -> pd.DataFrame:
+    global se, autocomplete
+
+    se = SmallSearchEngine(download_wordnet=download_wordnet, lemma_table=lemma_table)
+    cat_alias = None
+    if path.endswith(".arrow"):
+        catalog = SharedCatalog.open(path)
+        df = se.attach_catalog(catalog)
+        cat_alias = catalog.cat_alias
+    else:
+        df = se.read_df_parquet(path, persist_tokens=True, loader=CatalogLoader())
+        se.build_index(df, "brand_lower", lemmatize=False)
+        se.build_index(df, "product_line_clean", abb=abbrevations)
+
+    # the first queries find the catalog words in the lemma and tokenization caches
+    if warm_up:
+        se.warm_up(df, ["brand_lower"], lemmatize=False)
+        se.warm_up(df, ["product_line_clean"])
+
+    autocomplete = AutocompleteIndex().build(df, suggestion_aliases(df, cat_alias))
+    return df
+
+
+# splits the catalog by brand into shard processes holding their own indexes (see ShardedSearchEngine),
+# queries then run with retrieve_sharded, this process only keeps the brands and the autocomplete index
+def load_sharded_catalog(
+    path: str, shards: int, lemma_table: str | None = None, download_wordnet: bool = True, warm_up: bool = True
+) -> ShardedSearchEngine:
+    global se, sharded, autocomplete
+
+    df = SharedCatalog.open(path).to_pandas() if path.endswith(".arrow") else CatalogLoader().read_parquet(path)
+    sharded = ShardedSearchEngine(
+        df, shards, "brand_lower", "product_line_clean", "sku", "max_win_score", "combine_score",
+        download_wordnet, lemma_table, abb=abbrevations
+    )
+    se = sharded.engine
+    if warm_up:
+        se.warm_up(df, ["brand_lower"], lemmatize=False)
+    autocomplete = AutocompleteIndex().build(df, suggestion_aliases(df))
+    return sharded
+
+
+# the abbreviations (and ProductMatcher aliases stored with a shared catalog) of every product line
+def suggestion_aliases(df: pd.DataFrame, cat_alias: dict[str, list[str]] | None = None) -> dict[str, list[str]]:
+
+    res = {cat: list(aliases) for cat, aliases in (cat_alias or {}).items()}
+    for cat in df["product_line"].dropna().unique():
+        res.setdefault(cat, []).extend(abb for abb, full in abbrevations.items() if full in str(cat).lower())
+
+    return res
+
+
+# writes the catalog and its token cache / indexes once into a shared .arrow file for load_catalog,
+# with the product line aliases and normalized skus of ProductMatcher (see ProductMatcher.from_shared),
+# and the lemmas of the catalog words into lemma_path if given
+def export_catalog(path: str, shared_path: str, lemma_path: str | None = None) -> None:
+    # imported here, the app itself does not use the other variant
+    from other_variant.ProductMatcher import clean_skus, create_cat_alias, unexp_cat_alias
+
+    df = load_catalog(path, warm_up=False)
+    cat_alias = create_cat_alias(unexp_cat_alias, df["product_line"].dropna().unique())
+    SharedCatalog.write(shared_path, df, se, cat_alias=cat_alias, clean_sku=clean_skus(df["sku"]))
+    if lemma_path is not None:
+        se.save_lemma_table(lemma_path, df, ["sku", "brand_lower", "product_line_clean"])
+
+
 if __name__ == "__main__":
 
-    se = SmallSearchEngine()
-    df = se.read_df_parquet("sales_data.parquet")
+    df = load_catalog("sales_data.parquet")
     while True:
 
         print("For exiting you can press ctrl+d or simply write exit\n")
@@ -52,19 +209,24 @@ if __name__ == "__main__":
             print("Exiting the program")
             break
         print()
-        result_df = retrieve_result(df, text)
-        others = []
-
-        df_top_sell = top_three_selling(result_df)
-        others.extend(df_top_sell.index)
-
-        df_top_high_price = top_three_high_price(result_df)
-        others.extend(df_top_high_price.index)
-
-        df_top_low_price = top_three_low_price(result_df)
-        others.extend(df_top_low_price.index)
 
-        df_others = other_sku(result_df, others)
+        # "explain <query>" prints the plan of the query instead of its results
+        if text.lower().startswith("explain "):
+            print(f"{explain(df, text[len('explain '):])}\n")
+            continue
+
+        # "suggest <prefix>" prints the completions of a partly typed query
+        if text.lower().startswith("suggest "):
+            for suggestion in suggest(text[len('suggest '):]):
+                print(f"{suggestion['text']}  ({suggestion['kind']}, sales {suggestion['weight']:.0f})")
+            print()
+            continue
+
+        sections = result_sections(retrieve_result(df, text))
+        df_top_sell = sections["top_selling"]
+        df_top_low_price = sections["lowest_price"]
+        df_top_high_price = sections["highest_price"]
+        df_others = sections["others"]
 
         print(
             f"Top Selling Products:\n{df_top_sell[['sku','sales']].to_string()}\n"
@@ -0,0 +1,286 @@
+import re
+import threading
+from bisect import bisect_left
+
+import numpy as np
+import pandas as pd
+from rapidfuzz import process
+from rapidfuzz.distance import OSA
+
+# characters other than letters, digits, "." (sizes like 1.5) and spaces separate words
+SEPARATORS = re.compile(r"[^\w. ]+|_")
+SPACES = re.compile(r" +")
+KINDS = ("brand", "product_line", "alias", "sku")
+
+
+# lowered words of a text separated by single spaces, a trailing space (finished word) is kept
+def normalize(text: str) -> str:
+
+    return SPACES.sub(" ", SEPARATORS.sub(" ", str(text).lower().replace("-", "").replace("'", ""))).lstrip()
+
+
+# SuggestionSnapshot is one immutable version of the index: every (kind, term) with its label and
+# weight, sorted by term so the terms starting with a prefix are one bisect range. Distinct term
+# prefixes of every length are grouped lazily for the typo tolerant lookup
+class SuggestionSnapshot:
+    def __init__(self, entries: list[tuple[str, str, str, float]]) -> None:
+
+        entries = sorted(entries, key=lambda entry: entry[:2])
+        self.terms = [entry[0] for entry in entries]
+        self.kinds = [entry[1] for entry in entries]
+        self.labels = [entry[2] for entry in entries]
+        self.weights = np.array([entry[3] for entry in entries], dtype=np.float64)
+        self.positions = {entry[:2]: i for i, entry in enumerate(entries)}
+        self.suffixes: dict[int, tuple[list[str], np.ndarray]] = {}
+
+    def __len__(self) -> int:
+
+        return len(self.terms)
+
+    # same terms with other weights, the order is kept
+    def reweighted(self, weights: dict[tuple[str, str], float]) -> "SuggestionSnapshot":
+
+        res = SuggestionSnapshot.__new__(SuggestionSnapshot)
+        res.__dict__.update(self.__dict__)
+        res.weights = self.weights.copy()
+        for key, weight in weights.items():
+            res.weights[self.positions[key]] = weight
+
+        return res
+
+    def prefix_range(self, prefix: str) -> tuple[int, int]:
+
+        lo = bisect_left(self.terms, prefix)
+        return lo, bisect_left(self.terms, prefix + "\U0010ffff", lo)
+
+    # term positions of the terms holding piece at position shift, suffixes of the terms from every
+    # shift are sorted lazily (shift 0 is the terms themselves)
+    def piece_positions(self, piece: str, shift: int) -> np.ndarray:
+
+        if shift == 0:
+            return np.arange(*self.prefix_range(piece), dtype=np.int64)
+
+        suffixes = self.suffixes.get(shift)
+        if suffixes is None:
+            pairs = sorted((term[shift:], i) for i, term in enumerate(self.terms) if len(term) > shift)
+            suffixes = self.suffixes[shift] = ([pair[0] for pair in pairs], np.array([pair[1] for pair in pairs], dtype=np.int64))
+
+        keys, positions = suffixes
+        lo = bisect_left(keys, piece)
+        return positions[lo:bisect_left(keys, piece + "\U0010ffff", lo)]
+
+
+# AutocompleteIndex suggests brands, product lines, product line aliases and sku words for a typed
+# prefix, ranked by the sales of the matching rows. Prefixes are looked up with a bisect on the sorted
+# terms, when they do not fill the suggestions the terms within a few edits (a swap of two letters is one
+# edit) are searched too, one edit is allowed from 4 characters and two from 8. A prefix with e edits
+# still holds one of its e+1 pieces unchanged at most e characters away, so only the terms holding a
+# piece there (bisect on the sorted term suffixes) are compared with the C level edit distance.
+# The weights are summed per term and updated incrementally with the changed rows, the sorted terms
+# are only rebuilt when terms appear or disappear, readers always see one consistent snapshot
+class AutocompleteIndex:
+    def __init__(
+        self,
+        brand_column: str = "brand",
+        category_column: str = "product_line",
+        sku_column: str = "sku",
+        weight_column: str = "sales",
+        typo_lengths: tuple[int, ...] = (4, 8),
+    ) -> None:
+
+        self.brand_column = brand_column
+        self.category_column = category_column
+        self.sku_column = sku_column
+        self.weight_column = weight_column
+        self.typo_lengths = typo_lengths
+        self.cat_alias: dict[str, list[str]] = {}
+        # kind -> term -> [weight, rows, label]
+        self.totals: dict[str, dict[str, list]] = {kind: {} for kind in KINDS if kind != "alias"}
+        self.snapshot = SuggestionSnapshot([])
+        self.update_lock = threading.Lock()
+
+    # cat_alias maps a product line to its aliases (see ProductMatcher.create_cat_alias)
+    def build(self, df: pd.DataFrame, cat_alias: dict[str, list[str]] | None = None) -> "AutocompleteIndex":
+
+        with self.update_lock:
+            self.cat_alias = {normalize(cat).strip(): aliases for cat, aliases in (cat_alias or {}).items()}
+            self.totals = {kind: {} for kind in self.totals}
+            self.add(df, 1)
+            self.swap()
+
+        return self
+
+    # df is the catalog before the update, rows replace its rows with the same labels or are appended
+    def upsert_rows(self, df: pd.DataFrame, rows: pd.DataFrame, cat_alias: dict[str, list[str]] | None = None) -> None:
+
+        with self.update_lock:
+            if cat_alias:
+                self.cat_alias = {**self.cat_alias, **{normalize(cat).strip(): aliases for cat, aliases in cat_alias.items()}}
+            self.add(df.loc[df.index.intersection(rows.index)], -1)
+            self.add(rows, 1)
+            self.swap()
+
+    # df is the catalog before the rows with the given labels are deleted
+    def delete_rows(self, df: pd.DataFrame, labels) -> None:
+
+        with self.update_lock:
+            self.add(df.loc[df.index.intersection(pd.Index(labels))], -1)
+            self.swap()
+
+    # adds (sign 1) or removes (sign -1) the weight and row count of the rows to their terms
+    def add(self, df: pd.DataFrame, sign: int) -> None:
+
+        if len(df) == 0:
+            return
+
+        if self.weight_column in df.columns:
+            weights = pd.to_numeric(df[self.weight_column], errors="coerce").fillna(0).to_numpy(np.float64)
+        else:
+            weights = np.ones(len(df), dtype=np.float64)
+
+        for kind, column in (("brand", self.brand_column), ("product_line", self.category_column)):
+            codes, uniques = pd.factorize(df[column].astype(object))
+            valid = codes >= 0
+            sums = np.bincount(codes[valid], weights[valid], minlength=len(uniques))
+            counts = np.bincount(codes[valid], minlength=len(uniques))
+            self.accumulate(
+                kind, ((normalize(label).strip(), str(label).strip(), w, c) for label, w, c in zip(uniques, sums, counts)), sign
+            )
+
+        # every word counts once per row, the distinct raw words are normalized once
+        raw = df[self.sku_column].astype(object).fillna("").str.lower().str.split().reset_index(drop=True).explode().dropna()
+        words = raw.map({word: normalize(word).split() for word in pd.unique(raw)}).explode().dropna()
+        pairs = pd.DataFrame({"word": words.to_numpy(), "row": words.index.to_numpy()}).drop_duplicates()
+        grouped = pd.Series(weights[pairs["row"].to_numpy()]).groupby(pairs["word"].to_numpy(), sort=False)
+        self.accumulate("sku", ((word, word, w, c) for (word, w), c in zip(grouped.sum().items(), grouped.size())), sign)
+
+    def accumulate(self, kind: str, items, sign: int) -> None:
+
+        totals = self.totals[kind]
+        for term, label, weight, count in items:
+            if not term:
+                continue
+            entry = totals.setdefault(term, [0.0, 0, label])
+            entry[0] += sign * weight
+            entry[1] += sign * count
+            if entry[1] <= 0:
+                del totals[term]
+
+    def entries(self) -> dict[tuple[str, str], tuple[str, float]]:
+
+        res = {(term, kind): (label, weight) for kind, totals in self.totals.items() for term, (weight, _, label) in totals.items()}
+
+        # an alias is suggested with the sales of its product lines
+        for cat, aliases in self.cat_alias.items():
+            if cat not in self.totals["product_line"]:
+                continue
+            for alias in aliases:
+                term = normalize(alias).strip()
+                if term and term != cat:
+                    label, weight = res.get((term, "alias"), (alias, 0.0))
+                    res[(term, "alias")] = (label, weight + self.totals["product_line"][cat][0])
+
+        return res
+
+    # swaps in a snapshot of the current totals, only reweighted when the terms did not change
+    def swap(self) -> None:
+
+        entries = self.entries()
+        snapshot = self.snapshot
+        if entries.keys() == snapshot.positions.keys():
+            self.snapshot = snapshot.reweighted({key: weight for key, (_, weight) in entries.items()})
+        else:
+            self.snapshot = SuggestionSnapshot([(*key, label, weight) for key, (label, weight) in entries.items()])
+
+    def max_edits(self, n: int) -> int:
+
+        return sum(n >= length for length in self.typo_lengths)
+
+    # up to limit suggestions for a typed text, the whole text and then its last words are completed
+    # (the first words are kept as they are typed), fewer edits rank first and then longer completions
+    def suggest(self, text: str, limit: int = 5) -> list[dict]:
+
+        snapshot = self.snapshot
+        query = normalize(text)
+        candidates = []
+
+        starts = [0, *(i + 1 for i, char in enumerate(query) if char == " " and i + 1 < len(query))]
+        for k, start in enumerate(starts):
+            matches = self.matches(snapshot, query[start:], limit)
+            candidates.extend((edits, k, rank, query[:start], pos) for rank, (pos, edits) in enumerate(matches))
+            # exact completions of longer parts of the text rank before anything left
+            if sum(not candidate[0] for candidate in candidates) >= limit:
+                break
+
+        res: list[dict] = []
+        seen: set[str] = set()
+        for edits, _, _, head, pos in sorted(candidates):
+            text = head + snapshot.terms[pos]
+            if text in seen:
+                continue
+            seen.add(text)
+            res.append({
+                "text": text,
+                "label": snapshot.labels[pos],
+                "kind": snapshot.kinds[pos],
+                "weight": float(snapshot.weights[pos]),
+                "edits": edits,
+            })
+            if len(res) == limit:
+                break
+
+        return res
+
+    # positions of the terms holding a piece of the prefix near its position, with the pieces of the
+    # prefix with letters swapped across piece boundaries too (a swap there changes two pieces)
+    def piece_candidates(self, snapshot: SuggestionSnapshot, prefix: str, max_edits: int) -> list[np.ndarray]:
+
+        bounds = [round(j * len(prefix) / (max_edits + 1)) for j in range(max_edits + 2)]
+        variants = {prefix}
+        for b in bounds[1:-1]:
+            variants |= {text[:b - 1] + text[b] + text[b - 1] + text[b + 1:] for text in variants}
+
+        res = []
+        for text in variants:
+            for start, end in zip(bounds, bounds[1:]):
+                shifts = range(max(0, start - max_edits), start + max_edits + 1) if start else (0,)
+                res.extend(snapshot.piece_positions(text[start:end], shift) for shift in shifts)
+
+        return res
+
+    # term positions and edit counts of the best terms for a prefix, ordered by edits and weight, a
+    # few more than limit are returned since terms of different kinds may repeat the same text
+    def matches(self, snapshot: SuggestionSnapshot, prefix: str, limit: int) -> list[tuple[int, int]]:
+
+        if not prefix.strip() or not len(snapshot):
+            return []
+
+        want = 2 * limit
+        lo, hi = snapshot.prefix_range(prefix)
+        positions = np.arange(lo, hi, dtype=np.int64)
+        edits = np.zeros(hi - lo, dtype=np.int64)
+
+        max_edits = self.max_edits(len(prefix))
+        if hi - lo < want and max_edits:
+            candidates = np.unique(np.concatenate([positions, *self.piece_candidates(snapshot, prefix, max_edits)]))
+            terms = [snapshot.terms[i] for i in candidates.tolist()]
+
+            # edits of the closest prefix of every candidate
+            edits = np.full(len(candidates), max_edits + 1, dtype=np.int64)
+            for n in range(max(1, len(prefix) - max_edits), len(prefix) + max_edits + 1):
+                dist = process.cdist(
+                    [prefix], [term[:n] for term in terms], scorer=OSA.distance, score_cutoff=max_edits, dtype=np.int32
+                )[0]
+                np.minimum(edits, dist, out=edits)
+
+            found = edits <= max_edits
+            positions, edits = candidates[found], edits[found]
+
+        weights = snapshot.weights[positions]
+        if len(positions) > want and not edits.any():
+            # only the best weights of a long exact range are sorted
+            keep = np.argpartition(-weights, want - 1)[:want]
+            positions, edits, weights = positions[keep], edits[keep], weights[keep]
+
+        order = np.lexsort((positions, -weights, edits))[:want]
+        return list(zip(positions[order].tolist(), edits[order].tolist()))
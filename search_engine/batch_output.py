@@ -0,0 +1,63 @@
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+# ParquetSink appends result frames to a parquet file in row groups of about row_group_rows rows, so
+# the results of a batch are never held in memory together. Categorical columns are written as plain
+# values and later frames are cast to the schema of the first one
+class ParquetSink:
+    def __init__(self, path: str, row_group_rows: int = 100000) -> None:
+
+        self.path = path
+        self.row_group_rows = row_group_rows
+        self.writer: pq.ParquetWriter | None = None
+        self.pending: list[pd.DataFrame] = []
+        self.pending_rows = 0
+        self.rows = 0
+
+    def __enter__(self) -> "ParquetSink":
+
+        return self
+
+    def __exit__(self, *exc) -> None:
+
+        self.close()
+
+    def write(self, frame: pd.DataFrame) -> None:
+
+        self.pending.append(frame)
+        self.pending_rows += len(frame)
+        if self.pending_rows >= self.row_group_rows:
+            self.flush()
+
+    def flush(self) -> None:
+
+        if not self.pending:
+            return
+
+        frame = pd.concat(self.pending, ignore_index=True)
+        self.pending = []
+        self.pending_rows = 0
+
+        for column in frame.columns:
+            if isinstance(frame[column].dtype, pd.CategoricalDtype):
+                frame[column] = frame[column].astype(frame[column].cat.categories.dtype)
+
+        table = pa.Table.from_pandas(frame, preserve_index=False).replace_schema_metadata(None)
+        if self.writer is None:
+            self.writer = pq.ParquetWriter(self.path, table.schema)
+        else:
+            table = table.cast(self.writer.schema)
+
+        self.writer.write_table(table)
+        self.rows += len(frame)
+
+    def close(self) -> None:
+
+        self.flush()
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+        elif self.rows == 0:
+            pq.write_table(pa.table({"query": pa.array([], type=pa.string())}), self.path)
@@ -0,0 +1,80 @@
+from rapidfuzz.distance import Indel
+from rapidfuzz import process
+import numpy as np
+
+
+# Levenshtein.ratio is Indel normalized similarity, so cdist with this scorer returns the same values
+def similarity_matrix(queries: list[str], choices: list[str]) -> np.ndarray:
+
+    if len(queries) == 0 or len(choices) == 0:
+        return np.zeros((len(queries), len(choices)), dtype=np.float64)
+
+    return process.cdist(queries, choices, scorer=Indel.normalized_similarity, dtype=np.float64)
+
+
+# flattens token lists into a deduplicated vocabulary, token ids and start offset of each record
+def encode_tokens(token_lists) -> tuple[list[str], np.ndarray, np.ndarray]:
+
+    vocab: dict[str, int] = {}
+    ids = []
+    offsets = [0]
+
+    for tokens in token_lists:
+        for token in tokens:
+            ids.append(vocab.setdefault(token, len(vocab)))
+        offsets.append(len(ids))
+
+    return list(vocab), np.array(ids, dtype=np.int64), np.array(offsets, dtype=np.int64)
+
+
+# max similarity of every query word with the tokens of every record, shape (records, query words)
+def max_word_scores(txt_ls: list[str], vocab: list[str], ids: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+
+    if len(offsets) == 1 or len(ids) == 0:
+        return np.zeros((len(offsets) - 1, len(txt_ls)), dtype=np.float64)
+
+    return reduce_word_scores(similarity_matrix(txt_ls, vocab), ids, offsets)
+
+
+# per record max over its tokens of a (query words, vocab) similarity matrix
+def reduce_word_scores(similarity: np.ndarray, ids: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+
+    n = len(offsets) - 1
+    res = np.zeros((n, similarity.shape[0]), dtype=np.float64)
+    filled = np.diff(offsets) > 0
+
+    if n == 0 or not filled.any():
+        return res
+
+    token_scores = similarity[:, ids]
+    res[filled] = np.maximum.reduceat(token_scores, offsets[:-1][filled], axis=1).T
+
+    return res
+
+
+def mean_of_sorted(word_scores: np.ndarray) -> np.ndarray:
+
+    word_scores = -np.sort(-word_scores, axis=1)
+    return word_scores.mean(axis=1)
+
+
+# average of the (descending) per word max scores for each record, same as inverse_partial_match loop
+def average_max_scores(txt_ls: list[str], vocab: list[str], ids: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+
+    return mean_of_sorted(max_word_scores(txt_ls, vocab, ids, offsets))
+
+
+# average_max_scores of several queries against the same records, the union of their words is scored
+# against the vocabulary in a single cdist call
+def batch_average_max_scores(
+    txt_lists: list[list[str]], vocab: list[str], ids: np.ndarray, offsets: np.ndarray
+) -> list[np.ndarray]:
+
+    words = list(dict.fromkeys(word for txt_ls in txt_lists for word in txt_ls))
+    word_ids = {word: i for i, word in enumerate(words)}
+    similarity = similarity_matrix(words, vocab)
+
+    return [
+        mean_of_sorted(reduce_word_scores(similarity[[word_ids[word] for word in txt_ls]], ids, offsets))
+        for txt_ls in txt_lists
+    ]
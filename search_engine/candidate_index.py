@@ -0,0 +1,86 @@
+from collections import Counter
+
+import numpy as np
+
+# margin for float rounding between the bounds and Levenshtein.ratio
+EPS = 1e-9
+
+
+# CharGramIndex is a character count (1-gram) inverted index over a vocabulary. The common characters
+# of two strings bound their longest common subsequence, so 2*common/(len1+len2) is an upper bound of
+# Levenshtein.ratio (Indel similarity), it is computed for the whole vocabulary with NumPy and entries
+# whose bound is below a threshold cannot reach it and are skipped before the exact ratio is computed
+class CharGramIndex:
+    def __init__(self, vocab) -> None:
+
+        self.vocab = list(dict.fromkeys(vocab))
+        self.ids = {word: i for i, word in enumerate(self.vocab)}
+        self.lengths = np.array([len(word) for word in self.vocab], dtype=np.int32)
+
+        # one contiguous count column per character, only the query characters are read
+        counts: dict[str, np.ndarray] = {}
+        for i, word in enumerate(self.vocab):
+            for char, n in Counter(word).items():
+                if char not in counts:
+                    counts[char] = np.zeros(len(self.vocab), dtype=np.int32)
+                counts[char][i] = n
+        self.counts = counts
+
+    def __len__(self) -> int:
+
+        return len(self.vocab)
+
+    def id_of(self, word: str) -> int:
+
+        return self.ids.get(word, -1)
+
+    # upper bound of ratio(query, word) for the vocabulary entries ids (all entries if None)
+    def upper_bounds(self, query: str, ids: np.ndarray | None = None) -> np.ndarray:
+
+        lengths = self.lengths if ids is None else self.lengths[ids]
+        common = np.zeros(len(lengths), dtype=np.int32)
+
+        for char, n in Counter(query).items():
+            column = self.counts.get(char)
+            if column is not None:
+                common += np.minimum(column if ids is None else column[ids], n)
+
+        total = lengths + len(query)
+        return np.divide(2 * common, total, out=np.ones(len(lengths)), where=total > 0)
+
+    # bounds of every query word (rows) against ids, ids of -1 (unknown words) get the trivial bound 1
+    def bounds_matrix(self, txt_ls: list[str], ids: np.ndarray) -> np.ndarray:
+
+        known = ids >= 0
+        res = np.ones((len(txt_ls), len(ids)), dtype=np.float64)
+
+        for i, word in enumerate(txt_ls):
+            res[i, known] = self.upper_bounds(word, ids[known])
+
+        return res
+
+    # upper bound of the inverse_partial_match average (mean over query words of the best token
+    # score) of every record, records with no tokens have the exact average 0
+    def record_upper_bounds(self, txt_ls: list[str], token_lists) -> np.ndarray:
+
+        ids = []
+        offsets = [0]
+        for tokens in token_lists:
+            ids.extend(self.ids.get(token, -1) for token in tokens)
+            offsets.append(len(ids))
+
+        return self.csr_upper_bounds(txt_ls, np.array(ids, dtype=np.int64), np.array(offsets, dtype=np.int64))
+
+    # record_upper_bounds of records given as token ids of this index (-1 for unknown tokens) and the
+    # start offset of every record
+    def csr_upper_bounds(self, txt_ls: list[str], ids: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+
+        res = np.zeros((len(offsets) - 1, len(txt_ls)), dtype=np.float64)
+        filled = np.diff(offsets) > 0
+
+        if filled.any():
+            unique_ids, inverse = np.unique(ids, return_inverse=True)
+            bounds = self.bounds_matrix(txt_ls, unique_ids)[:, inverse]
+            res[filled] = np.maximum.reduceat(bounds, offsets[:-1][filled], axis=1).T
+
+        return res.mean(axis=1)
@@ -0,0 +1,126 @@
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pv
+import pyarrow.parquet as pq
+
+# columns read by sales_data_app / query_service and ProductMatcher, the others are not loaded
+CATALOG_COLUMNS = ["sku", "product_line", "product_line_clean", "brand", "brand_lower", "sales", "price"]
+# low cardinality columns, stored as pandas categoricals (dictionary encoded) instead of object strings
+CATEGORICAL_COLUMNS = ["product_line", "product_line_clean", "brand", "brand_lower"]
+TEXT_COLUMNS = ["sku", *CATEGORICAL_COLUMNS]
+
+
+# deep memory usage of a frame in bytes per column (index included) and in total
+def memory_report(df: pd.DataFrame) -> dict[str, int]:
+
+    usage = df.memory_usage(deep=True)
+    res = {str(key): int(val) for key, val in usage.items()}
+    res["total"] = int(usage.sum())
+
+    return res
+
+
+# CatalogLoader streams a catalog in batches (parquet row groups, csv blocks) with pyarrow, only the
+# requested columns are read, strings are cleaned ("\r" removed) and low cardinality columns are
+# dictionary encoded while streaming, so the full object dtype frame is never materialized
+class CatalogLoader:
+    def __init__(
+        self,
+        columns: list[str] | None = CATALOG_COLUMNS,
+        categorical: list[str] = CATEGORICAL_COLUMNS,
+        batch_size: int = 65536,
+        clean: bool = True,
+    ) -> None:
+
+        self.columns = columns
+        self.categorical = categorical
+        self.batch_size = batch_size
+        self.clean = clean
+
+    def transform(self, batch: pa.RecordBatch) -> pa.RecordBatch:
+
+        arrays = []
+        for name, array in zip(batch.schema.names, batch.columns):
+            if pa.types.is_string(array.type) or pa.types.is_large_string(array.type):
+                if self.clean:
+                    array = pc.replace_substring(array, "\r", "")
+                if name in self.categorical:
+                    array = pc.dictionary_encode(array)
+            arrays.append(array)
+
+        return pa.RecordBatch.from_arrays(arrays, names=batch.schema.names)
+
+    # batches may carry different dictionaries, they are unified once before the conversion
+    def to_pandas(self, batches: list[pa.RecordBatch], schema: pa.Schema) -> pd.DataFrame:
+
+        if not batches:
+            batches = [self.transform(pa.RecordBatch.from_pylist([], schema=schema))]
+
+        return pa.Table.from_batches(batches).unify_dictionaries().to_pandas()
+
+    def selected(self, names: list[str], keep: list[str] = ()) -> list[str]:
+
+        if self.columns is None:
+            return list(names)
+
+        return [name for name in names if name in self.columns or name in keep]
+
+    def read_parquet(self, path: str) -> pd.DataFrame:
+
+        parquet = pq.ParquetFile(path)
+        schema = parquet.schema_arrow
+        pandas_metadata = schema.pandas_metadata or {}
+
+        # the pandas index is either stored as columns or described as a range
+        index_columns = [col for col in pandas_metadata.get("index_columns", []) if isinstance(col, str)]
+        columns = self.selected(schema.names, index_columns)
+
+        batches = [
+            self.transform(batch) for batch in parquet.iter_batches(batch_size=self.batch_size, columns=columns)
+        ]
+        df = self.to_pandas(batches, pa.schema([schema.field(name) for name in columns]))
+
+        if index_columns:
+            df = df.set_index(index_columns)
+            df.index.names = [
+                None if name.startswith("__index_level_") else name for name in df.index.names
+            ]
+        else:
+            for col in pandas_metadata.get("index_columns", []):
+                if isinstance(col, dict) and col.get("kind") == "range":
+                    stop = col["start"] + col["step"] * len(df)
+                    df.index = pd.RangeIndex(col["start"], stop, col["step"], name=col["name"])
+
+        return df
+
+    # index_col is the position of the index column in the file (as in pd.read_csv), -1 for none
+    def read_csv(self, path: str, index_col: int = -1) -> pd.DataFrame:
+
+        # text columns are read as strings in every block, a block based type inference could differ
+        # quoted values may hold line breaks (the sales_data brands end with "\r")
+        parse_options = pv.ParseOptions(newlines_in_values=True)
+        reader = pv.open_csv(
+            path, read_options=pv.ReadOptions(block_size=self.batch_size * 1024), parse_options=parse_options
+        )
+        names = reader.schema.names
+        reader.close()
+
+        index_name = names[index_col] if index_col > -1 else None
+        columns = self.selected(names, [index_name] if index_name is not None else [])
+        text_columns = {name: pa.string() for name in columns if name in TEXT_COLUMNS}
+
+        reader = pv.open_csv(
+            path,
+            read_options=pv.ReadOptions(block_size=self.batch_size * 1024),
+            parse_options=parse_options,
+            convert_options=pv.ConvertOptions(include_columns=columns, column_types=text_columns),
+        )
+        df = self.to_pandas([self.transform(batch) for batch in reader], reader.schema)
+
+        if index_name is not None:
+            df = df.set_index(index_name)
+            if index_name == "":
+                df.index.name = None
+
+        return df
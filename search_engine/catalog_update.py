@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+
+
+# copy of df where the rows of the same label are replaced by rows and the others are appended, df is
+# not modified (copy-on-write), categorical columns get the new categories so they stay categorical
+def upsert_frame(df: pd.DataFrame, rows: pd.DataFrame) -> pd.DataFrame:
+
+    rows = rows.reindex(columns=df.columns)
+    exists = rows.index.isin(df.index)
+    res = df.copy()
+
+    for column in res.columns:
+        if isinstance(res[column].dtype, pd.CategoricalDtype):
+            missing = pd.Index(rows[column].dropna().unique()).difference(res[column].cat.categories)
+            if len(missing):
+                res[column] = res[column].cat.add_categories(missing)
+
+    # replaced per column Series, pandas 1.5 fails on frame level iloc assignment into string[pyarrow]
+    # columns (a memory mapped SharedCatalog)
+    if exists.any():
+        positions = res.index.get_indexer(rows.index[exists])
+        for column in res.columns:
+            values = res[column].copy()
+            values.iloc[positions] = rows[column].to_numpy()[exists]
+            res[column] = values
+
+    if not exists.all():
+        res = pd.concat([res, rows[~exists].astype(res.dtypes.to_dict())])
+
+    return res
+
+
+# mask of the df rows kept when the rows with the given labels are deleted
+def keep_mask(df: pd.DataFrame, labels) -> np.ndarray:
+
+    return ~df.index.isin(labels)
+
+
+# new position of every df row once the rows outside keep are deleted, -1 for deleted rows
+def position_map(keep: np.ndarray) -> np.ndarray:
+
+    res = np.cumsum(keep) - 1
+    res[~keep] = -1
+    return res
+
+
+def remap_positions(positions: np.ndarray, mapping: np.ndarray) -> np.ndarray:
+
+    res = mapping[positions]
+    return res[res >= 0]
@@ -0,0 +1,108 @@
+import numpy as np
+
+from search_engine.candidate_index import CharGramIndex
+
+
+# CategoryIndex keeps the special character split (& and /), lowered and tokenized form of
+# every category of a column, so scoring methods do not redo this preprocessing on every query
+class CategoryIndex:
+    def __init__(self, engine, lemmatize: bool = True, **kwargs) -> None:
+
+        self.engine = engine
+        self.lemmatize = lemmatize
+        self.kwargs = kwargs
+        self.split_map: dict[str, list[tuple[str, int]]] = {}
+        self.token_map: dict[str, list[list[str]]] = {}
+        self.split_grams: CharGramIndex | None = None
+        self.token_grams: CharGramIndex | None = None
+        self.token_id_map: dict[str, list[np.ndarray]] = {}
+
+    # True when the index was built with the same text_to_list options as requested by a scorer
+    def matches(self, lemmatize: bool, kwargs: dict) -> bool:
+
+        return self.lemmatize == lemmatize and self.kwargs == kwargs
+
+    def split(self, cat: str) -> list[str]:
+
+        with self.engine.instrumentation.stage("special_char_sep"):
+            cat_ls = self.engine.special_char_sep(cat, splitter="&")
+
+            if len(cat_ls) <= 1:
+                cat_ls = self.engine.special_char_sep(cat, splitter="/")
+
+        return cat_ls
+
+    # (lowered inner category, number of words) pairs used by max_win_score
+    def splits(self, cat: str) -> list[tuple[str, int]]:
+
+        res = self.split_map.get(cat)
+        if res is None:
+            res = [(inner_cat.lower(), len(inner_cat.split(" "))) for inner_cat in self.split(cat)]
+            self.split_map[cat] = res
+
+        return res
+
+    # tokenized inner categories used by average_score and combine_score
+    def tokens(self, cat: str) -> list[list[str]]:
+
+        res = self.token_map.get(cat)
+        if res is None:
+            inner_cats = self.split(cat)
+            with self.engine.instrumentation.stage("lemmatize"):
+                res = [
+                    self.engine.text_to_list(
+                        inner_cat, splitter=" ", lower=True, lemmatize=self.lemmatize, **self.kwargs
+                    )
+                    for inner_cat in inner_cats
+                ]
+            self.token_map[cat] = res
+
+        return res
+
+    def add(self, cats) -> None:
+
+        for cat in cats:
+            self.splits(cat)
+            self.tokens(cat)
+
+    # character count indexes over the inner categories and their words, used to skip categories
+    # that cannot reach a score cutoff, categories added after this call are never skipped
+    def build_candidates(self) -> None:
+
+        self.split_grams = CharGramIndex(
+            inner_cat for splits in self.split_map.values() for inner_cat, _ in splits
+        )
+        self.token_grams = CharGramIndex(
+            word for inner_cats in self.token_map.values() for inner_cat_ls in inner_cats for word in inner_cat_ls
+        )
+        self.token_id_map = {
+            cat: [
+                np.array([self.token_grams.id_of(word) for word in dict.fromkeys(inner_cat_ls)], dtype=np.int64)
+                for inner_cat_ls in inner_cats
+            ]
+            for cat, inner_cats in self.token_map.items()
+        }
+
+    # new index for the categories cats (copy-on-write), entries of kept categories and the character
+    # indexes are shared, only new categories are split and tokenized (they are never pruned until
+    # build_candidates runs again since they are missing from the character indexes)
+    def updated(self, cats) -> "CategoryIndex":
+
+        cats = set(cats)
+        res = CategoryIndex(self.engine, self.lemmatize, **self.kwargs)
+        res.split_map = {cat: val for cat, val in self.split_map.items() if cat in cats}
+        res.token_map = {cat: val for cat, val in self.token_map.items() if cat in cats}
+        res.split_grams = self.split_grams
+        res.token_grams = self.token_grams
+        res.token_id_map = {cat: val for cat, val in self.token_id_map.items() if cat in cats}
+        res.add(cats - res.token_map.keys())
+
+        return res
+
+    def __contains__(self, cat: str) -> bool:
+
+        return cat in self.token_map
+
+    def __len__(self) -> int:
+
+        return len(self.token_map)
@@ -0,0 +1,93 @@
+from functools import lru_cache
+import re
+
+from rapidfuzz.distance import Indel, Levenshtein
+import numpy as np
+
+# fuzzywuzzy's full_process: latin-1 characters removed, other non alphanumeric characters replaced by
+# spaces, lowered and stripped
+LATIN1 = dict.fromkeys(range(128, 256))
+NON_ALNUM = re.compile(r"(?ui)\W")
+
+
+# partial_ratio of fuzzywuzzy (with python-Levenshtein): the shorter string is aligned at the start of
+# every matching block of a Levenshtein alignment only (not at the optimal alignment
+# rapidfuzz.fuzz.partial_ratio finds) and the best Indel ratio of those windows is rounded,
+# above 0.995 it is 100. The alignment and window ratios are rapidfuzz C calls
+def partial_ratio(s1: str, s2: str) -> int:
+
+    if s1 == s2:
+        return 100
+    if not s1 or not s2:
+        return 0
+
+    shorter, longer = (s1, s2) if len(s1) <= len(s2) else (s2, s1)
+    n = len(shorter)
+    # the final empty block aligns the end of the strings, windows are scored once per start
+    starts = {max(len(longer) - n, 0)}
+    starts.update(max(block.b - block.a, 0) for block in Levenshtein.opcodes(shorter, longer).as_matching_blocks())
+    best = max(Indel.normalized_similarity(shorter, longer[start:start + n]) for start in starts)
+
+    return 100 if best > .995 else int(round(100 * best))
+
+
+# full_process of the string with its tokens sorted, as fuzzywuzzy's partial_token_sort_ratio compares them
+@lru_cache(maxsize=100000)
+def sorted_tokens(s: str) -> str:
+
+    return " ".join(sorted(NON_ALNUM.sub(" ", s.translate(LATIN1)).lower().strip().split())).strip()
+
+
+# RapidFuzzScorer gives the scores of fuzzywuzzy (same preprocessing, partial alignment and rounding, so
+# the same ranking and tie order) computed with rapidfuzz, the processed choices are memoized
+class RapidFuzzScorer:
+
+    def partial_ratio(self, query: str, choices: list[str]) -> np.ndarray:
+
+        return np.array([partial_ratio(choice, query) for choice in choices], dtype=np.float64)
+
+    def partial_token_sort_ratio(self, query: str, choices: list[str]) -> np.ndarray:
+
+        query = sorted_tokens(query)
+        return np.array([partial_ratio(query, sorted_tokens(choice)) for choice in choices], dtype=np.float64)
+
+
+# FuzzyWuzzyScorer is the per pair fuzzywuzzy scoring, the reference RapidFuzzScorer is compared with
+class FuzzyWuzzyScorer:
+    def __init__(self) -> None:
+
+        from fuzzywuzzy import fuzz as fuzzywuzzy
+
+        self.fuzz = fuzzywuzzy
+
+    def partial_ratio(self, query: str, choices: list[str]) -> np.ndarray:
+
+        return np.array([self.fuzz.partial_ratio(choice, query) for choice in choices], dtype=np.float64)
+
+    def partial_token_sort_ratio(self, query: str, choices: list[str]) -> np.ndarray:
+
+        return np.array([self.fuzz.partial_token_sort_ratio(query, choice) for choice in choices], dtype=np.float64)
+
+
+SCORERS = {"rapidfuzz": RapidFuzzScorer, "fuzzywuzzy": FuzzyWuzzyScorer}
+
+
+def create_scorer(backend: str = "rapidfuzz"):
+
+    if backend not in SCORERS:
+        raise ValueError(f"unknown fuzzy scoring backend {backend}, expected one of {list(SCORERS)}")
+
+    return SCORERS[backend]()
+
+
+# max score of every group of consecutive choices (group i is choices offsets[i]:offsets[i+1]),
+# 0 for empty groups
+def group_max(scores: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+
+    res = np.zeros(len(offsets) - 1, dtype=np.float64)
+    filled = np.diff(offsets) > 0
+
+    if filled.any():
+        res[filled] = np.maximum.reduceat(scores, offsets[:-1][filled])
+
+    return res
@@ -0,0 +1,124 @@
+from contextlib import contextmanager, nullcontext
+from collections import defaultdict
+import threading
+import time
+
+
+# Instrumentation aggregates per stage wall time, candidate set sizes before/after filters and call
+# counters (Levenshtein ratio / fuzz), every record is also passed to the registered hooks as
+# hook(kind, name, value) with kind one of "time", "size" or "count"
+class Instrumentation:
+    enabled = True
+
+    def __init__(self, prefix: str = "product_engine") -> None:
+
+        self.prefix = prefix
+        self.hooks = []
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+
+        self.stage_seconds: dict[str, float] = defaultdict(float)
+        self.stage_calls: dict[str, int] = defaultdict(int)
+        self.candidates_before: dict[str, int] = defaultdict(int)
+        self.candidates_after: dict[str, int] = defaultdict(int)
+        self.counters: dict[str, int] = defaultdict(int)
+
+    def add_hook(self, hook) -> None:
+
+        self.hooks.append(hook)
+
+    def remove_hook(self, hook) -> None:
+
+        self.hooks.remove(hook)
+
+    @contextmanager
+    def stage(self, name: str):
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_time(name, time.perf_counter() - start)
+
+    def record_time(self, name: str, seconds: float) -> None:
+
+        with self.lock:
+            self.stage_seconds[name] += seconds
+            self.stage_calls[name] += 1
+
+        for hook in self.hooks:
+            hook("time", name, seconds)
+
+    def record_sizes(self, name: str, before: int, after: int) -> None:
+
+        with self.lock:
+            self.candidates_before[name] += before
+            self.candidates_after[name] += after
+
+        for hook in self.hooks:
+            hook("size", name, (before, after))
+
+    def count(self, name: str, n: int = 1) -> None:
+
+        with self.lock:
+            self.counters[name] += n
+
+        for hook in self.hooks:
+            hook("count", name, n)
+
+    # records a hook record again, add_hook(other.record) forwards every record to other
+    def record(self, kind: str, name: str, value) -> None:
+
+        if kind == "time":
+            self.record_time(name, value)
+        elif kind == "size":
+            self.record_sizes(name, *value)
+        else:
+            self.count(name, value)
+
+    # Prometheus text exposition format of the aggregated values
+    def to_prometheus(self) -> str:
+
+        metrics = [
+            ("stage_seconds_total", "Wall time spent per stage", "stage", self.stage_seconds),
+            ("stage_calls_total", "Number of times a stage ran", "stage", self.stage_calls),
+            ("candidates_before_total", "Candidates entering a filter stage", "stage", self.candidates_before),
+            ("candidates_after_total", "Candidates kept by a filter stage", "stage", self.candidates_after),
+            ("calls_total", "Similarity function calls", "function", self.counters),
+        ]
+        lines = []
+
+        with self.lock:
+            for name, help_text, label, values in metrics:
+                lines.append(f"# HELP {self.prefix}_{name} {help_text}")
+                lines.append(f"# TYPE {self.prefix}_{name} counter")
+                for key, value in sorted(values.items()):
+                    lines.append(f'{self.prefix}_{name}{{{label}="{key}"}} {value}')
+
+        return "\n".join(lines) + "\n"
+
+
+# NullInstrumentation is the default, every method is a no-op so disabled instrumentation costs one call
+class NullInstrumentation:
+    enabled = False
+
+    def stage(self, name: str):
+
+        return nullcontext()
+
+    def record_time(self, name: str, seconds: float) -> None:
+        pass
+
+    def record_sizes(self, name: str, before: int, after: int) -> None:
+        pass
+
+    def count(self, name: str, n: int = 1) -> None:
+        pass
+
+    def record(self, kind: str, name: str, value) -> None:
+        pass
+
+
+NULL_INSTRUMENTATION = NullInstrumentation()
@@ -0,0 +1,75 @@
+import json
+import threading
+
+
+# LazyLemmatizer defers importing nltk and loading WordNet until a word missing from the lemma table is
+# lemmatized, so constructing an engine costs nothing and a catalog fully covered by the table never
+# loads WordNet. With download=False it never touches the network (WordNet must be installed),
+# otherwise WordNet is downloaded only when it is not found locally
+class LazyLemmatizer:
+    def __init__(self, download: bool = True, table: dict[str, str] | str | None = None) -> None:
+
+        self.download = download
+        self.table: dict[str, str] = self.load_table(table) if isinstance(table, str) else dict(table or {})
+        self.lemmatizer = None
+        self.lock = threading.Lock()
+
+    # the lock and the loaded WordNet lemmatizer are not sent to pool workers
+    def __getstate__(self) -> dict:
+
+        return {"download": self.download, "table": self.table}
+
+    def __setstate__(self, state: dict) -> None:
+
+        self.__dict__.update(state)
+        self.lemmatizer = None
+        self.lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+
+        return self.lemmatizer is not None
+
+    def load(self):
+
+        with self.lock:
+            if self.lemmatizer is None:
+                import nltk
+                from nltk.stem import WordNetLemmatizer
+
+                if self.download:
+                    try:
+                        nltk.data.find("corpora/wordnet")
+                    except LookupError:
+                        nltk.download("wordnet", quiet=True)
+
+                self.lemmatizer = WordNetLemmatizer()
+
+        return self.lemmatizer
+
+    def lemmatize(self, word: str) -> str:
+
+        res = self.table.get(word)
+        if res is not None:
+            return res
+
+        lemmatizer = self.lemmatizer if self.lemmatizer is not None else self.load()
+        return lemmatizer.lemmatize(word)
+
+    # lemmas of every word with WordNet, to be saved and loaded as the table of later processes
+    def build_table(self, words) -> dict[str, str]:
+
+        lemmatizer = self.load()
+        return {word: lemmatizer.lemmatize(word) for word in dict.fromkeys(words)}
+
+    @staticmethod
+    def load_table(path: str) -> dict[str, str]:
+
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+
+    @staticmethod
+    def save_table(path: str, table: dict[str, str]) -> None:
+
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(table, f, ensure_ascii=False)
@@ -0,0 +1,101 @@
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import threading
+import os
+
+import numpy as np
+
+# engine copy of a pool worker, set once by the pool initializer
+_worker_engine = None
+
+
+def _init_worker(engine) -> None:
+
+    global _worker_engine
+    _worker_engine = engine
+
+
+def _score_categories(
+    cats: list[str], column_name: str, txt_ls: list[str], method: str, lemmatize: bool, cutoff: float | None, kwargs: dict
+):
+
+    return _worker_engine.score_categories(cats, column_name, txt_ls, method, lemmatize, cutoff=cutoff, **kwargs)
+
+
+def _sku_scores(values: list[str], column: str, txt_ls: list[str], cutoff: float | None) -> np.ndarray:
+
+    return _worker_engine.sku_average_scores(values, column, txt_ls, cutoff)
+
+
+# ParallelScorer shards unique categories or sku rows of large queries across a process pool,
+# the workers receive the engine (with its category indexes and token caches) once at pool startup
+class ParallelScorer:
+    def __init__(self, engine, n_jobs: int = -1, min_categories: int = 500, min_rows: int = 5000) -> None:
+
+        self.engine = engine
+        self.n_jobs = n_jobs if n_jobs > 0 else os.cpu_count() or 1
+        self.min_categories = min_categories
+        self.min_rows = min_rows
+        self.pool: ProcessPoolExecutor | None = None
+        self.lock = threading.Lock()
+
+    def executor(self) -> ProcessPoolExecutor:
+
+        # spawned (not forked) workers, forking after the executor threads started can deadlock them
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(
+                max_workers=self.n_jobs,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(self.engine,),
+            )
+
+        return self.pool
+
+    def chunks(self, values) -> list:
+
+        return [chunk for chunk in np.array_split(np.asarray(values, dtype=object), self.n_jobs) if len(chunk)]
+
+    def score_categories(
+        self, cats, column_name: str, txt_ls: list[str], method: str, lemmatize: bool, cutoff: float | None, kwargs: dict
+    ) -> dict[str, float]:
+
+        futures = self.submit(
+            (_score_categories, list(chunk), column_name, txt_ls, method, lemmatize, cutoff, kwargs)
+            for chunk in self.chunks(cats)
+        )
+
+        # chunks are merged in order, so ties resolve like the serial scorer
+        cat_scores = {}
+        for future in futures:
+            cat_scores.update(future.result())
+
+        return cat_scores
+
+    def sku_average_scores(self, values, column: str, txt_ls: list[str], cutoff: float | None = None) -> np.ndarray:
+
+        futures = self.submit((_sku_scores, list(chunk), column, txt_ls, cutoff) for chunk in self.chunks(values))
+
+        return np.concatenate([future.result() for future in futures])
+
+    # the tasks of one query are submitted together, a reset cannot shut the pool down in between
+    def submit(self, tasks) -> list:
+
+        with self.lock:
+            pool = self.executor()
+            return [pool.submit(*task) for task in tasks]
+
+    # the pool is restarted lazily so workers pick up rebuilt indexes and caches, the old pool finishes
+    # the chunks already submitted (queries running in other threads) and then exits
+    def reset(self) -> None:
+
+        with self.lock:
+            if self.pool is not None:
+                self.pool.shutdown(wait=False)
+                self.pool = None
+
+    def close(self) -> None:
+
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
@@ -0,0 +1,268 @@
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from search_engine.instrumentation import Instrumentation, NULL_INSTRUMENTATION
+
+
+# CatalogStats are the statistics of one catalog version used to plan queries: rows per brand,
+# categories per brand, words per category and document frequency of the sku tokens
+class CatalogStats:
+    def __init__(self, engine, df: pd.DataFrame, brand_column: str, category_column: str, sku_column: str) -> None:
+
+        self.rows = len(df)
+        self.brands = df[brand_column].nunique(dropna=False)
+        self.brand_rows = df.groupby(brand_column, sort=False, observed=True).indices
+        self.brand_categories = (
+            df.groupby(brand_column, sort=False, observed=True)[category_column].nunique(dropna=False).to_dict()
+        )
+        self.brand_words = {brand: len(str(brand).split(" ")) for brand in self.brand_rows}
+        self.categories = df[category_column].nunique(dropna=False)
+
+        cats = df[category_column].dropna().unique()
+        self.category_words = float(np.mean([len(str(cat).split(" ")) for cat in cats])) if len(cats) else 0.0
+
+        cache = engine.token_caches.get(sku_column)
+        if cache is not None:
+            table = cache.table
+            counts = np.bincount(table.ids, minlength=len(table.vocab))
+            self.token_frequency = dict(zip(table.vocab, counts.tolist()))
+            self.tokens_per_value = len(table.ids) / max(len(table), 1)
+        else:
+            self.token_frequency = {}
+            self.tokens_per_value = float(df[sku_column].head(1000).str.count(" ").mean() + 1) if len(df) else 0.0
+
+
+# PlanStage is one stage of a plan with its estimated and (once executed) actual cost, the cost is the
+# number of Levenshtein ratio calls and the rows are the rows kept by the stage
+class PlanStage:
+    def __init__(self, name: str, method: str, estimated_calls: int, estimated_rows: int, skip_reason: str | None) -> None:
+
+        self.name = name
+        self.method = method
+        self.estimated_calls = estimated_calls
+        self.estimated_rows = estimated_rows
+        self.skip_reason = skip_reason
+        self.actual_calls: int | None = None
+        self.actual_rows: int | None = None
+        self.seconds: float | None = None
+
+    @property
+    def skipped(self) -> bool:
+
+        return self.skip_reason is not None
+
+
+class QueryPlan:
+    def __init__(self, query: str, stages: list[PlanStage]) -> None:
+
+        self.query = query
+        self.stages = stages
+        self.rows: np.ndarray | None = None
+
+    def explain(self) -> str:
+
+        lines = [
+            f"query: {self.query!r}",
+            f"{'stage':<24}{'method':<16}{'action':<8}{'est calls':>11}{'act calls':>11}{'est rows':>10}{'act rows':>10}{'ms':>9}",
+        ]
+
+        def actual(val, fmt: str = "") -> str:
+
+            return "-" if val is None else format(val, fmt)
+
+        for stage in self.stages:
+            lines.append(
+                f"{stage.name:<24}{stage.method:<16}{'skip' if stage.skipped else 'run':<8}{stage.estimated_calls:>11}"
+                f"{actual(stage.actual_calls):>11}{stage.estimated_rows:>10}{actual(stage.actual_rows):>10}"
+                f"{actual(None if stage.seconds is None else stage.seconds * 1000, '.2f'):>9}"
+            )
+            if stage.skipped:
+                lines.append(f"  skipped: {stage.skip_reason}")
+
+        return "\n".join(lines)
+
+
+# QueryPlanner runs the exact -> partial -> inverse pipeline of sales_data_app.retrieve_result with a
+# plan built from the catalog statistics and the query shape. Every stage is planned with an estimated
+# cost and output size, and a stage that cannot narrow its input (one brand or one category left, one
+# row left) is skipped since it would return its input unchanged. The scoring methods are the
+# configured ones, the methods score differently so substituting a cheaper one would change results.
+# Stages are re-planned on the actual rows of the previous stage before they run, queries run on the
+# BoundPlanner returned by bind
+class QueryPlanner:
+    def __init__(
+        self,
+        brand_column: str = "brand_lower",
+        category_column: str = "product_line_clean",
+        sku_column: str = "sku",
+        brand_method: str = "max_win_score",
+        category_method: str = "combine_score",
+        **kwargs
+    ) -> None:
+
+        self.brand_column = brand_column
+        self.category_column = category_column
+        self.sku_column = sku_column
+        self.brand_method = brand_method
+        self.category_method = category_method
+        self.kwargs = kwargs
+        self.binding: BoundPlanner | None = None
+        self.lock = threading.Lock()
+
+    # the planner of one engine and DataFrame, statistics are only rebuilt when the planner is used with
+    # another engine or (reloaded) DataFrame, a query keeps the binding it started with
+    def bind(self, engine, df: pd.DataFrame) -> "BoundPlanner":
+
+        with self.lock:
+            binding = self.binding
+            if binding is None or binding.engine is not engine or binding.df is not df:
+                stats = CatalogStats(engine, df, self.brand_column, self.category_column, self.sku_column)
+                binding = self.binding = BoundPlanner(self, engine, df, stats)
+
+        return binding
+
+    def exact_skip(self, brands: int) -> str | None:
+
+        return f"{brands} brand in the candidate rows, exact_match cannot narrow them" if brands <= 1 else None
+
+    def partial_skip(self, categories: int) -> str | None:
+
+        return f"{categories} category in the candidate rows, partial_match keeps all of them" if categories <= 1 else None
+
+    def inverse_skip(self, rows: int) -> str | None:
+
+        return f"{rows} candidate row, inverse_partial_match returns it unchanged" if rows <= 1 else None
+
+
+# BoundPlanner plans and runs queries on one engine and DataFrame with the statistics built for them,
+# it is not modified after creation so queries running while the planner is rebound are not affected
+class BoundPlanner:
+    def __init__(self, planner: QueryPlanner, engine, df: pd.DataFrame, stats: CatalogStats) -> None:
+
+        self.planner = planner
+        self.engine = engine
+        self.df = df
+        self.stats = stats
+
+    def plan(self, txt: str) -> QueryPlan:
+
+        planner, stats = self.planner, self.stats
+        words = self.engine.text_to_list(txt, lemmatize=False)
+        txt_n = len(words)
+
+        named = [word for word in dict.fromkeys(words) if word in stats.brand_rows]
+        if named:
+            exact_calls, exact_rows = 0, sum(len(stats.brand_rows[brand]) for brand in named)
+        else:
+            exact_calls = sum(max(0, txt_n - n + 1) for n in stats.brand_words.values())
+            exact_rows = stats.rows
+        exact = PlanStage(
+            "exact_match", planner.brand_method, exact_calls, exact_rows, planner.exact_skip(stats.brands)
+        )
+
+        categories = stats.brand_categories.get(named[0], 0) if len(named) == 1 else stats.categories
+        cat_n = max(int(round(stats.category_words)), 1)
+        partial = PlanStage(
+            "partial_match",
+            planner.category_method,
+            int(categories * max(0, txt_n - cat_n + 1) * cat_n * cat_n),
+            exact_rows // max(categories, 1),
+            planner.partial_skip(categories),
+        )
+
+        rows = partial.estimated_rows
+        vocab = min(rows * stats.tokens_per_value, len(stats.token_frequency) or rows * stats.tokens_per_value)
+        matching = sum(stats.token_frequency.get(word, 0) for word in self.engine.text_to_list(txt))
+        inverse = PlanStage(
+            "inverse_partial_match",
+            "average_max",
+            int(txt_n * vocab),
+            min(rows, max(matching, 5)),
+            planner.inverse_skip(rows),
+        )
+
+        return QueryPlan(txt, [exact, partial, inverse])
+
+    # runs the plan, every stage is re-planned on the actual candidate rows before it runs, the ratio
+    # calls of the stages are counted with an enabled instrumentation of this call only
+    def execute(self, plan: QueryPlan, instrumentation: Instrumentation = NULL_INSTRUMENTATION) -> np.ndarray:
+
+        engine = self.engine.with_instrumentation(instrumentation) if instrumentation.enabled else self.engine
+        planner, df = self.planner, self.df
+        exact, partial, inverse = plan.stages
+        rows = np.arange(len(df))
+
+        exact.skip_reason = planner.exact_skip(self.stats.brands)
+        rows = self.run_stage(
+            exact,
+            rows,
+            lambda rows: engine.exact_match_rows(df, planner.brand_column, plan.query, method=planner.brand_method),
+            instrumentation,
+        )
+
+        partial.skip_reason = planner.partial_skip(self.categories(rows))
+        rows = self.run_stage(
+            partial,
+            rows,
+            lambda rows: engine.partial_match_rows(
+                df, planner.category_column, plan.query, method=planner.category_method, rows=rows, **planner.kwargs
+            ),
+            instrumentation,
+        )
+
+        inverse.skip_reason = planner.inverse_skip(len(rows))
+        rows = self.run_stage(
+            inverse,
+            rows,
+            lambda rows: engine.inverse_partial_match_rows(df, planner.sku_column, plan.query, rows=rows),
+            instrumentation,
+        )
+
+        plan.rows = rows
+        return rows
+
+    def run_stage(self, stage: PlanStage, rows: np.ndarray, run, instrumentation: Instrumentation) -> np.ndarray:
+
+        calls = instrumentation.counters.get("ratio", 0) if instrumentation.enabled else None
+        start = time.perf_counter()
+
+        res = rows if stage.skipped else run(rows)
+
+        stage.seconds = time.perf_counter() - start
+        stage.actual_rows = len(res)
+        if calls is not None:
+            stage.actual_calls = instrumentation.counters.get("ratio", 0) - calls
+
+        return res
+
+    # distinct categories of the candidate rows, taken from the statistics when they are the rows of one brand
+    def categories(self, rows: np.ndarray) -> int:
+
+        stats = self.stats
+        if len(rows) == stats.rows:
+            return stats.categories
+
+        brand = self.df[self.planner.brand_column].iloc[rows[0]] if len(rows) else None
+        if brand in stats.brand_rows and len(stats.brand_rows[brand]) == len(rows):
+            return stats.brand_categories[brand]
+
+        return self.df[self.planner.category_column].iloc[rows].nunique(dropna=False)
+
+    def rows(self, txt: str) -> np.ndarray:
+
+        return self.execute(self.plan(txt))
+
+    # runs the query and returns its plan with estimated and actual costs, the ratio calls are counted
+    # with an Instrumentation of this call, its records also go to the engine's own instrumentation
+    def explain(self, txt: str) -> QueryPlan:
+
+        instrumentation = Instrumentation()
+        if self.engine.instrumentation.enabled:
+            instrumentation.add_hook(self.engine.instrumentation.record)
+
+        plan = self.plan(txt)
+        self.execute(plan, instrumentation)
+        return plan
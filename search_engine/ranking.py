@@ -0,0 +1,86 @@
+import numpy as np
+import pandas as pd
+
+
+# positions of the k first values in sorted order (same as a stable sort_values followed by head(k):
+# ties keep their original order and NaN go last), only the k best values are sorted, the rest is
+# discarded with a linear partition
+def top_k(values, k: int, ascending: bool = True) -> np.ndarray:
+
+    positions, values, nan_positions = split_nan(np.asarray(values))
+    kth = kth_index(len(values), k, ascending)
+    partitioned = np.partition(values, kth) if kth is not None else values
+
+    return select_top_k(positions, values, nan_positions, partitioned, k, ascending)
+
+
+def top_k_rows(df: pd.DataFrame, column: str, k: int, ascending: bool = True) -> pd.DataFrame:
+
+    return df.iloc[top_k(df[column].to_numpy(), k, ascending)]
+
+
+# several top k views of one frame, views maps a name to (column, k, ascending), the views of a column
+# are computed in one pass over it: one partition places the kth value of every view of the column
+def top_k_views(df: pd.DataFrame, views: dict[str, tuple[str, int, bool]]) -> dict[str, pd.DataFrame]:
+
+    by_column: dict[str, list[tuple[str, int, bool]]] = {}
+    for name, (column, k, ascending) in views.items():
+        by_column.setdefault(column, []).append((name, k, ascending))
+
+    res = {}
+    for column, column_views in by_column.items():
+        positions, values, nan_positions = split_nan(df[column].to_numpy())
+        kths = {kth_index(len(values), k, ascending) for _, k, ascending in column_views} - {None}
+        partitioned = np.partition(values, sorted(kths)) if kths else values
+
+        for name, k, ascending in column_views:
+            res[name] = df.iloc[select_top_k(positions, values, nan_positions, partitioned, k, ascending)]
+
+    return {name: res[name] for name in views}
+
+
+# positions and values of the non NaN values, and positions of the NaN values
+def split_nan(values: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+
+    positions = np.arange(len(values))
+    if values.dtype.kind in "fcmMO":
+        mask = np.asarray(pd.isna(values))
+        if mask.any():
+            return positions[~mask], values[~mask], positions[mask]
+
+    return positions, values, positions[:0]
+
+
+# index of the kth value in a partition of m values, None when all or none of them are kept
+def kth_index(m: int, k: int, ascending: bool) -> int | None:
+
+    if not 0 < k < m:
+        return None
+
+    return k - 1 if ascending else m - k
+
+
+# top k positions given values partitioned at kth_index (values when it is None)
+def select_top_k(
+    positions: np.ndarray, values: np.ndarray, nan_positions: np.ndarray, partitioned: np.ndarray, k: int, ascending: bool
+) -> np.ndarray:
+
+    k = max(0, min(k, len(values) + len(nan_positions)))
+    kth = kth_index(len(values), k, ascending)
+
+    if kth is not None:
+        kth_value = partitioned[kth]
+        better = np.flatnonzero(values < kth_value if ascending else values > kth_value)
+        ties = np.flatnonzero(values == kth_value)[:k - len(better)]
+        keep = np.sort(np.concatenate([better, ties]))
+        positions, values = positions[keep], values[keep]
+    elif k == 0:
+        positions, values = positions[:0], values[:0]
+
+    if ascending:
+        order = np.argsort(values, kind="stable")
+    else:
+        # stable descending order, ties stay in their original order
+        order = (len(values) - 1 - np.argsort(values[::-1], kind="stable"))[::-1]
+
+    return np.concatenate([positions[order], nan_positions[:k - len(order)]])
@@ -0,0 +1,89 @@
+from collections import OrderedDict
+import threading
+import time
+import sys
+
+import pandas as pd
+import numpy as np
+
+
+# ResultCache is a LRU cache of query results bounded by entry count and memory, with TTL expiry,
+# it stores the row index of a result instead of a copied DataFrame and is tied to one DataFrame
+class ResultCache:
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 64 * 1024 * 1024, ttl: float = 300.0) -> None:
+
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.entries: OrderedDict[tuple, tuple[float, np.ndarray, int]] = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.source: pd.DataFrame | None = None
+        self.lock = threading.Lock()
+
+    # clears the cache when results are requested for another (reloaded) DataFrame
+    def bind(self, df: pd.DataFrame) -> None:
+
+        with self.lock:
+            self._bind(df)
+
+    def _bind(self, df: pd.DataFrame) -> None:
+
+        if self.source is not df:
+            self._clear()
+            self.source = df
+
+    # rows of a cached result of df, binding the cache to df and lookup are one step under the lock
+    def get(self, df: pd.DataFrame, key: tuple) -> np.ndarray | None:
+
+        with self.lock:
+            self._bind(df)
+            entry = self.entries.get(key)
+
+            if entry is None or time.monotonic() - entry[0] > self.ttl:
+                if entry is not None:
+                    self._pop(key)
+                self.misses += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    # rows computed on df are dropped when the cache was bound to another DataFrame meanwhile
+    def put(self, df: pd.DataFrame, key: tuple, rows: np.ndarray) -> None:
+
+        size = rows.nbytes + sum(sys.getsizeof(part) for part in key)
+        if size > self.max_bytes:
+            return
+
+        with self.lock:
+            if self.source is not df:
+                return
+            if key in self.entries:
+                self._pop(key)
+
+            self.entries[key] = (time.monotonic(), rows, size)
+            self.nbytes += size
+
+            while len(self.entries) > self.max_entries or self.nbytes > self.max_bytes:
+                self._pop(next(iter(self.entries)))
+
+    def clear(self) -> None:
+
+        with self.lock:
+            self._clear()
+
+    def _clear(self) -> None:
+
+        self.entries.clear()
+        self.nbytes = 0
+
+    def _pop(self, key: tuple) -> None:
+
+        self.nbytes -= self.entries.pop(key)[2]
+
+    def __len__(self) -> int:
+
+        return len(self.entries)
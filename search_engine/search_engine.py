@@ -1,46 +1,193 @@
-from nltk.stem import WordNetLemmatizer
 from Levenshtein import ratio
+from functools import lru_cache
+import itertools
 import pandas as pd
 import numpy as np
-import nltk
 import re
 
-
+from search_engine.batch_output import ParquetSink
+from search_engine.batch_scoring import encode_tokens, average_max_scores, batch_average_max_scores
+from search_engine.candidate_index import EPS
+from search_engine.catalog_loader import CatalogLoader
+from search_engine.catalog_update import upsert_frame, keep_mask
+from search_engine.category_index import CategoryIndex
+from search_engine.instrumentation import Instrumentation, NULL_INSTRUMENTATION
+from search_engine.lemmatizer import LazyLemmatizer
+from search_engine.parallel import ParallelScorer
+from search_engine.shared_catalog import SharedCatalog
+from search_engine.token_cache import TokenCache
+
+
+# WordNet is loaded on the first lemmatization of a word missing from lemma_table (a dict or the path
+# of a table saved by save_lemma_table), with download_wordnet=False it is never downloaded (offline hosts)
 class SmallSearchEngine:
-    def __init__(self) -> None:
+    def __init__(
+        self, lemma_cache_size: int | None = 100000, tokenize_cache_size: int | None = 50000,
+        download_wordnet: bool = True, lemma_table: dict[str, str] | str | None = None
+    ) -> None:
+
+        self.lemma = LazyLemmatizer(download_wordnet, lemma_table)
+        self.lemma_cache_size = lemma_cache_size
+        self.tokenize_cache_size = tokenize_cache_size
+        self.create_caches()
+        self.indexes: dict[str, CategoryIndex] = {}
+        self.token_caches: dict[str, TokenCache] = {}
+        self.parallel: ParallelScorer | None = None
+        self.instrumentation: Instrumentation = NULL_INSTRUMENTATION
+
+    # bounded LRU memoization of single word lemmas and whole string tokenization (lru_cache is thread-safe)
+    def create_caches(self) -> None:
+
+        self.lemmatize_word = lru_cache(maxsize=self.lemma_cache_size)(self.lemma.lemmatize)
+        self.tokenize = lru_cache(maxsize=self.tokenize_cache_size)(self.split_text)
+
+    # the engine is sent to pool workers without its caches and pool, they are recreated on unpickling
+    def __getstate__(self) -> dict:
+
+        state = self.__dict__.copy()
+        for name in ("lemmatize_word", "tokenize", "parallel", "instrumentation"):
+            state.pop(name, None)
+
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+
+        self.__dict__.update(state)
+        self.parallel = None
+        self.instrumentation = NULL_INSTRUMENTATION
+        self.create_caches()
+
+    # enables per stage timing, candidate sizes and ratio call counts (see Instrumentation)
+    def instrument(self, instrumentation: Instrumentation | None = None) -> Instrumentation:
+
+        self.instrumentation = instrumentation if instrumentation is not None else Instrumentation()
+        return self.instrumentation
 
-        nltk.download("wordnet",quiet=True)
-        self.lemma = WordNetLemmatizer()
+    def disable_instrumentation(self) -> None:
 
-    def read_df_parquet(self, path: str) -> pd.DataFrame:
+        self.instrumentation = NULL_INSTRUMENTATION
+
+    # view of the engine sharing its indexes, caches and pool with another instrumentation, e.g. per call
+    # counters that concurrent queries on the engine do not touch
+    def with_instrumentation(self, instrumentation: Instrumentation) -> "SmallSearchEngine":
+
+        view = SmallSearchEngine.__new__(SmallSearchEngine)
+        view.__dict__.update(self.__dict__)
+        view.instrumentation = instrumentation
+        return view
+
+    # opt-in process pool scoring, queries with fewer categories / sku rows than the thresholds stay serial
+    def enable_parallel(self, n_jobs: int = -1, min_categories: int = 500, min_rows: int = 5000) -> ParallelScorer:
+
+        self.disable_parallel()
+        self.parallel = ParallelScorer(self, n_jobs, min_categories, min_rows)
+        return self.parallel
+
+    def disable_parallel(self) -> None:
+
+        if self.parallel is not None:
+            self.parallel.close()
+            self.parallel = None
+
+    # pool workers hold a snapshot of the indexes and token caches, restart them when those change
+    def catalog_changed(self) -> None:
+
+        if self.parallel is not None:
+            self.parallel.reset()
+
+    # token_column values are tokenized once at load time (see load_token_cache),
+    # with a loader the file is streamed in batches with compact dtypes (see CatalogLoader)
+    def read_df_parquet(
+        self, path: str, token_column: str | None = "sku", persist_tokens: bool = False,
+        loader: CatalogLoader | None = None
+    ) -> pd.DataFrame:
 
-        df = pd.read_parquet(path)
+        df = pd.read_parquet(path) if loader is None else loader.read_parquet(path)
+        self.invalidate_index()
+        self.load_token_cache(df, token_column, path if persist_tokens else None)
         return df
 
-    def read_df_csv(self, path: str, index_col: int = -1) -> pd.DataFrame:
+    def read_df_csv(
+        self, path: str, index_col: int = -1, token_column: str | None = "sku", persist_tokens: bool = False,
+        loader: CatalogLoader | None = None
+    ) -> pd.DataFrame:
 
-        if index_col > -1:
+        if loader is not None:
+            df = loader.read_csv(path, index_col)
+        elif index_col > -1:
             df = pd.read_csv(path, index_col=index_col)
         else:
             df = pd.read_csv(path)
 
+        self.invalidate_index()
+        self.load_token_cache(df, token_column, path if persist_tokens else None)
         return df
 
-    #Converts text to list by splitting,lowering,lemmatizing and optionally changing abbrevation of words
-    def text_to_list(
-        self, txt: str, splitter: str = " ", lower: bool = True, lemmatize: bool = True, *args, **kwargs
-    ) -> list[str]:
+    # attaches to a memory mapped SharedCatalog, the token cache and category indexes stored with it
+    # are used as they are instead of tokenizing the catalog again
+    def attach_catalog(self, catalog: SharedCatalog) -> pd.DataFrame:
+
+        df = catalog.to_pandas()
+        self.invalidate_index()
+        self.token_caches.clear()
+
+        cache = catalog.token_cache()
+        if cache is not None:
+            cache.build_candidates()
+            self.token_caches[cache.column] = cache
+
+        for column, index in catalog.category_indexes(self).items():
+            index.build_candidates()
+            self.indexes[column] = index
+
+        self.catalog_changed()
+        return df
+
+    # builds the token cache of a column, if path is given the cache is read from (or written to)
+    # a sidecar parquet file next to it and rebuilt when the column content hash does not match
+    def load_token_cache(self, df: pd.DataFrame, column: str | None, path: str | None = None) -> TokenCache | None:
+
+        self.token_caches.clear()
+        self.catalog_changed()
+        if column is None or column not in df.columns:
+            return None
+
+        content_hash = TokenCache.hash_values(df[column])
+        cache = None
+
+        if path is not None:
+            sidecar = TokenCache.sidecar_path(path, column)
+            cache = TokenCache.load(sidecar, column, content_hash)
+
+        if cache is None:
+            cache = TokenCache.build(self, df[column], column, content_hash)
+            if path is not None:
+                cache.save(sidecar)
+
+        cache.build_candidates()
+        self.token_caches[column] = cache
+        self.catalog_changed()
+        return cache
+
+    # splits, lowers and lemmatizes text, the tuple result is memoized by self.tokenize
+    def split_text(self, txt: str, splitter: str = " ", lower: bool = True, lemmatize: bool = True) -> tuple[str, ...]:
 
         if lower:
             txt = txt.lower()
 
         if lemmatize:
-            res = [
-                self.lemma.lemmatize(word) for word in txt.split(splitter)
-            ]  # Word map to root form
-        else:
-            res =  txt.strip().split(splitter)
+            return tuple(
+                self.lemmatize_word(word) for word in txt.split(splitter)
+            )  # Word map to root form
 
+        return tuple(txt.strip().split(splitter))
+
+    #Converts text to list by splitting,lowering,lemmatizing and optionally changing abbrevation of words
+    def text_to_list(
+        self, txt: str, splitter: str = " ", lower: bool = True, lemmatize: bool = True, *args, **kwargs
+    ) -> list[str]:
+
+        res = list(self.tokenize(txt, splitter, lower, lemmatize))
 
         if "abb" in kwargs:
 
@@ -50,6 +197,43 @@ class SmallSearchEngine:
                     res[i] = kwargs["abb"][res[i]]
 
         return res
+
+    # cache key of a query: every stage lowercases the query, but the window scorers depend on word order,
+    # spacing and the raw (not lemmatized) words, so only case is normalized, abbrevations are part of the key
+    def query_key(self, txt: str, **kwargs) -> tuple:
+
+        return (txt.lower(), tuple(sorted(kwargs.get("abb", {}).items())))
+
+    # hit/miss counters of the lemma and tokenization caches
+    def cache_info(self) -> dict[str, dict[str, int]]:
+
+        return {
+            name: cache.cache_info()._asdict()
+            for name, cache in (("lemmatize", self.lemmatize_word), ("tokenize", self.tokenize))
+        }
+
+    def clear_caches(self) -> None:
+
+        self.lemmatize_word.cache_clear()
+        self.tokenize.cache_clear()
+
+    # lemma table of every word of the catalog columns and of the queries, saved for fast startup, the
+    # words are also taken from the & and / splits of special_char_sep (categories are lemmatized per split)
+    def save_lemma_table(self, path: str, df: pd.DataFrame, columns: list[str], queries=()) -> dict[str, str]:
+
+        texts = itertools.chain((val for column in columns for val in df[column].unique()), queries)
+        table = self.lemma.build_table(
+            word for txt in texts for splitter in (" ", "[ &]", "[ /]") for word in re.split(splitter, txt.lower())
+        )
+        LazyLemmatizer.save_table(path, table)
+        return table
+
+    # pre-warms the lemma and tokenization caches with the catalog columns, e.g. at startup
+    def warm_up(self, df: pd.DataFrame, columns: list[str], lemmatize: bool = True) -> None:
+
+        for column in columns:
+            for val in df[column].unique():
+                self.text_to_list(val, lemmatize=lemmatize)
                 
     #Special Character Seperator such & and /
     def special_char_sep(self,txt:str,splitter:str)->list[str]:
@@ -78,102 +262,284 @@ class SmallSearchEngine:
     
     # max_win_score uses window size of category words and calculate Levenshtein similarity ratio
     # if score is >= 0.5 particuar brand df is return else all brands df
-    def max_win_score(self, cats: list[str], txt_ls: list) -> dict[str, float]:
+    # with a cutoff, inner categories whose character bound is below it for every window are skipped,
+    # scores >= cutoff are unchanged and lower ones may be reported lower (as 0)
+    def max_win_score(
+        self, cats: list[str], txt_ls: list, *args, index: CategoryIndex | None = None, cutoff: float | None = None, **kwargs
+    ) -> dict[str, float]:
+
+        if index is None:
+            index = CategoryIndex(self)
 
         txt_n = len(txt_ls)
         cat_scores = {cat: 0 for cat in cats}
+        calls = 0
+        grams = index.split_grams if cutoff is not None else None
+        window_bounds = {}
 
         for cat in cats:
-            cat_ls = self.special_char_sep(cat,splitter="&")
-        
-            if len(cat_ls)<=1:
-                cat_ls = self.special_char_sep(cat,splitter="/")
 
-            for inter_cat in cat_ls:
-                
-                n = len(inter_cat.split(" "))
+            for inter_cat, n in index.splits(cat):
+
+                if grams is not None and 0 < n <= txt_n:
+                    if n not in window_bounds:
+                        window_bounds[n] = np.max(
+                            [grams.upper_bounds(" ".join(txt_ls[i:i+n]).lower()) for i in range(txt_n-n+1)], axis=0
+                        )
+                    split_id = grams.id_of(inter_cat)
+                    if split_id >= 0 and window_bounds[n][split_id] < cutoff - EPS:
+                        continue
+
+                calls += max(0, txt_n-n+1)
                 for i in range(txt_n-n+1):
                     temp = " ".join(txt_ls[i:i+n])
-                    cat_scores[cat] = max(cat_scores[cat],ratio(inter_cat.lower(),temp.lower()))
+                    cat_scores[cat] = max(cat_scores[cat],ratio(inter_cat,temp.lower()))
 
+        self.instrumentation.count("ratio", calls)
         return cat_scores
 
     # calculate max average score by permuting all possible combination of words pair and selecting max pair score for each cat
-    def perm_avg_score(self, cat_ls: list[str], txt_ls: list[str]) -> np.float64:
+    def perm_avg_score(self, cat_ls: list[str], txt_ls: list[str]) -> float:
+
+        return self.bounded_avg_score(cat_ls, txt_ls)[0]
 
-        score = {word: 0 for word in cat_ls}
+    # perm_avg_score that gives up (returns -1.0) as soon as the scored words plus the bounds of the
+    # remaining ones (rest_bounds[k] bounds the sum of the scores of the distinct words from the k-th one,
+    # 1 per word by default) cannot reach limit, also returns the number of ratio calls
+    def bounded_avg_score(
+        self, cat_ls: list[str], txt_ls: list[str], rest_bounds: list[float] | None = None, limit: float | None = None
+    ) -> tuple[float, int]:
 
-        for word_cat in cat_ls:
+        # repeated category words are averaged once
+        cat_ls = list(dict.fromkeys(cat_ls))
+        n = len(cat_ls)
+        # numpy sums 8 values and more pairwise, their mean is left to np.mean to stay bit-identical,
+        # fewer values are summed in order like total
+        scores = [] if n >= 8 or n == 0 else None
+        total = 0.0
+        calls = 0
+        target = (limit - EPS) * n if limit is not None else None
 
+        for k, word_cat in enumerate(cat_ls):
+
+            if target is not None and total + (rest_bounds[k] if rest_bounds is not None else n - k) < target:
+                return -1.0, calls
+
+            score = 0
             for word_txt in txt_ls:
+                calls += 1
+                score = max(score, ratio(word_cat, word_txt))
+                if score >= 1.0:
+                    break
+
+            total += score
+            if scores is not None:
+                scores.append(score)
+
+        if scores is not None:
+            return float(np.mean(scores)), calls
+
+        return total / n, calls
 
-                score[word_cat] = max(score[word_cat], ratio(word_cat, word_txt))
+    # suffix sums of the character bounds of the distinct words of an inner category, the rest_bounds of
+    # bounded_avg_score (None when a word was added after the candidates were built)
+    def rest_bounds(self, index: CategoryIndex, cat: str, j: int, word_bounds: np.ndarray | None) -> list[float] | None:
 
-        return np.mean(list(score.values()))
+        token_ids = index.token_id_map.get(cat)
+        if word_bounds is None or token_ids is None or (token_ids[j] < 0).any():
+            return None
+
+        return np.cumsum(word_bounds[token_ids[j]][::-1])[::-1].tolist()
 
     # average_score calculate Levenshtein similarity ratio for each category with search text
     # and average max similarity ratio for each category
-    def average_score(self, cats: list[str], txt_ls: list, lemmatize: bool=True,*args,**kwargs) -> dict[str, float]:
+    # inner categories stop being scored once a category reaches 1 and are given up once their bounds cannot
+    # beat the best score of the category (or the cutoff), so kept scores are unchanged
+    def average_score(
+        self, cats: list[str], txt_ls: list, lemmatize: bool=True, *args, index: CategoryIndex | None = None,
+        cutoff: float | None = None, **kwargs
+    ) -> dict[str, float]:
+
+        if index is None:
+            index = CategoryIndex(self, lemmatize, **kwargs)
 
         cat_scores = {cat: 0 for cat in cats}
+        calls = 0
+        word_bounds = self.word_bounds(index, txt_ls)
 
         for cat in cats:
 
-            cat_ls = self.special_char_sep(cat,splitter="&")
-        
-            if len(cat_ls)<=1:
-                cat_ls = self.special_char_sep(cat,splitter="/")
-                
-            for inner_cat in cat_ls:
+            for j, inner_cat_ls in enumerate(index.tokens(cat)):
 
-                inner_cat_ls = self.text_to_list(inner_cat, splitter=" ",lower=True,lemmatize=lemmatize,*args,**kwargs)
-                cat_scores[cat] = max(cat_scores[cat],self.perm_avg_score(inner_cat_ls,txt_ls))
+                if cat_scores[cat] >= 1.0:
+                    break
 
+                if cutoff is not None and word_bounds is not None and self.below_cutoff(index, cat, j, word_bounds, cutoff):
+                    continue
+
+                limit = cat_scores[cat] if cutoff is None else max(cat_scores[cat], cutoff)
+                temp, n_calls = self.bounded_avg_score(
+                    inner_cat_ls, txt_ls, self.rest_bounds(index, cat, j, word_bounds), limit
+                )
+                calls += n_calls
+                cat_scores[cat] = max(cat_scores[cat],temp)
+
+        self.instrumentation.count("ratio", calls)
         return cat_scores
 
     # this method combines both max_win_score and average_score technique
     # it moves window of length cat words over search text (ordered)
     # each window calculates unordered average score of search text words inside the window with words in categories
-    def combine_score(self, cats: list[str], txt_ls: list[str], lemmatize:bool=True,*args,**kwargs) -> dict[str, float]:
-   
+    # windows are pruned like the inner categories of average_score
+    def combine_score(
+        self, cats: list[str], txt_ls: list[str], lemmatize:bool=True, *args, index: CategoryIndex | None = None,
+        cutoff: float | None = None, **kwargs
+    ) -> dict[str, float]:
+
+        if index is None:
+            index = CategoryIndex(self, lemmatize, **kwargs)
+
         txt_n = len(txt_ls)
         cat_scores = {cat: 0 for cat in cats}
+        calls = 0
+        word_bounds = self.word_bounds(index, txt_ls)
 
         for cat in cats:
 
-            cat_ls = self.special_char_sep(cat,splitter="&")
-        
-            if len(cat_ls)<=1:
-                cat_ls = self.special_char_sep(cat,splitter="/")
-                
-            for inner_cat in cat_ls:
-              
-                inner_cat_ls = self.text_to_list(inner_cat, splitter=" ",lower=True,lemmatize=lemmatize,*args,**kwargs)
+            for j, inner_cat_ls in enumerate(index.tokens(cat)):
+
+                if cat_scores[cat] >= 1.0:
+                    break
+
+                if cutoff is not None and word_bounds is not None and self.below_cutoff(index, cat, j, word_bounds, cutoff):
+                    continue
+
                 n = len(inner_cat_ls)
-                
+                rest_bounds = self.rest_bounds(index, cat, j, word_bounds)
+
                 for i in range(txt_n-n+1):
-                    temp = self.perm_avg_score(inner_cat_ls,txt_ls[i:i+n])
+                    if cat_scores[cat] >= 1.0:
+                        break
+
+                    limit = cat_scores[cat] if cutoff is None else max(cat_scores[cat], cutoff)
+                    temp, n_calls = self.bounded_avg_score(inner_cat_ls, txt_ls[i:i+n], rest_bounds, limit)
+                    calls += n_calls
                     cat_scores[cat] = max(cat_scores[cat],temp)
 
+        self.instrumentation.count("ratio", calls)
         return cat_scores
 
+    # best character bound of every indexed category word against any query word, the mean over the
+    # words of an inner category bounds its average_score and every combine_score window
+    def word_bounds(self, index: CategoryIndex, txt_ls: list[str]) -> np.ndarray | None:
+
+        if index.token_grams is None or len(txt_ls) == 0:
+            return None
+
+        return np.max([index.token_grams.upper_bounds(word) for word in txt_ls], axis=0)
+
+    def below_cutoff(self, index: CategoryIndex, cat: str, j: int, word_bounds: np.ndarray, cutoff: float) -> bool:
+
+        token_ids = index.token_id_map.get(cat)
+        if token_ids is None or len(token_ids[j]) == 0 or (token_ids[j] < 0).any():
+            return False
+
+        return word_bounds[token_ids[j]].mean() < cutoff - EPS
+
+    # builds (or rebuilds) the category index of a column once, exact_match and partial_match
+    # then score against it instead of splitting and lemmatizing categories on every query
+    def build_index(self, df: pd.DataFrame, column: str, lemmatize: bool = True, **kwargs) -> CategoryIndex:
+
+        index = CategoryIndex(self, lemmatize, **kwargs)
+        index.add(df[column].unique())
+        index.build_candidates()
+        self.indexes[column] = index
+        self.catalog_changed()
+
+        return index
+
+    # drops the index of a column (or all indexes), must be called when the DataFrame changes
+    def invalidate_index(self, column: str | None = None) -> None:
+
+        if column is None:
+            self.indexes.clear()
+        else:
+            self.indexes.pop(column, None)
+
+        self.catalog_changed()
+
+    # copy-on-write catalog updates, df is not modified and the returned frame replaces it, indexes and
+    # token caches are only extended with new values and swapped in one assignment, so queries running
+    # on df meanwhile keep a consistent view
+    def upsert_rows(self, df: pd.DataFrame, rows: pd.DataFrame) -> pd.DataFrame:
+
+        new_df = upsert_frame(df, rows)
+        self.update_catalog(new_df)
+        return new_df
+
+    def delete_rows(self, df: pd.DataFrame, labels) -> pd.DataFrame:
+
+        new_df = df[keep_mask(df, labels)]
+        self.update_catalog(new_df)
+        return new_df
+
+    def update_catalog(self, df: pd.DataFrame) -> None:
+
+        self.indexes = {
+            column: index.updated(df[column].unique()) if column in df.columns else index
+            for column, index in self.indexes.items()
+        }
+        self.token_caches = {
+            column: cache.updated(self, df[column]) if column in df.columns else cache
+            for column, cache in self.token_caches.items()
+        }
+        self.catalog_changed()
+
     #Method for selecting appropiate score calculator
     def calculate_score(
         self, df: pd.DataFrame, column_name: str, txt_ls: list[str], method: str, lemmatize: bool=True,*args, **kwargs
     ) -> dict[str, float]:
 
+        return self.score_categories(df[column_name].unique(), column_name, txt_ls, method, lemmatize, *args, **kwargs)
+
+    # scores the given categories of a column with the selected method, with a cutoff categories that
+    # cannot reach it are pruned (their score is only known to be below the cutoff)
+    def score_categories(
+        self, cats: list[str], column_name: str, txt_ls: list[str], method: str, lemmatize: bool=True,*args,
+        cutoff: float | None = None, **kwargs
+    ) -> dict[str, float]:
+
         assert (
             method == "average_score"
             or method == "max_win_score"
             or method == "combine_score"
         ), f"No scoring metircs name: {method}\nAvailable scoring metrics are: average_score, max_win_score and combine_score"
 
-        if method == "average_score":
-            return self.average_score(df[column_name].unique(), txt_ls,lemmatize,*args,**kwargs)
-        elif method == "max_win_score":
-            return self.max_win_score(df[column_name].unique(), txt_ls,*args, **kwargs)
-        else:
-            return self.combine_score(df[column_name].unique(), txt_ls,lemmatize,*args, **kwargs)
+        with self.instrumentation.stage(method):
+
+            if self.parallel is not None and len(cats) >= self.parallel.min_categories:
+                return self.parallel.score_categories(cats, column_name, txt_ls, method, lemmatize, cutoff, kwargs)
+
+            # categories missing from a prebuilt index (new rows) are indexed lazily on first use
+            index = self.indexes.get(column_name)
+            if index is not None and not index.matches(lemmatize, kwargs):
+                index = None
+
+            if method == "average_score":
+                return self.average_score(cats, txt_ls,lemmatize,*args,index=index,cutoff=cutoff,**kwargs)
+            elif method == "max_win_score":
+                return self.max_win_score(cats, txt_ls,*args,index=index,cutoff=cutoff,**kwargs)
+            else:
+                return self.combine_score(cats, txt_ls,lemmatize,*args,index=index,cutoff=cutoff,**kwargs)
+
+    # the *_rows methods take and return positional row arrays over the original DataFrame (None = all rows),
+    # so a query only materializes its final result; the DataFrame returning methods wrap them
+    def column_values(self, df: pd.DataFrame, column: str, rows: np.ndarray | None) -> tuple[pd.Series, np.ndarray]:
+
+        if rows is None:
+            return df[column], np.arange(len(df))
+
+        return df[column].iloc[rows], rows
 
     # exact_match function first try exact matching of brand name in search text and return that brand dataframe
     # if no exact match found, partial match is done using average_score, max_win_score or combine scoring
@@ -185,17 +551,37 @@ class SmallSearchEngine:
         method: str = "max_win_score",
     ) -> pd.DataFrame:
 
-        txt_ls = self.text_to_list(txt, lemmatize=False)
-        ind = df[column_name].isin(txt_ls)
+        return df.iloc[self.exact_match_rows(df, column_name, txt, method)]
 
-        if ind.any():
-            return df[ind]
+    def exact_match_rows(
+        self,
+        df: pd.DataFrame,
+        column_name: str,
+        txt: str,
+        method: str = "max_win_score",
+        rows: np.ndarray | None = None,
+    ) -> np.ndarray:
 
-        tp = self.calculate_score(df, column_name, txt_ls, method,lemmatize=False)
+        with self.instrumentation.stage("exact_match"):
 
-        ele = max(tp.items(), key=lambda x: x[1])
+            values, rows = self.column_values(df, column_name, rows)
+            with self.instrumentation.stage("tokenize"):
+                txt_ls = self.text_to_list(txt, lemmatize=False)
+            ind = values.isin(txt_ls).to_numpy()
 
-        return df.loc[df[column_name] == ele[0]].copy() if ele[1] >= 0.75 else df.copy()
+            if ind.any():
+                res = rows[ind]
+            else:
+                # only a category scoring >= 0.75 can be selected, lower ones are pruned
+                tp = self.score_categories(values.unique(), column_name, txt_ls, method,lemmatize=False,cutoff=0.75)
+
+                ele = max(tp.items(), key=lambda x: x[1])
+
+                # string dtypes (an attached SharedCatalog) compare to a nullable boolean, missing is not a match
+                res = rows[(values == ele[0]).to_numpy(dtype=bool, na_value=False)] if ele[1] >= 0.75 else rows
+
+        self.instrumentation.record_sizes("exact_match", len(rows), len(res))
+        return res
 
     # partial match return top_scoring product_lines using average_score or max_win_score
     def partial_match(
@@ -208,17 +594,54 @@ class SmallSearchEngine:
         *args,
         **kwargs
     ) -> pd.DataFrame:
-        
-        txt_ls = self.text_to_list(txt,splitter=" ",lower=True,lemmatize=lemmatize,*args,**kwargs)
 
-        tp = self.calculate_score(df, column_name, txt_ls, method,lemmatize=lemmatize,*args,**kwargs)
+        return df.iloc[self.partial_match_rows(df, column_name, txt, method, lemmatize, *args, **kwargs)]
 
-        tp = sorted(tp.items(), key=lambda x: x[1], reverse=True)
+    def partial_match_rows(
+        self,
+        df: pd.DataFrame,
+        column_name: str,
+        txt: str,
+        method: str = "combine_score",
+        lemmatize: bool = True,
+        *args,
+        rows: np.ndarray | None = None,
+        **kwargs
+    ) -> np.ndarray:
 
-        ind = df[column_name].isin(
-            [x for x, y in tp if y > tp[0][1]-0.1] if tp[0][1] > 0.65 else [x for x, y in tp]
-        )
-        return df[ind].copy()
+        with self.instrumentation.stage("partial_match"):
+
+            values, rows = self.column_values(df, column_name, rows)
+            with self.instrumentation.stage("tokenize"):
+                txt_ls = self.text_to_list(txt,splitter=" ",lower=True,lemmatize=lemmatize,*args,**kwargs)
+
+            kept = self.kept_categories(values.unique(), column_name, txt_ls, method, lemmatize, *args, **kwargs)
+            res = rows[values.isin(kept).to_numpy()]
+
+        self.instrumentation.record_sizes("partial_match", len(rows), len(res))
+        return res
+
+    def kept_categories(
+        self, cats, column_name: str, txt_ls: list[str], method: str, lemmatize: bool = True, *args, **kwargs
+    ) -> list[str]:
+
+        return self.select_categories(self.category_scores(cats, column_name, txt_ls, method, lemmatize, *args, **kwargs))
+
+    # categories that cannot reach 0.65-0.1 are pruned, they are never kept when the top is above 0.65
+    def category_scores(
+        self, cats, column_name: str, txt_ls: list[str], method: str, lemmatize: bool = True, *args, **kwargs
+    ) -> dict[str, float]:
+
+        return self.score_categories(cats, column_name, txt_ls, method,lemmatize=lemmatize,*args,cutoff=0.65-0.1,**kwargs)
+
+    # kept categories score above top-0.1 with top > 0.65, otherwise all are kept whatever their score,
+    # the scores of disjoint category sets (shards) can be merged before selecting
+    def select_categories(self, tp: dict[str, float]) -> list[str]:
+
+        # only the best score is needed, the kept categories are not ranked
+        top = max(tp.values())
+
+        return [x for x, y in tp.items() if y > top-0.1] if top > 0.65 else list(tp)
 
     # Above methods based on scoring categories, this method score records based on search text
     # it uses threshold of atleast n-1 words (score = (txt_n-1)/txt_n)
@@ -229,27 +652,200 @@ class SmallSearchEngine:
         self, df: pd.DataFrame, column: str, txt: str
     ) -> pd.DataFrame:
 
-        txt_ls = self.text_to_list(txt)
-        txt_n = len(txt_ls)
-        filter_vals = df[column].apply(lambda x: self.text_to_list(x))
+        return df.iloc[self.inverse_partial_match_rows(df, column, txt)]
+
+    # average of the best query word scores of every record,
+    # query word x sku token similarities are scored in one batch over the deduplicated sku vocabulary
+    # with a cutoff, records whose character bound average is below it are not scored and get -1
+    def sku_average_scores(self, values, column: str, txt_ls: list[str], cutoff: float | None = None) -> np.ndarray:
+
+        with self.instrumentation.stage("sku_scoring"):
+
+            if self.parallel is not None and len(values) >= self.parallel.min_rows:
+                return self.parallel.sku_average_scores(values, column, txt_ls, cutoff)
+
+            cache = self.token_caches.get(column)
+            records = cache.records(values) if cache is not None else None
+
+            scores = np.full(len(values), -1.0)
+            keep = np.arange(len(values))
+
+            # cached rows are scored from the token ids of the cache, others from their token lists
+            if records is not None:
+                if cutoff is not None and cache.grams is not None:
+                    keep = np.flatnonzero(cache.record_upper_bounds(txt_ls, records) >= cutoff - EPS)
+                vocab, ids, offsets = cache.encode(records[keep])
+            else:
+                filter_vals = cache.lookup(self, values) if cache is not None else [self.text_to_list(x) for x in values]
+                if cutoff is not None and cache is not None and cache.grams is not None:
+                    keep = np.flatnonzero(cache.grams.record_upper_bounds(txt_ls, filter_vals) >= cutoff - EPS)
+                    filter_vals = [filter_vals[i] for i in keep]
+                vocab, ids, offsets = encode_tokens(filter_vals)
+            self.instrumentation.count("ratio", len(txt_ls) * len(vocab))
+            self.instrumentation.record_sizes("sku_pruning", len(scores), len(keep))
+
+            scores[keep] = average_max_scores(txt_ls, vocab, ids, offsets)
+            return scores
+
+    def inverse_partial_match_rows(
+        self, df: pd.DataFrame, column: str, txt: str, rows: np.ndarray | None = None
+    ) -> np.ndarray:
 
-        thresholds = {np.around(i, decimals=2): [] for i in np.arange(0, 1.05, 0.1)}
+        with self.instrumentation.stage("inverse_partial_match"):
 
-        for sku in filter_vals.index:
-            txt_score = [0 for _ in range(txt_n)]
-            for i in range(txt_n):
-                for word in filter_vals[sku]:
+            values, rows = self.column_values(df, column, rows)
+            with self.instrumentation.stage("tokenize"):
+                txt_ls = self.text_to_list(txt)
+            thresholds, cutoff = self.inverse_thresholds(len(txt_ls))
+            res = self.threshold_rows(self.sku_average_scores(values, column, txt_ls, cutoff), thresholds, rows)
 
-                    txt_score[i] = max(txt_score[i], ratio(txt_ls[i], word))
-            txt_score.sort(reverse=True)
+        self.instrumentation.record_sizes("inverse_partial_match", len(rows), len(res))
+        return res
+
+    # score buckets of inverse_partial_match from 1 down to (txt_n-1)/txt_n, records rounding below the
+    # lowest bucket are never selected, they are pruned with the returned cutoff
+    def inverse_thresholds(self, txt_n: int) -> tuple[np.ndarray, float | None]:
+
+        thresholds = np.arange(1, (txt_n - 1) / txt_n, -0.1)
+        return thresholds, np.around(thresholds[-1], 2) - 0.05 if len(thresholds) else None
 
-            avg = np.mean(txt_score)
-            thresholds[round(avg, 1)].append(sku)
+    # rows of the best score buckets, from 1 down to the lowest threshold until at least 5 rows are kept
+    def threshold_rows(self, scores: np.ndarray, thresholds: np.ndarray, rows: np.ndarray) -> np.ndarray:
+
+        buckets = np.around(scores, 1)
 
         res_id = []
-        for threshold in np.arange(1, (txt_n - 1) / txt_n, -0.1):
-            res_id.extend(thresholds[np.around(threshold, 2)])
+        for threshold in thresholds:
+            res_id.extend(rows[buckets == np.around(threshold, 2)])
             if len(res_id) >= 5:
-                return df.loc[res_id].copy()
+                break
+
+        return np.array(res_id, dtype=rows.dtype) if len(res_id) > 0 else rows
 
-        return df.loc[res_id].copy() if len(res_id) > 0 else df.copy()
+    # batch version of the exact -> partial -> inverse pipeline of sales_data_app.retrieve_result, returns
+    # a generator of (query, rows) in input order, or with output writes the rows (columns of df, all by
+    # default) of every query to a parquet file and returns the number of queries
+    def search_many(
+        self,
+        df: pd.DataFrame,
+        queries,
+        output: str | None = None,
+        columns: list[str] | None = None,
+        batch_size: int = 10000,
+        brand_column: str = "brand_lower",
+        category_column: str = "product_line_clean",
+        sku_column: str = "sku",
+        brand_method: str = "max_win_score",
+        category_method: str = "combine_score",
+        **kwargs
+    ):
+
+        results = self.iter_search_many(
+            df, queries, batch_size, brand_column, category_column, sku_column, brand_method, category_method, **kwargs
+        )
+        if output is None:
+            return results
+
+        columns = list(df.columns) if columns is None else columns
+        count = 0
+        with ParquetSink(output) as sink:
+            for query, rows in results:
+                frame = df.iloc[rows][columns].reset_index()
+                frame.insert(0, "query", query)
+                frame.insert(1, "rank", np.arange(len(rows)))
+                sink.write(frame)
+                count += 1
+
+        return count
+
+    # queries are processed in chunks of batch_size: queries with the same query_key are searched once,
+    # grouped by detected brand so each brand slice and its categories are built once, then by kept
+    # categories so the sku tokens of a slice are encoded once and scored against the words of all
+    # its queries in one cdist call
+    def iter_search_many(
+        self, df: pd.DataFrame, queries, batch_size: int, brand_column: str, category_column: str,
+        sku_column: str, brand_method: str, category_method: str, **kwargs
+    ):
+
+        brand_rows = {brand: rows for brand, rows in df.groupby(brand_column, sort=False).indices.items() if len(rows)}
+        brand_cats = df[brand_column].unique()
+        queries = iter(queries)
+
+        while True:
+            chunk = list(itertools.islice(queries, batch_size))
+            if not chunk:
+                break
+
+            with self.instrumentation.stage("search_many"):
+                texts = {}
+                for query in chunk:
+                    texts.setdefault(self.query_key(query, **kwargs), query)
+
+                results = self.search_chunk(
+                    df, texts, brand_rows, brand_cats, brand_column, category_column, sku_column,
+                    brand_method, category_method, **kwargs
+                )
+                self.instrumentation.record_sizes("search_many", len(chunk), len(texts))
+
+            for query in chunk:
+                yield query, results[self.query_key(query, **kwargs)]
+
+    def search_chunk(
+        self, df: pd.DataFrame, texts: dict, brand_rows: dict, brand_cats, brand_column: str, category_column: str,
+        sku_column: str, brand_method: str, category_method: str, **kwargs
+    ) -> dict[tuple, np.ndarray]:
+
+        # exact_match_rows: rows of the brands named in the query, else of the best brand scoring >= 0.75
+        brand_groups: dict[tuple, list] = {}
+        for key, txt in texts.items():
+            txt_ls = self.text_to_list(txt, lemmatize=False)
+            brands = tuple(sorted({word for word in txt_ls if word in brand_rows}))
+
+            if not brands:
+                tp = self.score_categories(brand_cats, brand_column, txt_ls, brand_method, lemmatize=False, cutoff=0.75)
+                ele = max(tp.items(), key=lambda x: x[1])
+                brands = (ele[0],) if ele[1] >= 0.75 else ()
+
+            brand_groups.setdefault(brands, []).append(key)
+
+        # partial_match_rows on every brand slice
+        category_groups: dict[tuple, list] = {}
+        category_rows: dict[tuple, np.ndarray] = {}
+        for brands, keys in brand_groups.items():
+            if brands:
+                rows = np.sort(np.concatenate([brand_rows[brand] for brand in brands]))
+            else:
+                rows = np.arange(len(df))
+
+            values = df[category_column].iloc[rows]
+            cats = values.unique()
+
+            for key in keys:
+                txt_ls = self.text_to_list(texts[key], splitter=" ", lower=True, lemmatize=True, **kwargs)
+                kept = frozenset(self.kept_categories(cats, category_column, txt_ls, category_method, True, **kwargs))
+
+                group = (brands, kept)
+                if group not in category_rows:
+                    category_rows[group] = rows[values.isin(list(kept)).to_numpy()]
+                category_groups.setdefault(group, []).append(key)
+
+        # inverse_partial_match_rows on every category slice, scored for all queries of the slice at once
+        cache = self.token_caches.get(sku_column)
+        results = {}
+        for group, keys in category_groups.items():
+            rows = category_rows[group]
+            values = df[sku_column].iloc[rows]
+            records = cache.records(values) if cache is not None else None
+            if records is not None:
+                vocab, ids, offsets = cache.encode(records)
+            elif cache is not None:
+                vocab, ids, offsets = encode_tokens(cache.lookup(self, values))
+            else:
+                vocab, ids, offsets = encode_tokens([self.text_to_list(x) for x in values])
+            txt_lists = [self.text_to_list(texts[key]) for key in keys]
+            self.instrumentation.count("ratio", len({word for txt_ls in txt_lists for word in txt_ls}) * len(vocab))
+
+            for key, txt_ls, scores in zip(keys, txt_lists, batch_average_max_scores(txt_lists, vocab, ids, offsets)):
+                results[key] = self.threshold_rows(scores, self.inverse_thresholds(len(txt_ls))[0], rows)
+
+        return results
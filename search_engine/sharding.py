@@ -0,0 +1,369 @@
+import multiprocessing
+import threading
+
+import numpy as np
+import pandas as pd
+
+from search_engine.search_engine import SmallSearchEngine
+
+
+class ShardError(Exception):
+    pass
+
+
+# brands are assigned whole to shards, the largest first to the shard with the fewest rows, returns the
+# (ascending) positional rows of every shard and the shard of every brand
+def partition_by_brand(df: pd.DataFrame, brand_column: str, shards: int) -> tuple[list[np.ndarray], dict]:
+
+    groups = df.groupby(brand_column, sort=False, observed=True, dropna=False).indices
+    shards = max(1, min(shards, len(groups)))
+    sizes = np.zeros(shards, dtype=np.int64)
+    owner = {}
+
+    for brand in sorted(groups, key=lambda brand: len(groups[brand]), reverse=True):
+        shard = int(np.argmin(sizes))
+        owner[brand] = shard
+        sizes[shard] += len(groups[brand])
+
+    parts = [[] for _ in range(shards)]
+    for brand, shard in owner.items():
+        parts[shard].append(groups[brand])
+
+    return [np.sort(np.concatenate(part)) for part in parts], owner
+
+
+# main loop of a shard process: the handler is built on the shard rows, then every (method, args)
+# request received on the pipe is answered with (True, result) or (False, error message)
+def serve_shard(conn, handler_class, df: pd.DataFrame, positions: np.ndarray, kwargs: dict) -> None:
+
+    try:
+        handler = handler_class(df, positions, **kwargs)
+    except Exception as e:
+        conn.send((False, f"{type(e).__name__}: {e}"))
+        return
+    conn.send((True, None))
+
+    while True:
+        try:
+            request = conn.recv()
+        except EOFError:
+            break
+        if request is None:
+            break
+
+        method, args = request
+        try:
+            conn.send((True, getattr(handler, method)(*args)))
+        except Exception as e:
+            conn.send((False, f"{type(e).__name__}: {e}"))
+
+    conn.close()
+
+
+# ShardPool runs one process per shard (forked where available) with a handler built on the shard
+# rows, requests go over a pipe per shard. scatter sends a request to every target shard before
+# waiting for any answer, so the shards work in parallel, and locks the target shards in order so
+# queries on different shards run concurrently
+class ShardPool:
+    def __init__(
+        self, handler_class, frames: list[tuple[pd.DataFrame, np.ndarray]], start_method: str | None = None, **kwargs
+    ) -> None:
+
+        if start_method is None:
+            start_method = "fork" if "fork" in multiprocessing.get_all_start_methods() else "spawn"
+        ctx = multiprocessing.get_context(start_method)
+
+        self.connections = []
+        self.processes = []
+        self.locks = [threading.Lock() for _ in frames]
+
+        for df, positions in frames:
+            conn, child_conn = ctx.Pipe()
+            process = ctx.Process(
+                target=serve_shard, args=(child_conn, handler_class, df, positions, kwargs), daemon=True
+            )
+            process.start()
+            child_conn.close()
+            self.connections.append(conn)
+            self.processes.append(process)
+
+        # the shards build their indexes in parallel, every one reports when it is ready
+        try:
+            self.gather(range(len(frames)))
+        except ShardError:
+            self.close()
+            raise
+
+    def __len__(self) -> int:
+
+        return len(self.connections)
+
+    def __enter__(self) -> "ShardPool":
+
+        return self
+
+    def __exit__(self, *exc) -> None:
+
+        self.close()
+
+    def receive(self, shard: int):
+
+        try:
+            ok, res = self.connections[shard].recv()
+        except EOFError:
+            raise ShardError(f"shard {shard} exited") from None
+
+        if not ok:
+            raise ShardError(f"shard {shard}: {res}")
+        return res
+
+    # answers of the shards, every answer is read (the pipes stay in sync) before an error is raised
+    def gather(self, shards) -> dict[int, object]:
+
+        res, errors = {}, []
+        for shard in shards:
+            try:
+                res[shard] = self.receive(shard)
+            except ShardError as e:
+                errors.append(e)
+
+        if errors:
+            raise errors[0]
+        return res
+
+    # requests maps a shard to its (method, args) request, returns the answer of every shard
+    def scatter(self, requests: dict[int, tuple[str, tuple]]) -> dict[int, object]:
+
+        shards = sorted(requests)
+        for shard in shards:
+            self.locks[shard].acquire()
+
+        try:
+            for shard in shards:
+                self.connections[shard].send(requests[shard])
+            return self.gather(shards)
+        finally:
+            for shard in shards:
+                self.locks[shard].release()
+
+    def close(self) -> None:
+
+        for conn in self.connections:
+            try:
+                conn.send(None)
+            except (OSError, ValueError):
+                pass
+
+        for process in self.processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+
+        for conn in self.connections:
+            conn.close()
+
+        self.connections, self.processes = [], []
+
+
+# SearchShard is the engine of one shard: category index, sku token cache and rows of its brands,
+# positions maps its rows to the rows of the whole catalog
+class SearchShard:
+    def __init__(
+        self,
+        df: pd.DataFrame,
+        positions: np.ndarray,
+        brand_column: str,
+        category_column: str,
+        sku_column: str,
+        category_method: str,
+        download_wordnet: bool = True,
+        lemma_table: dict[str, str] | str | None = None,
+        **kwargs
+    ) -> None:
+
+        self.df = df
+        self.positions = positions
+        self.category_column = category_column
+        self.sku_column = sku_column
+        self.category_method = category_method
+        self.kwargs = kwargs
+        self.brand_rows = df.groupby(brand_column, sort=False, observed=True).indices
+        self.engine = SmallSearchEngine(download_wordnet=download_wordnet, lemma_table=lemma_table)
+        self.engine.build_index(df, category_column, **kwargs)
+        self.engine.load_token_cache(df, sku_column)
+
+    # shard rows of the given brands, all rows for None
+    def rows(self, brands: list | None) -> np.ndarray:
+
+        if brands is None:
+            return np.arange(len(self.df))
+
+        parts = [self.brand_rows[brand] for brand in brands if brand in self.brand_rows]
+        return np.sort(np.concatenate(parts)) if parts else np.zeros(0, dtype=np.int64)
+
+    def candidate_rows(self, brands: list | None, kept: list | None) -> np.ndarray:
+
+        rows = self.rows(brands)
+        if kept is None:
+            return rows
+
+        return rows[self.df[self.category_column].iloc[rows].isin(kept).to_numpy()]
+
+    # partial_match scores of the categories of the rows of the brands
+    def category_scores(self, txt: str, brands: list | None) -> dict[str, float]:
+
+        engine = self.engine
+        cats = self.df[self.category_column].iloc[self.rows(brands)].unique()
+        txt_ls = engine.text_to_list(txt, splitter=" ", lower=True, lemmatize=True, **self.kwargs)
+
+        return engine.category_scores(cats, self.category_column, txt_ls, self.category_method, True, **self.kwargs)
+
+    # inverse_partial_match buckets of the candidate rows: (catalog positions, rows) of every threshold
+    # bucket from 1 down, until the shard alone has 5 rows (the whole catalog has at least as many)
+    def inverse_buckets(self, txt: str, brands: list | None, kept: list | None) -> list[tuple[np.ndarray, pd.DataFrame]]:
+
+        engine = self.engine
+        rows = self.candidate_rows(brands, kept)
+        txt_ls = engine.text_to_list(txt)
+        thresholds, cutoff = engine.inverse_thresholds(len(txt_ls))
+        buckets = np.around(
+            engine.sku_average_scores(self.df[self.sku_column].iloc[rows], self.sku_column, txt_ls, cutoff), 1
+        )
+
+        res, count = [], 0
+        for threshold in thresholds:
+            bucket = rows[buckets == np.around(threshold, 2)]
+            res.append((self.positions[bucket], self.df.iloc[bucket]))
+            count += len(bucket)
+            if count >= 5:
+                break
+
+        return res
+
+    def candidates(self, brands: list | None, kept: list | None) -> tuple[np.ndarray, pd.DataFrame]:
+
+        rows = self.candidate_rows(brands, kept)
+        return self.positions[rows], self.df.iloc[rows]
+
+
+# catalog positions and rows of several shards in catalog order
+def merge_rows(parts: list[tuple[np.ndarray, pd.DataFrame]]) -> tuple[np.ndarray, pd.DataFrame]:
+
+    parts = [part for part in parts if len(part[0])] or parts[:1]
+    positions = np.concatenate([part[0] for part in parts])
+    order = np.argsort(positions, kind="stable")
+
+    return positions[order], pd.concat([part[1] for part in parts]).iloc[order]
+
+
+# ShardedSearchEngine runs the exact -> partial -> inverse pipeline of sales_data_app.retrieve_result on
+# a catalog split by brand into shard processes. The coordinator only keeps the brands: the brand
+# of a query is found like exact_match, the query then goes to the shards of that brand (to all of them
+# when no brand is found). The category scores of the shards are merged before the categories are
+# kept (top-0.1 over all shards) and the inverse_partial_match buckets are merged in catalog order, so
+# the result is the rows (and order) of the single process pipeline
+class ShardedSearchEngine:
+    def __init__(
+        self,
+        df: pd.DataFrame,
+        shards: int,
+        brand_column: str = "brand_lower",
+        category_column: str = "product_line_clean",
+        sku_column: str = "sku",
+        brand_method: str = "max_win_score",
+        category_method: str = "combine_score",
+        download_wordnet: bool = True,
+        lemma_table: dict[str, str] | str | None = None,
+        start_method: str | None = None,
+        **kwargs
+    ) -> None:
+
+        self.brand_column = brand_column
+        self.brand_method = brand_method
+        self.kwargs = kwargs
+        self.brands = df[brand_column].unique()
+        parts, self.owner = partition_by_brand(df, brand_column, shards)
+
+        self.engine = SmallSearchEngine(download_wordnet=download_wordnet, lemma_table=lemma_table)
+        self.engine.build_index(df, brand_column, lemmatize=False)
+
+        self.pool = ShardPool(
+            SearchShard,
+            [(df.iloc[rows], rows) for rows in parts],
+            start_method,
+            brand_column=brand_column,
+            category_column=category_column,
+            sku_column=sku_column,
+            category_method=category_method,
+            download_wordnet=download_wordnet,
+            lemma_table=lemma_table,
+            **kwargs
+        )
+
+    def __enter__(self) -> "ShardedSearchEngine":
+
+        return self
+
+    def __exit__(self, *exc) -> None:
+
+        self.close()
+
+    def close(self) -> None:
+
+        self.pool.close()
+
+    # brands of the rows exact_match keeps: the brands named in the query, else the best brand scoring
+    # >= 0.75, None (all brands) when there is none
+    def route(self, txt: str) -> list | None:
+
+        txt_ls = self.engine.text_to_list(txt, lemmatize=False)
+        words = set(txt_ls)
+        named = [brand for brand in self.brands if brand in words]
+        if named:
+            return named
+
+        tp = self.engine.score_categories(self.brands, self.brand_column, txt_ls, self.brand_method, lemmatize=False, cutoff=0.75)
+        ele = max(tp.items(), key=lambda x: x[1])
+
+        return [ele[0]] if ele[1] >= 0.75 else None
+
+    def shards(self, brands: list | None) -> list[int]:
+
+        if brands is None:
+            return list(range(len(self.pool)))
+
+        return sorted({self.owner[brand] for brand in brands})
+
+    # catalog positions (as retrieve_result would give them) and rows of the result of a query
+    def search_rows(self, txt: str) -> tuple[np.ndarray, pd.DataFrame]:
+
+        brands = self.route(txt)
+        shards = self.shards(brands)
+
+        # partial_match_rows, the categories are kept on the scores of all the shards
+        tp = {}
+        for scores in self.pool.scatter({shard: ("category_scores", (txt, brands)) for shard in shards}).values():
+            tp.update(scores)
+        kept = self.engine.select_categories(tp)
+        kept = None if len(kept) == len(tp) else kept
+
+        # inverse_partial_match_rows, buckets from 1 down until at least 5 rows are kept
+        answers = self.pool.scatter({shard: ("inverse_buckets", (txt, brands, kept)) for shard in shards})
+        parts, count = [], 0
+        for k in range(max(len(buckets) for buckets in answers.values())):
+            part = merge_rows([buckets[k] for buckets in answers.values() if len(buckets) > k])
+            if len(part[0]):
+                parts.append(part)
+                count += len(part[0])
+            if count >= 5:
+                break
+
+        # no row in any bucket, all the candidate rows are returned
+        if not parts:
+            return merge_rows(list(self.pool.scatter({shard: ("candidates", (brands, kept)) for shard in shards}).values()))
+
+        return np.concatenate([part[0] for part in parts]), pd.concat([part[1] for part in parts])
+
+    def search(self, txt: str) -> pd.DataFrame:
+
+        return self.search_rows(txt)[1]
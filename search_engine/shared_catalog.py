@@ -0,0 +1,158 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from search_engine.category_index import CategoryIndex
+from search_engine.token_cache import TokenCache
+from search_engine.token_table import TokenTable
+
+METADATA_KEY = b"product_engine"
+
+
+# SharedCatalog is a catalog serialized once into an uncompressed Arrow IPC file together with its
+# derived artifacts (token cache of a column, category index splits and tokens, ProductMatcher cat_alias
+# and normalized skus), open() memory maps it read-only, so every worker process reading it shares the
+# same physical pages and attaches without tokenizing or lemmatizing anything
+class SharedCatalog:
+    def __init__(self, path: str, table: pa.Table, tokens: pa.Table | None, artifacts: dict) -> None:
+
+        self.path = path
+        self.table = table
+        self.tokens = tokens
+        self.artifacts = artifacts
+
+    @staticmethod
+    def tokens_path(path: str) -> str:
+
+        return f"{os.path.splitext(path)[0]}.tokens.arrow"
+
+    @staticmethod
+    def clean_sku_path(path: str) -> str:
+
+        return f"{os.path.splitext(path)[0]}.clean_sku.arrow"
+
+    @staticmethod
+    def write_table(path: str, table: pa.Table) -> None:
+
+        with pa.OSFile(path, "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+
+    @staticmethod
+    def read_table(path: str) -> pa.Table:
+
+        # buffers of the returned table point into the mapping, nothing is copied
+        return pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+
+    # engine indexes and its token cache (built if missing) are stored with the catalog, cat_alias and
+    # clean_sku (the sku of every row normalized by ProductMatcher) are what ProductMatcher.from_shared reads
+    @classmethod
+    def write(
+        cls, path: str, df: pd.DataFrame, engine=None, token_column: str | None = "sku",
+        cat_alias: dict[str, list[str]] | None = None, clean_sku: pd.Series | None = None
+    ) -> None:
+
+        artifacts = {
+            "token_column": None, "content_hash": None, "indexes": {}, "cat_alias": cat_alias,
+            "clean_sku": clean_sku is not None,
+        }
+        if clean_sku is not None:
+            cls.write_table(cls.clean_sku_path(path), pa.table({"clean_sku": pa.array(list(clean_sku), type=pa.string())}))
+
+        if engine is not None:
+            for column, index in engine.indexes.items():
+                artifacts["indexes"][column] = {
+                    "lemmatize": index.lemmatize,
+                    "kwargs": index.kwargs,
+                    "split_map": index.split_map,
+                    "token_map": index.token_map,
+                }
+
+            if token_column is not None and token_column in df.columns:
+                cache = engine.token_caches.get(token_column)
+                content_hash = TokenCache.hash_values(df[token_column])
+                if cache is None or cache.content_hash != content_hash:
+                    cache = TokenCache.build(engine, df[token_column], token_column, content_hash)
+
+                # the TokenTable arrays as they are: the list offsets are its offsets, the dictionary
+                # indices its int32 token ids and the dictionary its vocabulary
+                table = cache.table
+                tokens = pa.LargeListArray.from_arrays(
+                    pa.array(table.offsets, type=pa.int64()),
+                    pa.DictionaryArray.from_arrays(pa.array(table.ids, type=pa.int32()), pa.array(table.vocab, type=pa.string())),
+                )
+                cls.write_table(
+                    cls.tokens_path(path),
+                    pa.table({"value": pa.array(list(table.values), type=pa.string()), "tokens": tokens}),
+                )
+                artifacts["token_column"] = token_column
+                artifacts["content_hash"] = content_hash
+
+        table = pa.Table.from_pandas(df)
+        metadata = {**(table.schema.metadata or {}), METADATA_KEY: json.dumps(artifacts).encode()}
+        cls.write_table(path, table.replace_schema_metadata(metadata))
+
+    @classmethod
+    def open(cls, path: str) -> "SharedCatalog":
+
+        table = cls.read_table(path)
+        artifacts = json.loads(table.schema.metadata[METADATA_KEY])
+        tokens = cls.read_table(cls.tokens_path(path)) if artifacts["token_column"] is not None else None
+
+        return cls(path, table, tokens, artifacts)
+
+    # numeric columns are views of the mapping, strings stay in Arrow memory (string[pyarrow])
+    # and dictionary columns become categoricals, only their small dictionaries are copied
+    def to_pandas(self) -> pd.DataFrame:
+
+        return self.table.to_pandas(
+            split_blocks=True,
+            types_mapper={pa.string(): pd.StringDtype("pyarrow")}.get,
+        )
+
+    @property
+    def cat_alias(self) -> dict[str, list[str]] | None:
+
+        return self.artifacts["cat_alias"]
+
+    # normalized skus of the rows of df (the frame of to_pandas), the strings stay in the mapping
+    def clean_sku(self, df: pd.DataFrame) -> pd.Series | None:
+
+        if not self.artifacts.get("clean_sku"):
+            return None
+
+        column = self.read_table(self.clean_sku_path(self.path)).column("clean_sku")
+        return pd.Series(pd.arrays.ArrowStringArray(column), index=df.index, name="sku")
+
+    def token_cache(self) -> TokenCache | None:
+
+        if self.tokens is None:
+            return None
+
+        # token ids and offsets are views of the mapping and the values stay in Arrow memory, only the
+        # vocabulary becomes Python strings (the scorers and the character index compare str objects)
+        column = self.tokens.column("tokens")
+        tokens = column.chunk(0) if column.num_chunks == 1 else column.combine_chunks()
+        offsets = tokens.offsets.to_numpy(zero_copy_only=True) if len(tokens) else np.zeros(1, dtype=np.int64)
+
+        table = TokenTable(
+            pd.Index(pd.arrays.ArrowStringArray(self.tokens.column("value"))),
+            tokens.values.dictionary.to_pylist(),
+            tokens.values.indices.to_numpy(zero_copy_only=True),
+            offsets,
+        )
+        return TokenCache(self.artifacts["token_column"], table, self.artifacts["content_hash"])
+
+    def category_indexes(self, engine) -> dict[str, CategoryIndex]:
+
+        res = {}
+        for column, data in self.artifacts["indexes"].items():
+            index = CategoryIndex(engine, data["lemmatize"], **data["kwargs"])
+            index.split_map = {cat: [tuple(split) for split in splits] for cat, splits in data["split_map"].items()}
+            index.token_map = data["token_map"]
+            res[column] = index
+
+        return res
@@ -0,0 +1,126 @@
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from search_engine.candidate_index import CharGramIndex
+from search_engine.token_table import TokenTable
+
+
+# TokenCache maps every value of a column (sku) to its text_to_list tokens, so records are lemmatized
+# once per catalog load instead of once per query, it can be persisted as a sidecar parquet file.
+# The tokens are held in a compact TokenTable (int32 ids over a global vocabulary) instead of lists
+class TokenCache:
+    def __init__(self, column: str, tokens: dict[str, list[str]] | TokenTable, content_hash: str) -> None:
+
+        self.column = column
+        self.table = tokens if isinstance(tokens, TokenTable) else TokenTable.from_tokens(tokens)
+        self.content_hash = content_hash
+        self.grams: CharGramIndex | None = None
+        # id in grams of every table vocabulary entry, -1 for tokens missing from grams
+        self.gram_ids: np.ndarray | None = None
+
+    # value -> token list form (for persistence), built from the table
+    @property
+    def tokens(self) -> dict[str, list[str]]:
+
+        return self.table.to_dict()
+
+    # character count index over the token vocabulary, used to skip records that cannot reach a cutoff
+    def build_candidates(self) -> None:
+
+        self.grams = CharGramIndex(self.table.vocab)
+        self.gram_ids = np.arange(len(self.table.vocab), dtype=np.int32)
+
+    # hash of the column values, a cache built from different values is stale
+    @staticmethod
+    def hash_values(values: pd.Series) -> str:
+
+        hashed = pd.util.hash_pandas_object(values, index=False).to_numpy()
+        return hashlib.sha1(hashed.tobytes()).hexdigest()
+
+    @staticmethod
+    def sidecar_path(path: str, column: str) -> str:
+
+        return f"{os.path.splitext(path)[0]}.{column}_tokens.parquet"
+
+    @classmethod
+    def build(cls, engine, values: pd.Series, column: str, content_hash: str | None = None) -> "TokenCache":
+
+        if content_hash is None:
+            content_hash = cls.hash_values(values)
+
+        tokens = {val: engine.text_to_list(val) for val in values.unique()}
+        return cls(column, tokens, content_hash)
+
+    # returns None if the sidecar is missing or was built from other column values
+    @classmethod
+    def load(cls, path: str, column: str, content_hash: str) -> "TokenCache | None":
+
+        if not os.path.exists(path):
+            return None
+
+        table = pq.read_table(path)
+        metadata = table.schema.metadata or {}
+        if metadata.get(b"content_hash", b"").decode() != content_hash:
+            return None
+
+        tokens = dict(zip(table.column(column).to_pylist(), table.column("tokens").to_pylist()))
+        return cls(column, tokens, content_hash)
+
+    def save(self, path: str) -> None:
+
+        tokens = self.tokens
+        table = pa.table(
+            {
+                self.column: pa.array(list(tokens), type=pa.string()),
+                "tokens": pa.array(list(tokens.values()), type=pa.list_(pa.string())),
+            }
+        ).replace_schema_metadata({"content_hash": self.content_hash})
+        pq.write_table(table, path)
+
+    # new cache for the column values (copy-on-write), only values missing from this cache are tokenized,
+    # the character index is shared and their new tokens are never used to prune records
+    def updated(self, engine, values: pd.Series) -> "TokenCache":
+
+        uniques = values.unique()
+        tokens = {}
+        for val, record in zip(uniques, self.table.records(uniques).tolist()):
+            tokens[val] = self.table.token_list(record) if record >= 0 else engine.text_to_list(val)
+
+        res = TokenCache(self.column, tokens, self.hash_values(values))
+        if self.grams is not None:
+            res.grams = self.grams
+            res.gram_ids = np.array([self.grams.id_of(token) for token in res.table.vocab], dtype=np.int32)
+        return res
+
+    # value numbers of the given values in the table, None if some of them are missing from the cache
+    def records(self, values) -> np.ndarray | None:
+
+        res = self.table.records(values)
+        return res if (res >= 0).all() else None
+
+    # vocabulary of the tokens of the records with their local ids and offsets (as encode_tokens)
+    def encode(self, records: np.ndarray) -> tuple[list[str], np.ndarray, np.ndarray]:
+
+        ids, offsets = self.table.gather(records)
+        unique_ids, local_ids = np.unique(ids, return_inverse=True)
+
+        return [self.table.vocab[i] for i in unique_ids.tolist()], local_ids, offsets
+
+    # CharGramIndex.record_upper_bounds of the records, computed on the token ids
+    def record_upper_bounds(self, txt_ls: list[str], records: np.ndarray) -> np.ndarray:
+
+        ids, offsets = self.table.gather(records)
+        return self.grams.csr_upper_bounds(txt_ls, self.gram_ids[ids], offsets)
+
+    # token lists for the given values, values missing from the cache are tokenized with the engine
+    def lookup(self, engine, values) -> list[list[str]]:
+
+        return [
+            self.table.token_list(record) if record >= 0 else engine.text_to_list(val)
+            for val, record in zip(values, self.table.records(values).tolist())
+        ]
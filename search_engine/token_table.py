@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+
+
+# TokenTable is the compact (CSR) form of the tokens of every value of a column: a global vocabulary
+# of distinct tokens, the int32 token ids of all values in one array and the int64 start offset of
+# each value (value i owns ids[offsets[i]:offsets[i+1]]). Rows are mapped to their value number with
+# a hash lookup, so scoring a slice gathers arrays instead of building per row token lists
+class TokenTable:
+    def __init__(self, values: pd.Index, vocab: list[str], ids: np.ndarray, offsets: np.ndarray) -> None:
+
+        self.values = values
+        self.vocab = vocab
+        self.ids = ids
+        self.offsets = offsets
+
+    @classmethod
+    def from_tokens(cls, tokens: dict[str, list[str]]) -> "TokenTable":
+
+        vocab_ids: dict[str, int] = {}
+        lengths = np.fromiter((len(val_tokens) for val_tokens in tokens.values()), dtype=np.int64, count=len(tokens))
+        offsets = np.zeros(len(tokens) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+
+        ids = np.fromiter(
+            (vocab_ids.setdefault(token, len(vocab_ids)) for val_tokens in tokens.values() for token in val_tokens),
+            dtype=np.int32,
+            count=int(offsets[-1]),
+        )
+
+        return cls(pd.Index(list(tokens), dtype=object), list(vocab_ids), ids, offsets)
+
+    def __len__(self) -> int:
+
+        return len(self.values)
+
+    # value number of every given value, -1 for values missing from the table
+    def records(self, values) -> np.ndarray:
+
+        return self.values.get_indexer(values)
+
+    # token ids and offsets of the given records (value numbers), in the same CSR layout
+    def gather(self, records: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+
+        starts = self.offsets[records]
+        lengths = self.offsets[records + 1] - starts
+        offsets = np.zeros(len(records) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+
+        positions = np.repeat(starts - offsets[:-1], lengths) + np.arange(offsets[-1], dtype=np.int64)
+        return self.ids[positions], offsets
+
+    def token_list(self, record: int) -> list[str]:
+
+        return [self.vocab[i] for i in self.ids[self.offsets[record]:self.offsets[record + 1]].tolist()]
+
+    def to_dict(self) -> dict[str, list[str]]:
+
+        return {val: self.token_list(i) for i, val in enumerate(self.values)}
+
+    # bytes of the arrays (vocabulary strings and the value index excluded)
+    @property
+    def nbytes(self) -> int:
+
+        return self.ids.nbytes + self.offsets.nbytes
@@ -0,0 +1,118 @@
+import os
+import re
+import sys
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from baseline import BaselineSearchEngine
+from sales_data_app import abbrevations
+from search_engine.search_engine import SmallSearchEngine
+
+BRANDS = ["Samsung", "LG", "Sony", "Philips", "Hitachi TV", "Morphy Rich", "Motorola", "HP", "Dell", "Bajaj"]
+
+# explicit aliases, create_cat_alias would need WordNet
+CAT_ALIAS = {
+    "TV LCD": ["tv lcd", "tv", "lcd", "led", "television"],
+    "Air Conditioner": ["air conditioner", "ac"],
+    "Washing Machine": ["washing machine", "wm"],
+    "Mobile Phone & Smart Phone": ["mobile phone", "smart phone", "phone mobile"],
+    "Laptop": ["laptop"],
+    "Desktop": ["desktop", "pc"],
+    "Earphone/Headphone": ["earphone", "headphone", "headset", "earbud"],
+    "Cooling Appliance": ["cooling appliance", "cooler"],
+    "Computer Bag": ["computer bag", "backpack", "carrycase", "bag"],
+    "Gaming Software": ["gaming software", "game"],
+}
+
+QUERIES = [
+    "samsung tv",
+    "lg washing machine",
+    "sony headphones",
+    "phillips air cooler",
+    "motorola mobile phone",
+    "hp laptop bag",
+    "dell desktop pc",
+    "morphy richards cooler",
+    "hitachi ac 1.5 ton",
+    "samsng smart phone",
+    "bajaj cooling appliance",
+    "ps4 game",
+    "televison 43 inch",
+    "washing machne front load",
+    "leptop",
+    "sony bravia led",
+    "delll gaming laptop",
+    "earphones",
+    "hirlpool desktop",
+]
+
+
+# small catalog with repeated sales and prices, so rankings have ties
+def make_catalog() -> pd.DataFrame:
+
+    rows = []
+    for i, brand in enumerate(BRANDS):
+        for j, cat in enumerate(CAT_ALIAS):
+            if (i + j) % 3:
+                for k in range(2):
+                    rows.append({
+                        "brand": brand,
+                        "product_line": cat,
+                        "sku": f"{brand} {cat} model {i}{j}{k}",
+                        "sales": (i * j + k) % 7,
+                        "price": 100 * ((i + j) % 5),
+                    })
+
+    return pd.DataFrame(rows)
+
+
+@pytest.fixture(scope="module")
+def catalog() -> pd.DataFrame:
+
+    return make_catalog()
+
+
+# catalog with categorical brand and product_line, as CatalogLoader loads it
+@pytest.fixture(scope="module")
+def categorical_catalog() -> pd.DataFrame:
+
+    return make_catalog().astype({"brand": "category", "product_line": "category"})
+
+
+# catalog with the lowercased columns the SmallSearchEngine pipeline matches on
+@pytest.fixture(scope="module")
+def engine_catalog() -> pd.DataFrame:
+
+    df = make_catalog()
+    df["brand_lower"] = df["brand"].str.lower()
+    df["product_line_clean"] = df["product_line"].str.lower()
+    return df
+
+
+# lemmas of every catalog and query word (a plural s is dropped), so WordNet is never loaded
+def make_lemma_table(df: pd.DataFrame) -> dict[str, str]:
+
+    texts = [*df["sku"], *df["product_line_clean"], *df["brand_lower"], *QUERIES, *abbrevations.values()]
+    words = {word for text in texts for word in [*text.lower().split(" "), *re.split(r"[ &/]", text.lower())]}
+    return {word: word[:-1] if len(word) > 3 and word.endswith("s") and not word.endswith("ss") else word for word in words}
+
+
+@pytest.fixture(scope="module")
+def lemma_table(engine_catalog) -> dict[str, str]:
+
+    return make_lemma_table(engine_catalog)
+
+
+@pytest.fixture
+def engine(lemma_table) -> SmallSearchEngine:
+
+    return SmallSearchEngine(download_wordnet=False, lemma_table=lemma_table)
+
+
+@pytest.fixture(scope="module")
+def baseline(lemma_table) -> BaselineSearchEngine:
+
+    return BaselineSearchEngine(lemma_table)
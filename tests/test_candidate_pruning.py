@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+from Levenshtein import ratio
+
+import sales_data_app as app
+from conftest import QUERIES
+from search_engine.candidate_index import CharGramIndex
+
+
+def query_words(engine) -> list[str]:
+
+    return sorted({word for query in QUERIES for word in engine.text_to_list(query, abb=app.abbrevations)})
+
+
+def test_char_gram_bounds_are_upper_bounds_of_ratio(engine, engine_catalog):
+
+    vocab = sorted({word for sku in engine_catalog["sku"] for word in engine.text_to_list(sku)})
+    grams = CharGramIndex(vocab)
+
+    for word in query_words(engine) + ["", "x", "lcd tv"]:
+        bounds = grams.upper_bounds(word)
+        assert all(bound >= ratio(word, entry) - 1e-9 for bound, entry in zip(bounds, grams.vocab))
+
+
+def test_record_bounds_are_upper_bounds_of_the_sku_average(engine, engine_catalog):
+
+    cache = engine.load_token_cache(engine_catalog, "sku")
+    records = cache.records(engine_catalog["sku"])
+
+    for query in QUERIES:
+        txt_ls = engine.text_to_list(query)
+        bounds = cache.record_upper_bounds(txt_ls, records)
+        scores = engine.sku_average_scores(engine_catalog["sku"], "sku", txt_ls)
+        assert (bounds >= scores - 1e-9).all()
+
+
+# pruned categories may only be reported lower when their score is below the cutoff, the others are unchanged
+@pytest.mark.parametrize(
+    "column, method, lemmatize, cutoff",
+    [
+        ("brand_lower", "max_win_score", False, 0.75),
+        ("product_line_clean", "combine_score", True, 0.55),
+        ("product_line_clean", "average_score", True, 0.55),
+        ("product_line_clean", "max_win_score", True, 0.55),
+    ],
+)
+def test_cutoff_keeps_the_scores_above_it(engine, engine_catalog, column, method, lemmatize, cutoff):
+
+    kwargs = {"abb": app.abbrevations} if lemmatize else {}
+    engine.build_index(engine_catalog, column, lemmatize=lemmatize, **kwargs)
+    cats = engine_catalog[column].unique()
+
+    for query in QUERIES:
+        txt_ls = engine.text_to_list(query, lemmatize=lemmatize, **kwargs)
+        full = engine.score_categories(cats, column, txt_ls, method, lemmatize, **kwargs)
+        pruned = engine.score_categories(cats, column, txt_ls, method, lemmatize, cutoff=cutoff, **kwargs)
+        for cat in cats:
+            assert pruned[cat] == full[cat] or (full[cat] < cutoff and pruned[cat] <= full[cat])
+
+
+@pytest.mark.parametrize("indexed", [False, True])
+def test_pruned_matching_keeps_baseline_results(engine, baseline, engine_catalog, indexed):
+
+    if indexed:
+        engine.build_index(engine_catalog, "brand_lower", lemmatize=False)
+        engine.build_index(engine_catalog, "product_line_clean", abb=app.abbrevations)
+        engine.load_token_cache(engine_catalog, "sku")
+
+    for query in QUERIES:
+        exact = engine.exact_match(engine_catalog, "brand_lower", query)
+        assert exact.equals(baseline.exact_match(engine_catalog, "brand_lower", query))
+
+        partial = engine.partial_match(exact, "product_line_clean", query, abb=app.abbrevations)
+        assert partial.equals(baseline.partial_match(exact, "product_line_clean", query, abb=app.abbrevations))
+
+        rows = np.flatnonzero(engine_catalog.index.isin(partial.index))
+        res = engine_catalog.iloc[engine.inverse_partial_match_rows(engine_catalog, "sku", query, rows=rows)]
+        assert res.equals(baseline.inverse_partial_match(partial, "sku", query))
+
+
+# an attached SharedCatalog has string[pyarrow] columns, a fuzzy brand match must select the same rows
+def test_fuzzy_brand_match_on_string_columns(engine, baseline, engine_catalog):
+
+    df = engine_catalog.astype({"brand_lower": "string[pyarrow]"})
+
+    for query in ["samsng smart phone", "delll gaming laptop", "phillips air cooler"]:
+        expected = baseline.exact_match(engine_catalog, "brand_lower", query)
+        assert engine.exact_match(df, "brand_lower", query).index.equals(expected.index)
@@ -0,0 +1,48 @@
+import itertools
+
+import numpy as np
+import pytest
+
+import sales_data_app as app
+from conftest import QUERIES
+
+WORDS = ["tv", "lcd", "led", "phone", "mobile", "smart", "laptop", "bag", "cooling", "appliance", "washing", "machine"]
+
+
+# scores must be bit-identical to the baseline, the partial_match threshold (top - 0.1) compares them exactly
+@pytest.mark.parametrize("method", ["max_win_score", "average_score", "combine_score"])
+@pytest.mark.parametrize("column, lemmatize", [("brand_lower", False), ("product_line_clean", True)])
+@pytest.mark.parametrize("indexed", [False, True])
+def test_category_scores_keep_baseline_scores(engine, baseline, engine_catalog, method, column, lemmatize, indexed):
+
+    # the baseline max_win_score takes no abbrevations, it does not lemmatize the categories
+    kwargs = {"abb": app.abbrevations} if lemmatize and method != "max_win_score" else {}
+    if indexed:
+        engine.build_index(engine_catalog, column, lemmatize=lemmatize, **kwargs)
+
+    for query in QUERIES:
+        txt_ls = engine.text_to_list(query, lemmatize=lemmatize, **kwargs)
+        expected = baseline.calculate_score(engine_catalog, column, txt_ls, method, lemmatize=lemmatize, **kwargs)
+        assert engine.calculate_score(engine_catalog, column, txt_ls, method, lemmatize=lemmatize, **kwargs) == expected
+
+
+# np.mean sums 8 values and more pairwise, fewer in order, both paths must give the baseline float
+@pytest.mark.parametrize("n", range(1, 13))
+def test_perm_avg_score_keeps_the_baseline_summation_order(engine, baseline, n):
+
+    rnd = np.random.default_rng(n)
+    for _ in range(20):
+        cat_ls = list(rnd.choice(WORDS, n, replace=False))
+        txt_ls = [word[: rnd.integers(2, len(word) + 1)] for word in rnd.choice(WORDS, 3)]
+        assert engine.perm_avg_score(cat_ls, txt_ls) == baseline.perm_avg_score(cat_ls, txt_ls)
+
+
+# with a limit the score is either given up (-1) because it cannot reach the limit, or exact
+@pytest.mark.parametrize("limit", [0.3, 0.5, 0.7, 0.9, 1.0])
+def test_bounded_avg_score_gives_up_only_below_the_limit(engine, limit):
+
+    for cat_ls in itertools.combinations(WORDS[:6], 3):
+        for txt_ls in (["tv"], ["smart", "phone"], ["led", "tv", "mobile"], ["lpatop"]):
+            exact = engine.perm_avg_score(list(cat_ls), txt_ls)
+            score, _ = engine.bounded_avg_score(list(cat_ls), txt_ls, limit=limit)
+            assert score == exact or (score == -1.0 and exact < limit)
@@ -0,0 +1,31 @@
+import pytest
+
+import sales_data_app as app
+from conftest import QUERIES
+
+
+@pytest.mark.parametrize("token_cache", [False, True])
+def test_inverse_partial_match_keeps_baseline_results(engine, baseline, engine_catalog, token_cache):
+
+    if token_cache:
+        engine.load_token_cache(engine_catalog, "sku")
+
+    brand = engine_catalog[engine_catalog["brand_lower"] == "samsung"]
+    for df in (engine_catalog, brand, brand.iloc[:1]):
+        for query in QUERIES:
+            assert engine.inverse_partial_match(df, "sku", query).equals(baseline.inverse_partial_match(df, "sku", query))
+
+
+# the whole pipeline with the indexes and token cache load_catalog builds, ties in the category and sku
+# scores of the catalog must resolve like the baseline
+def test_retrieve_result_keeps_baseline_results(engine, baseline, engine_catalog, monkeypatch):
+
+    engine.build_index(engine_catalog, "brand_lower", lemmatize=False)
+    engine.build_index(engine_catalog, "product_line_clean", abb=app.abbrevations)
+    engine.load_token_cache(engine_catalog, "sku")
+    monkeypatch.setattr(app, "se", engine)
+    app.result_cache.clear()
+
+    for query in QUERIES + [query.upper() for query in QUERIES]:
+        expected = baseline.retrieve_result(engine_catalog, query, app.abbrevations)
+        assert app.retrieve_result(engine_catalog, query).equals(expected)
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("fuzzywuzzy")
+pytest.importorskip("rapidfuzz")
+
+from conftest import BRANDS, CAT_ALIAS, QUERIES
+from other_variant.ProductMatcher import ProductMatcher
+from search_engine.fuzzy_scoring import FuzzyWuzzyScorer, RapidFuzzScorer
+
+
+# top-3 brand_matcher output and top-3 cat_matcher output for every brand of every query
+def outputs(pm: ProductMatcher) -> list:
+
+    return [
+        (pm.brand_matcher(query), [pm.cat_matcher(query, brand_filter) for brand_filter in (set(), {"Samsung"}, {"Dell"})])
+        for query in QUERIES
+    ]
+
+
+def test_rapidfuzz_scores_match_fuzzywuzzy():
+
+    choices = [*BRANDS, *CAT_ALIAS, *(alias for aliases in CAT_ALIAS.values() for alias in aliases), "", "Ã©clair"]
+    rapidfuzz, fuzzywuzzy = RapidFuzzScorer(), FuzzyWuzzyScorer()
+
+    for query in [*QUERIES, ""]:
+        assert np.array_equal(rapidfuzz.partial_ratio(query, choices), fuzzywuzzy.partial_ratio(query, choices))
+        assert np.array_equal(
+            rapidfuzz.partial_token_sort_ratio(query, choices), fuzzywuzzy.partial_token_sort_ratio(query, choices)
+        )
+
+
+def test_rapidfuzz_backend_keeps_fuzzywuzzy_results(catalog):
+
+    reference = ProductMatcher(catalog, cat_alias=CAT_ALIAS, backend="fuzzywuzzy")
+    rapidfuzz = ProductMatcher(catalog, cat_alias=CAT_ALIAS, backend="rapidfuzz")
+
+    assert outputs(rapidfuzz) == outputs(reference)
+
+
+def test_state_space_search_keeps_fuzzywuzzy_results(catalog):
+
+    reference = ProductMatcher(catalog, cat_alias=CAT_ALIAS, backend="fuzzywuzzy")
+    rapidfuzz = ProductMatcher(catalog, cat_alias=CAT_ALIAS, backend="rapidfuzz")
+
+    for query in QUERIES:
+        assert rapidfuzz.state_space_search(query, 9).equals(reference.state_space_search(query, 9))
+
+
+def test_rapidfuzz_is_the_default_backend(catalog):
+
+    assert isinstance(ProductMatcher(catalog, cat_alias=CAT_ALIAS).scorer, RapidFuzzScorer)
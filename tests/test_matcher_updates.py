@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("fuzzywuzzy")
+
+from conftest import CAT_ALIAS, QUERIES
+from other_variant.ProductMatcher import ProductMatcher
+
+
+# the snapshot of an updated matcher has the partitions and results of a matcher built on its catalog
+def assert_same_as_rebuilt(pm: ProductMatcher) -> None:
+
+    fresh = ProductMatcher(pm.df, cat_alias=CAT_ALIAS)
+    snapshot, expected = pm.current(), fresh.current()
+
+    assert snapshot.brand_rows.keys() == expected.brand_rows.keys()
+    for brand, rows in expected.brand_rows.items():
+        assert np.array_equal(snapshot.brand_rows[brand], rows)
+    assert snapshot.partitions.keys() == expected.partitions.keys()
+    for key, rows in expected.partitions.items():
+        assert np.array_equal(snapshot.partitions[key], rows)
+
+    for query in QUERIES:
+        assert pm.brand_matcher(query) == fresh.brand_matcher(query)
+        assert pm.cat_matcher(query, {"Samsung", "Dell"}) == fresh.cat_matcher(query, {"Samsung", "Dell"})
+        assert pm.state_space_search(query, 9).equals(fresh.state_space_search(query, 9))
+
+
+def test_upsert_rows_on_categorical_catalog(categorical_catalog):
+
+    pm = ProductMatcher(categorical_catalog, cat_alias=CAT_ALIAS)
+    rows = categorical_catalog.iloc[[0, 5, 40]].copy()
+    rows["sales"] += 10
+    rows.index = [0, 5, len(categorical_catalog)]
+
+    pm.upsert_rows(rows)
+
+    assert len(pm.df) == len(categorical_catalog) + 1
+    assert_same_as_rebuilt(pm)
+
+
+def test_delete_rows_on_categorical_catalog(categorical_catalog):
+
+    pm = ProductMatcher(categorical_catalog, cat_alias=CAT_ALIAS)
+    samsung = categorical_catalog.index[categorical_catalog["brand"] == "Samsung"]
+
+    pm.delete_rows([3, 17, *samsung])
+
+    assert "Samsung" not in pm.current().brand_rows
+    assert_same_as_rebuilt(pm)
@@ -0,0 +1,27 @@
+import numpy as np
+
+from conftest import QUERIES
+from sales_data_app import abbrevations
+from search_engine.query_planner import QueryPlanner
+
+
+def test_bound_planner_keeps_its_catalog_when_the_planner_is_rebound(engine, engine_catalog):
+
+    planner = QueryPlanner(abb=abbrevations)
+    bound = planner.bind(engine, engine_catalog)
+    expected = [bound.rows(query) for query in QUERIES]
+
+    smaller = engine_catalog.iloc[:40]
+    rebound = planner.bind(engine, smaller)
+
+    assert rebound is not bound and rebound.df is smaller
+    assert bound.df is engine_catalog and bound.stats.rows == len(engine_catalog)
+    for query, rows in zip(QUERIES, expected):
+        assert np.array_equal(bound.rows(query), rows)
+
+
+def test_bind_reuses_the_statistics_of_the_same_catalog(engine, engine_catalog):
+
+    planner = QueryPlanner(abb=abbrevations)
+
+    assert planner.bind(engine, engine_catalog) is planner.bind(engine, engine_catalog)
@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from search_engine.ranking import top_k, top_k_rows, top_k_views
+
+
+def tied_frame(n: int, seed: int = 0) -> pd.DataFrame:
+
+    rnd = np.random.default_rng(seed)
+    price = rnd.integers(0, 5, n).astype(float) * 100
+    price[rnd.random(n) < 0.1] = np.nan
+    return pd.DataFrame({"sales": rnd.integers(0, 4, n), "price": price}, index=rnd.permutation(n) * 3)
+
+
+@pytest.mark.parametrize("n", [0, 1, 3, 7, 16, 17, 100, 1000])
+@pytest.mark.parametrize("k", [0, 1, 3, 10, 2000])
+@pytest.mark.parametrize("column", ["sales", "price"])
+@pytest.mark.parametrize("ascending", [True, False])
+def test_top_k_rows_matches_a_stable_sort_with_ties_and_nan(n, k, column, ascending):
+
+    df = tied_frame(n)
+    expected = df.sort_values(by=column, ascending=ascending, kind="stable").head(k)
+
+    assert top_k_rows(df, column, k, ascending).equals(expected)
+
+
+# the baseline sorted with the default quicksort, its order is only defined for distinct values
+# (the tie order of quicksort depends on the numpy build), ties now keep their original order
+@pytest.mark.parametrize("n", [1, 5, 16, 17, 300])
+def test_top_k_rows_matches_the_baseline_sort_on_distinct_values(n):
+
+    rnd = np.random.default_rng(n)
+    df = pd.DataFrame({"sales": rnd.permutation(n), "price": rnd.permutation(n) * 1.5}, index=rnd.permutation(n))
+
+    assert top_k_rows(df, "sales", 3, ascending=False).equals(df.sort_values(by="sales", ascending=False).iloc[:3])
+    assert top_k_rows(df, "price", 3).equals(df.sort_values(by="price").iloc[:3])
+    assert top_k_rows(df, "price", 3, ascending=False).equals(df.sort_values(by="price", ascending=False).iloc[:3])
+
+
+@pytest.mark.parametrize("n", [0, 2, 17, 500])
+def test_top_k_views_matches_top_k_rows(n):
+
+    df = tied_frame(n)
+    views = {
+        "top_selling": ("sales", 3, False),
+        "highest_price": ("price", 3, False),
+        "lowest_price": ("price", 3, True),
+        "cheapest_ten": ("price", 10, True),
+    }
+    res = top_k_views(df, views)
+
+    assert list(res) == list(views)
+    for name, (column, k, ascending) in views.items():
+        assert res[name].equals(top_k_rows(df, column, k, ascending))
+
+
+def test_top_k_keeps_the_first_of_tied_values():
+
+    assert top_k([2, 1, 2, 1, 2], 2, ascending=False).tolist() == [0, 2]
+    assert top_k([2, 1, 2, 1, 2], 3).tolist() == [1, 3, 0]
@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+
+import sales_data_app as app
+from conftest import QUERIES
+from search_engine.result_cache import ResultCache
+
+
+def test_put_of_a_query_on_the_old_df_is_dropped_after_a_rebind():
+
+    old_df, new_df = pd.DataFrame({"a": [1, 2]}), pd.DataFrame({"a": [1, 2, 3]})
+    cache = ResultCache()
+    key = ("tv",)
+
+    assert cache.get(old_df, key) is None
+    assert cache.get(new_df, key) is None
+    cache.put(old_df, key, np.array([0, 1]))
+
+    assert cache.get(new_df, key) is None
+    assert len(cache) == 0
+
+
+def test_get_serves_rows_of_the_same_df_only():
+
+    df, other = pd.DataFrame({"a": [1, 2]}), pd.DataFrame({"a": [1, 2]})
+    cache = ResultCache()
+    cache.get(df, ("tv",))
+    cache.put(df, ("tv",), np.array([1]))
+
+    assert cache.get(df, ("tv",)).tolist() == [1]
+    assert cache.get(other, ("tv",)) is None
+
+
+def test_query_key_only_normalizes_case(engine):
+
+    abb = {"cooler": "cooling appliance"}
+
+    assert engine.query_key("Samsung TV", abb=abb) == engine.query_key("samsung tv", abb=abb)
+    assert engine.query_key("tv samsung", abb=abb) != engine.query_key("samsung tv", abb=abb)
+    assert engine.query_key("samsung  tv", abb=abb) != engine.query_key("samsung tv", abb=abb)
+    assert engine.query_key("samsung tv", abb=abb) != engine.query_key("samsung tv")
+
+
+# queries sharing a query_key are served from the cache with the rows a search of each of them returns
+def test_cached_results_equal_uncached_results(engine, baseline, engine_catalog, monkeypatch):
+
+    monkeypatch.setattr(app, "se", engine)
+    app.result_cache.clear()
+    hits = app.result_cache.hits
+
+    for query in QUERIES:
+        for variant in (query, query.upper(), query.title()):
+            expected = baseline.retrieve_result(engine_catalog, variant, app.abbrevations)
+            assert app.retrieve_result(engine_catalog, variant).equals(expected)
+
+    assert app.result_cache.hits - hits == 2 * len(QUERIES)
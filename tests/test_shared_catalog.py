@@ -0,0 +1,52 @@
+import pytest
+
+pytest.importorskip("fuzzywuzzy")
+
+import other_variant.ProductMatcher as matcher_module
+from conftest import CAT_ALIAS, QUERIES
+from test_matcher_updates import assert_same_as_rebuilt
+from other_variant.ProductMatcher import ProductMatcher, clean_skus
+from search_engine.shared_catalog import SharedCatalog
+
+
+def fail(*args, **kwargs):
+
+    raise AssertionError("recomputed instead of read from the shared catalog")
+
+
+def test_product_matcher_attaches_to_the_shared_catalog_artifacts(categorical_catalog, tmp_path, monkeypatch):
+
+    path = str(tmp_path / "catalog.arrow")
+    SharedCatalog.write(path, categorical_catalog, cat_alias=CAT_ALIAS, clean_sku=clean_skus(categorical_catalog["sku"]))
+    reference = ProductMatcher(categorical_catalog, cat_alias=CAT_ALIAS)
+
+    monkeypatch.setattr(matcher_module, "clean_skus", fail)
+    monkeypatch.setattr(matcher_module, "create_cat_alias", fail)
+    attached = ProductMatcher.from_shared(SharedCatalog.open(path))
+
+    assert attached.cat_alias == CAT_ALIAS
+    assert attached.current().clean_sku.tolist() == reference.current().clean_sku.tolist()
+    for query in QUERIES:
+        expected = reference.state_space_search(query, 9)
+        res = attached.state_space_search(query, 9)
+        assert res.index.tolist() == expected.index.tolist()
+        assert res["score"].tolist() == expected["score"].tolist()
+
+
+# the string columns of an attached catalog are string[pyarrow], updates must give the matcher of the
+# updated frame
+def test_upsert_rows_on_an_attached_matcher(catalog, tmp_path):
+
+    path = str(tmp_path / "catalog.arrow")
+    SharedCatalog.write(path, catalog, cat_alias=CAT_ALIAS, clean_sku=clean_skus(catalog["sku"]))
+    pm = ProductMatcher.from_shared(SharedCatalog.open(path))
+
+    rows = pm.df.iloc[[0, 5, 40]].copy()
+    rows["sales"] += 10
+    rows["sku"] = [f"{sku} pro" for sku in rows["sku"]]
+    rows.index = [0, 5, len(catalog)]
+    pm.upsert_rows(rows)
+    pm.delete_rows([3, 17])
+
+    assert pm.df.loc[5, "sku"] == catalog.loc[5, "sku"] + " pro"
+    assert_same_as_rebuilt(pm)
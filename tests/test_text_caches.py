@@ -0,0 +1,42 @@
+import pytest
+
+import sales_data_app as app
+from conftest import QUERIES
+from search_engine.search_engine import SmallSearchEngine
+
+
+def texts(df) -> list[str]:
+
+    return [*df["sku"].unique(), *df["product_line_clean"].unique(), *df["brand_lower"].unique(), *QUERIES]
+
+
+# lemmatized and raw tokens equal the baseline, also once the bounded caches evict entries
+@pytest.mark.parametrize("cache_size", [None, 2])
+def test_text_to_list_keeps_baseline_tokens(lemma_table, baseline, engine_catalog, cache_size):
+
+    engine = SmallSearchEngine(cache_size, cache_size, download_wordnet=False, lemma_table=lemma_table)
+
+    for _ in range(2):
+        for txt in texts(engine_catalog):
+            for lemmatize in (False, True):
+                expected = baseline.text_to_list(txt, lemmatize=lemmatize, abb=app.abbrevations)
+                assert engine.text_to_list(txt, lemmatize=lemmatize, abb=app.abbrevations) == expected
+
+
+def test_text_to_list_results_are_not_shared_through_the_cache(engine):
+
+    first = engine.text_to_list("samsung led tv", abb=app.abbrevations)
+    first.append("changed")
+
+    assert engine.text_to_list("samsung led tv", abb=app.abbrevations) == ["samsung", "led", "tv"]
+    assert engine.cache_info()["tokenize"]["hits"] == 1
+
+
+def test_caches_stay_bounded(lemma_table, engine_catalog):
+
+    engine = SmallSearchEngine(8, 4, download_wordnet=False, lemma_table=lemma_table)
+    for txt in texts(engine_catalog):
+        engine.text_to_list(txt)
+
+    info = engine.cache_info()
+    assert info["lemmatize"]["currsize"] == 8 and info["tokenize"]["currsize"] == 4